@@ -18,12 +18,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from documents.views import metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/auth/', include('authentication.urls', namespace='authentication')),
     path('api/users/', include('users.urls', namespace='users')),
     path('api/documents/', include('documents.urls', namespace='documents')),
+    path('metrics', metrics, name='metrics'),
 ]
 
 # Serve media files in development
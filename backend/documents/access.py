@@ -0,0 +1,88 @@
+"""
+Buffered ``last_accessed`` tracking.
+
+Document reads record their access time in memory; a background thread
+flushes the buffer every ``ACCESS_FLUSH_INTERVAL`` seconds as one
+``UPDATE ... SET last_accessed = CASE id WHEN ... END`` per batch, so a read
+never waits on a write and repeated reads of a document coalesce into one.
+"""
+import atexit
+import logging
+import threading
+
+from django.db import connection
+from django.db.models import Case, DateTimeField, Value, When
+
+from . import response_cache
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 500
+
+
+class AccessRecorder:
+    """Collects document access times and writes them in batches"""
+
+    def __init__(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def record(self, document_id, accessed_at):
+        with self._lock:
+            previous = self._pending.get(document_id)
+            if previous is None or accessed_at > previous:
+                self._pending[document_id] = accessed_at
+            if self._thread is None:
+                self._start()
+
+    def _start(self):
+        # Started lazily so each forked server worker gets its own flusher
+        self._thread = threading.Thread(target=self._run, name='access-flusher', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        interval = get_setting('ACCESS_FLUSH_INTERVAL')
+        while not self._stopped.wait(interval):
+            try:
+                self.flush()
+            finally:
+                # This thread owns its connection; don't hold it between flushes
+                connection.close()
+
+    def flush(self):
+        """Write all pending access times; returns the number of documents updated"""
+        from .models import Document
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        items = sorted(pending.items())
+        try:
+            for start in range(0, len(items), FLUSH_BATCH_SIZE):
+                batch = items[start:start + FLUSH_BATCH_SIZE]
+                Document.objects.filter(pk__in=[pk for pk, _ in batch]).update(
+                    last_accessed=Case(
+                        *[When(pk=pk, then=Value(accessed_at)) for pk, accessed_at in batch],
+                        output_field=DateTimeField(),
+                    )
+                )
+        except Exception:
+            logger.exception("Failed to flush %s document access time(s), will retry", len(items))
+            with self._lock:
+                for pk, accessed_at in items:
+                    newer = self._pending.get(pk)
+                    if newer is None or accessed_at > newer:
+                        self._pending[pk] = accessed_at
+            return 0
+        # Cached listings and details show last_accessed
+        response_cache.bump([response_cache.ACCESS_VERSION, *(response_cache.document_version(pk) for pk, _ in items)])
+        return len(items)
+
+
+recorder = AccessRecorder()
+atexit.register(recorder.flush)
@@ -0,0 +1,93 @@
+"""
+Async request handling for read-only viewset actions.
+
+A viewset using ``AsyncReadMixin`` maps some actions to coroutines in
+``async_actions``. Requests for those actions run the DRF request cycle
+(authentication, permissions, negotiation, exception handling) around the
+coroutine, which reads with Django's async ORM, so under ASGI a request
+waiting on the database or on a slow client holds no worker thread.
+Every other action is handed to the ordinary synchronous view in a thread,
+exactly as Django does for sync views under ASGI.
+
+Authentication still runs in a thread: ``JWTAuthentication`` loads the user
+with the sync ORM.
+"""
+from functools import update_wrapper
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+
+
+class AsyncReadMixin:
+    """Serve the actions named in ``async_actions`` with coroutines"""
+
+    # Action name -> name of the coroutine method serving it
+    async_actions = {}
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        sync_view = super().as_view(actions, **initkwargs)
+        handlers = {
+            method: cls.async_actions[action]
+            for method, action in (actions or {}).items()
+            if action in cls.async_actions
+        }
+        if not handlers:
+            return sync_view
+        run_sync = sync_to_async(sync_view)
+
+        async def view(request, *args, **kwargs):
+            handler = handlers.get(request.method.lower())
+            if handler is None:
+                return await run_sync(request, *args, **kwargs)
+
+            self = cls(**initkwargs)
+            self.action_map = actions
+            for method, action in actions.items():
+                setattr(self, method, getattr(self, action))
+            return await self.adispatch(request, handler, *args, **kwargs)
+
+        # Introspected by routers and schema generators, as on DRF's views
+        update_wrapper(view, cls, updated=())
+        view.cls = cls
+        view.initkwargs = initkwargs
+        view.actions = actions
+        view.csrf_exempt = True
+        return view
+
+    async def adispatch(self, request, handler, *args, **kwargs):
+        """``APIView.dispatch`` for a coroutine handler"""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+            response = await getattr(self, handler)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aget_object(self):
+        """``get_object`` with the async ORM"""
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        """``paginate_queryset`` with the async ORM; the paginator must support it"""
+        if self.paginator is None:
+            return None
+        return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
@@ -0,0 +1,581 @@
+"""
+Benchmarks for the documents app.
+
+Each benchmark returns a JSON-serialisable dict so results can be stored and
+compared across commits. Run them with ``python manage.py benchmark``.
+
+The ``serving`` and ``api`` benchmarks commit their seeded users and
+documents to the default database, which the servers and workers they drive
+must be able to read, and delete them afterwards; the command only runs them
+with ``DEBUG`` on or ``--yes``. Seeded users get emails unique to the run,
+so a run never collides with real accounts or with the leftovers of one
+that was killed.
+"""
+import http.client
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import search
+from .embeddings import chunk_hash, get_embedding_backend
+from .extraction import TextWriter
+from .ingestion import process_document
+from .models import Document, DocumentEmbedding
+from .vector_index import rebuild_index
+
+
+def _run_emails(prefix):
+    """An email factory for the users seeded by one benchmark run"""
+    run = uuid.uuid4().hex[:12]
+    return lambda name: f"{prefix}-{run}-{name}@example.com"
+
+
+def _measure(func):
+    """Run ``func`` and return its wall-clock seconds and peak traced memory"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        func()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_text_assembly(pages=2000, page_chars=4000):
+    """
+    Compare assembling extracted pages by repeated concatenation against
+    writing them through ``TextWriter`` and reading the text back with
+    ``getvalue()``, as ``ExtractionEngine._assemble`` does.
+
+    Both end with the whole document in memory, since the content field
+    stores it whole. CPython grows a string that nothing else references in
+    place, so concatenation is not quadratic here and is usually the faster
+    of the two; ``text_writer_speedup`` reports the ratio, below 1 when the
+    writer is slower.
+    """
+    page = ("lorem ipsum dolor sit amet " * (page_chars // 27 + 1))[:page_chars]
+
+    def concatenate():
+        text = ""
+        for _ in range(pages):
+            text += page + "\n\n"
+        return text
+
+    def stream():
+        with TextWriter() as writer:
+            for _ in range(pages):
+                writer.write(page)
+                writer.write("\n\n")
+            return writer.getvalue()
+
+    total_mb = pages * (page_chars + 2) / (1024 * 1024)
+    results = {'pages': pages, 'page_chars': page_chars, 'document_mb': round(total_mb, 2)}
+    for name, func in (('concatenate', concatenate), ('text_writer', stream)):
+        elapsed, peak = _measure(func)
+        results[name] = {
+            'seconds': round(elapsed, 4),
+            'mb_per_second': round(total_mb / elapsed, 2) if elapsed else None,
+            'peak_memory_mb': round(peak / (1024 * 1024), 2),
+        }
+    writer_seconds = results['text_writer']['seconds']
+    results['text_writer_speedup'] = (
+        round(results['concatenate']['seconds'] / writer_seconds, 2) if writer_seconds else None
+    )
+    return results
+
+
+def seed_documents(count, owners, batch_size=5000, seed=0, index=False):
+    """
+    Bulk-insert ``count`` documents spread over the ``owners`` users.
+
+    Rows skip ``Document.save()`` and its signals, so no files are read and
+    no search index rows are written unless ``index`` is set.
+    """
+    rng = random.Random(seed)
+    statuses = [choice for choice, _ in Document.STATUS_CHOICES]
+    file_types = ['pdf', 'docx', 'txt', 'md', 'csv']
+    now = timezone.now()
+    created = 0
+    while created < count:
+        batch = []
+        for number in range(created, min(created + batch_size, count)):
+            file_type = rng.choice(file_types)
+            accessed = rng.random() < 0.2
+            batch.append(Document(
+                title=f"Benchmark document {number}",
+                file=f"documents/benchmark-{number}.{file_type}",
+                file_size=rng.randint(1024, 10 * 1024 * 1024),
+                file_type=file_type,
+                uploaded_by=rng.choice(owners),
+                status=rng.choice(statuses),
+                last_accessed=now - timedelta(seconds=rng.randint(0, 90 * 86400)) if accessed else None,
+            ))
+        Document.objects.bulk_create(batch)
+        if index:
+            search.add_to_index(batch)
+        created += len(batch)
+    return created
+
+
+def seed_embeddings(document_ids, chunks, dimensions, batch_size=5000, seed=0):
+    """Bulk-insert ``chunks`` random unit vectors for each of ``document_ids``"""
+    rng = np.random.default_rng(seed)
+    created = 0
+    batch = []
+    for document_id in document_ids:
+        vectors = rng.standard_normal((chunks, dimensions), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        for chunk_index, vector in enumerate(vectors):
+            text = f"Benchmark chunk {chunk_index} of document {document_id}"
+            batch.append(DocumentEmbedding(
+                document_id=document_id,
+                chunk_text=text,
+                chunk_hash=chunk_hash(text),
+                embedding=vector,
+                dimensions=dimensions,
+                chunk_index=chunk_index,
+            ))
+        if len(batch) >= batch_size:
+            DocumentEmbedding.objects.bulk_create(batch)
+            created += len(batch)
+            batch = []
+    DocumentEmbedding.objects.bulk_create(batch)
+    return created + len(batch)
+
+
+def _query_plan(queryset, index_names):
+    """Return the plan, the indexes it names and whether it scans the whole table"""
+    plan = queryset.explain()
+    if connection.vendor == 'postgresql':
+        sequential = 'Seq Scan on documents_document' in plan
+    else:
+        sequential = any(
+            line.strip().endswith('SCAN documents_document') for line in plan.splitlines()
+        )
+    return {
+        'plan': plan,
+        'indexes': sorted(name for name in index_names if name in plan),
+        'sequential_scan': sequential,
+    }
+
+
+def bench_document_indexes(documents=1000000, owners=100, batch_size=5000, repeat=5, keep=0):
+    """
+    Seed documents and record the query plan and latency of each
+    ``DocumentViewSet`` listing query.
+
+    Everything runs in a transaction that is rolled back unless ``keep=1``.
+    """
+    User = get_user_model()
+    index_names = [index.name for index in Document._meta.indexes]
+    columns = ['id', 'title', 'description', 'created_at', 'updated_at', 'last_accessed',
+               'status', 'file_size', 'file_type', 'uploaded_by__email']
+    results = {'documents': documents, 'owners': owners, 'vendor': connection.vendor, 'queries': {}}
+    email = _run_emails('benchmark')
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            User(email=email(number), role='editor') for number in range(owners)
+        )
+        started = time.perf_counter()
+        seed_documents(documents, users, batch_size=batch_size)
+        results['seed_seconds'] = round(time.perf_counter() - started, 2)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+        base = Document.objects.select_related('uploaded_by').only(*columns)
+        owner = users[0]
+        queries = {
+            'list': base.order_by('-created_at'),
+            'editor_list': base.filter(uploaded_by=owner).order_by('-created_at'),
+            'status_filter': base.filter(status='failed').order_by('-created_at'),
+            'recent': base.filter(last_accessed__isnull=False).order_by('-last_accessed'),
+            'editor_recent': base.filter(uploaded_by=owner, last_accessed__isnull=False).order_by('-last_accessed'),
+        }
+        for name, queryset in queries.items():
+            page = queryset[:10]
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(page)
+                timings.append(time.perf_counter() - started)
+            results['queries'][name] = {
+                'median_ms': round(statistics.median(timings) * 1000, 3),
+                **_query_plan(page, index_names),
+            }
+
+        if not keep:
+            transaction.set_rollback(True)
+    return results
+
+
+SERVERS = {
+    'wsgi': ['document_management_system.wsgi:application'],
+    'asgi': ['document_management_system.asgi:application', '-k', 'uvicorn.workers.UvicornWorker'],
+}
+
+
+def _percentiles(timings):
+    cuts = statistics.quantiles(timings, n=100) if len(timings) > 1 else timings * 99
+    return {
+        'p50_ms': round(cuts[49] * 1000, 2),
+        'p95_ms': round(cuts[94] * 1000, 2),
+        'p99_ms': round(cuts[98] * 1000, 2),
+    }
+
+
+def _start_server(server, port, workers):
+    """Start gunicorn serving ``server`` and wait until it answers"""
+    command = [
+        sys.executable, '-m', 'gunicorn', *SERVERS[server],
+        '--bind', f'127.0.0.1:{port}', '--workers', str(workers), '--log-level', 'warning',
+    ]
+    process = subprocess.Popen(command, cwd=settings.BASE_DIR, env=os.environ.copy())
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            client = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            client.request('GET', '/admin/login/')
+            client.getresponse().read()
+            client.close()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"The {server} server did not start on port {port}")
+
+
+def _drive(port, paths, token, concurrency):
+    """Request every path with ``concurrency`` concurrent clients; returns the results"""
+    headers = {'Authorization': f'Bearer {token}'}
+
+    def fetch(path):
+        started = time.perf_counter()
+        client = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        try:
+            client.request('GET', path, headers=headers)
+            response = client.getresponse()
+            response.read()
+            ok = response.status == 200
+        except OSError:
+            ok = False
+        finally:
+            client.close()
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(fetch, paths))
+    elapsed = time.perf_counter() - started
+
+    timings = [seconds for ok, seconds in outcomes if ok]
+    return {
+        'requests': len(paths),
+        'errors': len(paths) - len(timings),
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(len(paths) / elapsed, 1),
+        **(_percentiles(timings) if timings else {}),
+    }
+
+
+def bench_serving(documents=1000, requests=2000, concurrency=100, workers=4, port=8765, seed=0):
+    """
+    Load-test the async read endpoints under uvicorn workers (ASGI) against
+    the same endpoints under gunicorn's sync workers (WSGI).
+
+    Seeded documents are committed so the servers can read them, and
+    deleted again afterwards. Each server gets the same mix of list, detail,
+    recent and embeddings requests from ``concurrency`` clients.
+    """
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    User = get_user_model()
+    rng = random.Random(seed)
+    user = User.objects.create_user(email=_run_emails('benchmark-serving')('viewer'), role='viewer')
+    try:
+        seed_documents(documents, [user])
+        ids = list(Document.objects.filter(uploaded_by=user).values_list('id', flat=True))
+        pages = max(1, documents // 10)
+        templates = [
+            '/api/documents/?page={page}',
+            '/api/documents/{id}/',
+            '/api/documents/recent/',
+            '/api/documents/{id}/embeddings/',
+        ]
+        paths = [
+            rng.choice(templates).format(page=rng.randint(1, pages), id=rng.choice(ids))
+            for _ in range(requests)
+        ]
+        token = str(AccessToken.for_user(user))
+
+        results = {
+            'documents': documents, 'requests': requests, 'concurrency': concurrency,
+            'workers': workers, 'vendor': connection.vendor, 'servers': {},
+        }
+        for server in SERVERS:
+            process = _start_server(server, port, workers)
+            try:
+                results['servers'][server] = _drive(port, paths, token, concurrency)
+            finally:
+                process.terminate()
+                process.wait()
+        return results
+    finally:
+        Document.objects.filter(uploaded_by=user).delete()
+        user.delete()
+
+
+WORDS = (
+    'contract', 'invoice', 'quarterly', 'report', 'budget', 'forecast', 'policy', 'audit',
+    'revenue', 'supplier', 'compliance', 'meeting', 'minutes', 'proposal', 'roadmap', 'release',
+    'customer', 'support', 'incident', 'review', 'security', 'training', 'onboarding', 'payroll',
+    'warehouse', 'shipment', 'inventory', 'marketing', 'campaign', 'research', 'summary', 'draft',
+)
+
+
+def _synthetic_text(rng, size):
+    """About ``size`` characters of words from ``WORDS``"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+
+@contextmanager
+def _peak_memory(peaks, phase):
+    """Record the most memory traced while the block runs as ``peaks[phase]``, in MB; needs tracemalloc started"""
+    tracemalloc.reset_peak()
+    yield
+    _, peak = tracemalloc.get_traced_memory()
+    peaks[phase] = round(peak / (1024 * 1024), 1)
+
+
+def _revision():
+    """The checked-out commit, so results can be told apart"""
+    try:
+        result = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+
+def _latency(timings, queries, unit='request'):
+    return {
+        **_percentiles(timings),
+        f'queries_per_{unit}': round(statistics.mean(queries), 2),
+        'max_queries': max(queries),
+    }
+
+
+def _time_requests(client, requests):
+    """
+    Send ``(method, path, data)`` requests through ``client`` one after
+    another; returns their latency, throughput and query counts, and the
+    responses.
+    """
+    timings, queries, responses = [], [], []
+    started = time.perf_counter()
+    for method, path, data in requests:
+        with CaptureQueriesContext(connection) as captured:
+            request_started = time.perf_counter()
+            response = getattr(client, method)(path, data)
+            timings.append(time.perf_counter() - request_started)
+        queries.append(len(captured))
+        responses.append(response)
+    elapsed = time.perf_counter() - started
+    return {
+        'requests': len(responses),
+        'errors': sum(response.status_code >= 400 for response in responses),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(responses) / elapsed, 1),
+        **_latency(timings, queries),
+    }, responses
+
+
+def _time_ingestion(document_ids):
+    """Run ``process_document`` on each document; returns its latency, throughput and query counts"""
+    timings, queries = [], []
+    started = time.perf_counter()
+    for document_id in document_ids:
+        with CaptureQueriesContext(connection) as captured:
+            document_started = time.perf_counter()
+            process_document(document_id)
+            timings.append(time.perf_counter() - document_started)
+        queries.append(len(captured))
+    elapsed = time.perf_counter() - started
+
+    sizes = Document.objects.filter(pk__in=document_ids).values_list('file_size', flat=True)
+    megabytes = sum(sizes) / (1024 * 1024)
+    chunks = DocumentEmbedding.objects.filter(document_id__in=document_ids).count()
+    return {
+        'documents': len(document_ids),
+        'chunks': chunks,
+        'seconds': round(elapsed, 3),
+        'documents_per_second': round(len(document_ids) / elapsed, 2),
+        'mb_per_second': round(megabytes / elapsed, 3),
+        'chunks_per_second': round(chunks / elapsed, 1),
+        **_latency(timings, queries, unit='document'),
+    }
+
+
+def bench_api(documents=10000, owners=100, embedded=10000, chunks=4, requests=200, ingest=20,
+              file_kb=32, seed=0):
+    """
+    Seed users, documents and embeddings, then drive the API endpoints and
+    ingestion in-process and record their latency, queries and throughput.
+
+    ``documents`` sets the scale (10000, 100000, 1000000, ...); the first
+    ``embedded`` of them get ``chunks`` random embeddings each and the
+    vector index is built over them. Each read endpoint then gets
+    ``requests`` requests through the test client with a real JWT, as an
+    admin seeing every document or as an editor seeing their own, and
+    ``requests`` files of ``file_kb`` KB are uploaded. ``ingest`` of the
+    uploads are then processed with ``process_document``, as the ingestion
+    worker would.
+
+    Seeded rows are committed, as they would be when serving, and deleted
+    again afterwards. Uploads and the vector index go to temporary
+    directories. Reads go through the response cache as configured, so
+    repeated reads are only cached with a shared cache backend.
+
+    ``peak_memory_mb`` is the most memory allocated through Python, as
+    traced by ``tracemalloc``, during each of the seeding, request and
+    ingestion phases. Extraction runs in the engine's worker processes and
+    is not included. Tracing slows allocation, so latencies are somewhat
+    higher than untraced.
+    """
+    from rest_framework.test import APIClient
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    User = get_user_model()
+    rng = random.Random(seed)
+    media_root = tempfile.mkdtemp(prefix='benchmark-media-')
+    index_dir = tempfile.mkdtemp(prefix='benchmark-index-')
+    results = {
+        'revision': _revision(), 'vendor': connection.vendor, 'documents': documents, 'owners': owners,
+        'embedded': min(embedded, documents), 'chunks': chunks, 'requests': requests,
+        'peak_memory_mb': {}, 'endpoints': {},
+    }
+    isolated = override_settings(
+        MEDIA_ROOT=media_root,
+        ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+        DOCUMENTS={**settings.DOCUMENTS, 'VECTOR_INDEX_DIR': index_dir},
+    )
+    isolated.enable()
+    tracemalloc.start()
+    peaks = results['peak_memory_mb']
+    email = _run_emails('benchmark-api')
+    users = []
+    try:
+        users = User.objects.bulk_create(
+            [User(email=email(number), role='editor') for number in range(owners)]
+            + [User(email=email('admin'), role='admin')]
+        )
+        editors, admin = users[:-1], users[-1]
+        editor = editors[0]
+
+        with _peak_memory(peaks, 'seeding'):
+            started = time.perf_counter()
+            seed_documents(documents, editors, seed=seed, index=True)
+            document_ids = list(
+                Document.objects.filter(uploaded_by__in=editors).order_by('id').values_list('id', flat=True)
+            )
+            embedding_count = seed_embeddings(
+                document_ids[:embedded], chunks, get_embedding_backend().dimensions, seed=seed
+            )
+            results['seed_seconds'] = round(time.perf_counter() - started, 2)
+            if embedding_count:
+                started = time.perf_counter()
+                rebuild_index()
+                results['vector_index_build_seconds'] = round(time.perf_counter() - started, 2)
+
+        clients = {}
+        for user in (admin, editor):
+            clients[user] = APIClient()
+            clients[user].credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        pages = max(1, documents // 10)
+        list_url = reverse('documents:document-list')
+        scenarios = {
+            'list': (admin, lambda: ('get', list_url, {'page': rng.randint(1, pages)})),
+            'list_cursor': (admin, lambda: ('get', list_url, {'pagination': 'cursor'})),
+            'editor_list': (editor, lambda: ('get', list_url, {})),
+            'detail': (admin, lambda: (
+                'get', reverse('documents:document-detail', args=[rng.choice(document_ids)]), {}
+            )),
+            'recent': (admin, lambda: ('get', reverse('documents:document-recent'), {})),
+            'search': (admin, lambda: (
+                'get', reverse('documents:document-search'), {'q': f"document {rng.randrange(documents)}"}
+            )),
+            'semantic_search': (admin, lambda: (
+                'get', reverse('documents:document-semantic-search'), {'q': _synthetic_text(rng, 40)}
+            )),
+            'stats': (admin, lambda: ('get', reverse('documents:document-stats'), {})),
+            'upload': (editor, lambda: ('post', reverse('documents:document-upload-document'), {
+                'file': SimpleUploadedFile(
+                    f"upload-{rng.getrandbits(64):x}.txt",
+                    _synthetic_text(rng, file_kb * 1024).encode(),
+                    content_type='text/plain',
+                ),
+            })),
+        }
+        uploaded = []
+        with _peak_memory(peaks, 'requests'):
+            for name, (user, build) in scenarios.items():
+                results['endpoints'][name], responses = _time_requests(
+                    clients[user], (build() for _ in range(requests))
+                )
+                if name == 'upload':
+                    uploaded = [response.data['id'] for response in responses if response.status_code == 201]
+            # So the responses held don't count towards the ingestion peak
+            del responses
+
+        with _peak_memory(peaks, 'ingestion'):
+            results['ingestion'] = _time_ingestion(uploaded[:ingest])
+        return results
+    finally:
+        tracemalloc.stop()
+        Document.objects.filter(uploaded_by__in=users).delete()
+        User.objects.filter(pk__in=[user.pk for user in users]).delete()
+        isolated.disable()
+        shutil.rmtree(media_root, ignore_errors=True)
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'text-assembly': bench_text_assembly,
+    'indexes': bench_document_indexes,
+    'serving': bench_serving,
+    'api': bench_api,
+}
+
+# Benchmarks that commit seeded rows to the default database while they run
+COMMITTING_BENCHMARKS = {'serving', 'api'}
@@ -0,0 +1,74 @@
+"""
+Content-addressed file storage.
+
+Every stored file is recorded in ``StoredFile`` under the SHA-256 of its
+bytes, and documents point at it through ``Document.content_hash``. A file
+whose bytes are already stored is not written again; the existing copy
+gains a reference instead. Deleting a document drops its reference and the
+file is removed from storage with the last one.
+"""
+import hashlib
+
+from django.core.files.storage import default_storage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import StoredFile
+
+
+def file_sha256(file):
+    """Hash a file in chunks"""
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def acquire(document):
+    """
+    Point ``document`` at the stored copy of its new file.
+
+    An uncommitted file is hashed and written only if its bytes are new. A
+    file that is already written (a completed chunked upload) must have its
+    ``content_hash`` set; it is deleted again if an identical copy exists.
+    Call inside a transaction, before the document is saved.
+    """
+    file = document.file
+    if not file._committed:
+        document.content_hash = file_sha256(file)
+
+    stored = StoredFile.objects.select_for_update().filter(pk=document.content_hash).first()
+    if stored is None:
+        if not file._committed:
+            file.save(file.name, file.file, save=False)
+        try:
+            with transaction.atomic():
+                StoredFile.objects.create(
+                    sha256=document.content_hash, name=file.name, size=document.file_size, ref_count=1,
+                )
+            return
+        except IntegrityError:
+            # A concurrent upload stored the same bytes first
+            stored = StoredFile.objects.select_for_update().get(pk=document.content_hash)
+
+    if file._committed and file.name != stored.name:
+        duplicate = file.name
+        transaction.on_commit(lambda: default_storage.delete(duplicate))
+    document.file = stored.name
+    StoredFile.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') + 1)
+
+
+def release(content_hash):
+    """Drop a reference to a stored file, deleting the file with the last one"""
+    if not content_hash:
+        return
+    with transaction.atomic():
+        stored = StoredFile.objects.select_for_update().filter(pk=content_hash).first()
+        if stored is None:
+            return
+        if stored.ref_count > 1:
+            StoredFile.objects.filter(pk=stored.pk).update(ref_count=F('ref_count') - 1)
+            return
+        stored.delete()
+        name = stored.name
+        transaction.on_commit(lambda: default_storage.delete(name))
@@ -0,0 +1,55 @@
+"""
+Bulk document operations.
+
+Each operation touches many documents with a fixed number of statements
+instead of one request and one save per document: uploads are inserted
+with ``bulk_create``, status changes with a single ``UPDATE``, and the
+signal handlers that ``bulk_create`` and ``update`` skip (search index,
+response cache, status events) are run once for the whole set.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import blobs, events, response_cache, search
+from .models import Document
+from .queue import enqueue_ingestion_many
+
+
+def upload_documents(files, uploaded_by, description='', ingest=False):
+    """
+    Create a document for each uploaded file in one transaction, optionally
+    queueing all of them for ingestion. Returns the created documents.
+    """
+    documents = [
+        Document(
+            title=file.name,
+            description=description,
+            file=file,
+            file_size=file.size,
+            file_type=Document._extension(file.name),
+            uploaded_by=uploaded_by,
+        )
+        for file in files
+    ]
+    with transaction.atomic():
+        for document in documents:
+            # Writes the file, or points at the stored copy of the same bytes
+            blobs.acquire(document)
+        Document.objects.bulk_create(documents)
+        search.add_to_index(documents)
+        response_cache.invalidate()
+        if ingest:
+            enqueue_ingestion_many([document.pk for document in documents])
+            for document in documents:
+                document.status = 'processing'
+    return documents
+
+
+def set_documents_status(queryset, status):
+    """Set the status of every document in ``queryset``; returns their ids"""
+    with transaction.atomic():
+        document_ids = list(queryset.select_for_update().values_list('id', flat=True))
+        Document.objects.filter(pk__in=document_ids).update(status=status, updated_at=timezone.now())
+        response_cache.invalidate(document_ids)
+        events.publish_statuses(document_ids, status)
+    return document_ids
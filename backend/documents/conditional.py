@@ -0,0 +1,80 @@
+"""
+HTTP validators for document reads.
+
+``list`` and ``recent`` responses are tagged from one aggregate over the
+documents the listing selects (how many there are, the sum of their ids,
+and the latest ``updated_at`` and ``last_accessed``), and ``retrieve``
+responses from the document's ``updated_at``. Every write moves
+``updated_at`` to now and every delete changes the count or the ids, so a
+listing's tag changes whenever any row it could show does; a request whose
+``If-None-Match`` still matches is answered with ``304`` after that single
+query, before the page is fetched, counted or serialized. Cursor pages
+aggregate over their own window rather than the whole listing, so they
+still issue no table-wide ``COUNT``.
+
+The aggregate is one query more than a full ``200`` response needs; it is
+paid so that the common revalidation costs one query instead of two.
+
+The tags are weak: they stand for the data, not for the rendered bytes.
+Listings carry no ``Last-Modified``, because deleting a row does not move
+the latest ``updated_at`` and a client validating by date alone would keep
+the deleted row.
+"""
+import hashlib
+
+from django.db.models import Count, Max, Sum
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+# Validated responses are private to the user and must be revalidated before reuse
+CACHE_CONTROL = 'private, no-cache'
+
+
+def _timestamp(value):
+    return value.timestamp() if value is not None else ''
+
+
+def _weak_etag(*parts):
+    digest = hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest}"'
+
+
+# What a listing's tag is computed from, aggregated over the whole listing
+LISTING_SUMMARY = {
+    'count': Count('pk'), 'ids': Sum('pk'), 'updated': Max('updated_at'), 'accessed': Max('last_accessed'),
+}
+
+
+def _listing_etag(request, summary):
+    return _weak_etag(
+        request.accepted_renderer.format, request.get_full_path(),
+        summary['count'], summary['ids'], _timestamp(summary['updated']), _timestamp(summary['accessed']),
+    )
+
+
+def listing_etag(request, queryset):
+    """ETag for a listing of ``queryset``, from one aggregate query"""
+    return _listing_etag(request, queryset.aggregate(**LISTING_SUMMARY))
+
+
+async def alisting_etag(request, queryset):
+    return _listing_etag(request, await queryset.aaggregate(**LISTING_SUMMARY))
+
+
+def document_validators(request, document):
+    """``(etag, last_modified)`` for a document's detail response"""
+    # last_accessed is left out: every retrieve moves it
+    etag = _weak_etag(request.accepted_renderer.format, document.pk, _timestamp(document.updated_at))
+    return etag, int(document.updated_at.timestamp())
+
+
+def not_modified(request, etag, last_modified=None):
+    """The ``304`` (or ``412``) answer to a conditional request, or ``None`` to send the resource"""
+    return get_conditional_response(request, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = CACHE_CONTROL
@@ -0,0 +1,62 @@
+import os
+
+from django.conf import settings
+
+
+DEFAULTS = {
+    # Ingestion queue
+    'INGESTION_WORKER_CONCURRENCY': 2,
+    'INGESTION_POLL_INTERVAL': 2,  # seconds
+    'INGESTION_MAX_ATTEMPTS': 3,
+    'INGESTION_RETRY_BACKOFF': 30,  # seconds, doubled on every retry
+    'INGESTION_STALE_AFTER': 15 * 60,  # seconds
+    # Text extraction
+    'EXTRACTION_WORKERS': None,  # defaults to the number of CPUs
+    'EXTRACTION_TIMEOUT': 300,  # seconds per file
+    'EXTRACTION_MEMORY_LIMIT_MB': 1024,  # per extraction process
+    'EXTRACTION_PDF_PAGES_PER_TASK': 25,
+    'EXTRACTORS': {},  # MIME type -> dotted path of an extractor, see documents.extractors
+    # Chunking and embeddings
+    'CHUNK_TOKENS': 200,
+    'CHUNK_OVERLAP': 40,
+    'EMBEDDING_BACKEND': 'documents.embeddings.HashingEmbeddingBackend',
+    'EMBEDDING_OPTIONS': {'dimensions': 384},
+    'EMBEDDING_BATCH_SIZE': 256,
+    # Vector index
+    'VECTOR_INDEX_DIR': os.path.join(settings.BASE_DIR, 'vector_index'),
+    'VECTOR_INDEX_NPROBE': 8,  # clusters scanned per query
+    'VECTOR_INDEX_DELTA_LIMIT': 50000,  # vectors added, or removed, before the ingestion worker rebuilds
+    # Access tracking
+    'ACCESS_FLUSH_INTERVAL': 10,  # seconds between last_accessed flushes
+    # Chunked uploads
+    'UPLOAD_DIR': 'uploads',  # storage prefix for parts of unfinished uploads
+    'UPLOAD_MAX_SIZE': 1024 * 1024 * 1024,  # bytes per file
+    'UPLOAD_PART_MAX_SIZE': 64 * 1024 * 1024,  # bytes per append request
+    'UPLOAD_SESSION_TTL': 24 * 60 * 60,  # seconds before an idle upload is purged
+    # Downloads
+    'DOWNLOAD_SENDFILE_HEADER': None,  # 'X-Accel-Redirect' (nginx) or 'X-Sendfile' (Apache)
+    'DOWNLOAD_ACCEL_REDIRECT_PREFIX': '/protected-media/',  # internal nginx location for MEDIA_ROOT
+    # Response cache
+    'RESPONSE_CACHE_ALIAS': 'default',  # entry in CACHES
+    # seconds; 0 disables the cache, None caches for 300 only if RESPONSE_CACHE_ALIAS is shared by every process
+    'RESPONSE_CACHE_TIMEOUT': None,
+    # Bulk operations
+    'BULK_MAX_DOCUMENTS': 1000,  # ids per bulk delete, ingest or status change
+    'BULK_MAX_FILES': 100,  # files per bulk upload
+    # Statistics
+    'STATS_GLOBAL_SHARDS': 16,  # rows per global counter, so writers by different owners rarely share one
+    # Ingestion event streams
+    'EVENTS_HEARTBEAT_INTERVAL': 15,  # seconds between keep-alive comments on an idle stream
+    'EVENTS_POLL_INTERVAL': 2,  # seconds between status polls on databases without LISTEN/NOTIFY
+    'EVENTS_TICKET_MAX_AGE': 60,  # seconds a ticket for opening an event stream stays valid
+    # Metrics
+    'METRICS_ENABLED': False,  # time requests, queries and stages and serve them at /metrics
+    'METRICS_DIR': None,  # directory shared by every web and ingestion process, to report them together
+    'METRICS_FLUSH_INTERVAL': 15,  # seconds between writes of a process's metrics to METRICS_DIR
+    'METRICS_TOKEN': None,  # bearer token scrapers must send, if set
+}
+
+
+def get_setting(name):
+    """Return a documents setting, falling back to its default"""
+    return getattr(settings, 'DOCUMENTS', {}).get(name, DEFAULTS[name])
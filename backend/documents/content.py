@@ -0,0 +1,141 @@
+"""
+Sliced access to extracted document content.
+
+Ingestion stores a small index next to the content: its length, the offset
+at which each PDF page starts and the offset of every ``LINE_STEP``-th
+line. A slice by characters, lines or pages is resolved against the index
+and streamed from the database with ``SUBSTR``, one ``READ_CHUNK`` at a
+time, so the full text is never loaded into memory. Offsets count
+characters, which is what the database's ``SUBSTR`` counts.
+"""
+from django.db.models.functions import Substr
+
+from .models import Document
+
+LINE_STEP = 1000
+READ_CHUNK = 256 * 1024
+
+
+class InvalidSlice(ValueError):
+    """The requested slice lies outside the content"""
+
+
+def build_content_index(text, page_offsets=()):
+    """Return the content index stored in ``Document.content_index``"""
+    lines = [0]
+    count = 0
+    position = text.find('\n')
+    while position != -1:
+        count += 1
+        if count % LINE_STEP == 0:
+            lines.append(position + 1)
+        position = text.find('\n', position + 1)
+    return {
+        'length': len(text),
+        'line_count': count + 1 if text and not text.endswith('\n') else count,
+        'line_step': LINE_STEP,
+        'lines': lines,
+        'pages': list(page_offsets),
+    }
+
+
+def parse_span(value):
+    """Parse ``"a-b"`` or ``"a-"`` into ``(a, b)`` / ``(a, None)``"""
+    first, sep, last = value.partition('-')
+    if not sep or not first.isdigit() or (last and not last.isdigit()):
+        raise ValueError(f"Invalid range '{value}', expected START-END or START-")
+    first, last = int(first), int(last) if last else None
+    if last is not None and last < first:
+        raise ValueError(f"Invalid range '{value}', END is before START")
+    return first, last
+
+
+def slice_content(document_id, index, unit=None, first=0, last=None):
+    """
+    Return an iterator over a slice of a document's content. ``unit`` is
+    ``'chars'`` (0-based), ``'lines'`` or ``'pages'`` (1-based), or ``None``
+    for everything; both ends are inclusive.
+    """
+    if unit == 'lines':
+        return iter_lines(document_id, index, first, last)
+    if unit == 'pages':
+        start, stop = page_range(index, first, last)
+    elif unit == 'chars':
+        start, stop = char_range(index, first, last)
+    else:
+        start, stop = 0, index.get('length', 0)
+    return iter_content(document_id, start, stop)
+
+
+def iter_content(document_id, start, stop):
+    """Yield ``content[start:stop]`` in chunks read with SUBSTR"""
+    position = start
+    while position < stop:
+        length = min(READ_CHUNK, stop - position)
+        chunk = (
+            Document.objects.filter(pk=document_id)
+            .annotate(chunk=Substr('content', position + 1, length))
+            .values_list('chunk', flat=True)
+            .get()
+        ) or ''
+        if not chunk:
+            return
+        yield chunk
+        position += len(chunk)
+
+
+def char_range(index, first, last=None):
+    """Characters ``first`` to ``last`` (0-based, inclusive) as ``(start, stop)``"""
+    length = index.get('length', 0)
+    if first >= length:
+        raise InvalidSlice(f"Content has {length} characters")
+    stop = length if last is None else min(last + 1, length)
+    return first, stop
+
+
+def page_range(index, first, last=None):
+    """Pages ``first`` to ``last`` (1-based, inclusive) as ``(start, stop)`` characters"""
+    # Content without page breaks is a single page
+    pages = index.get('pages') or [0]
+    if first < 1 or first > len(pages):
+        raise InvalidSlice(f"Content has {len(pages)} page(s)")
+    start = pages[first - 1]
+    stop = index.get('length', 0) if last is None or last >= len(pages) else pages[last]
+    return start, stop
+
+
+def iter_lines(document_id, index, first, last=None):
+    """Yield lines ``first`` to ``last`` (1-based, inclusive)"""
+    if first < 1 or first > index.get('line_count', 0):
+        raise InvalidSlice(f"Content has {index.get('line_count', 0)} line(s)")
+    return _iter_lines(document_id, index, first - 1, None if last is None else last - 1)
+
+
+def _iter_lines(document_id, index, first, last):
+    # Start from the nearest indexed line at or before the first one wanted
+    checkpoint = min(first // index['line_step'], len(index['lines']) - 1)
+    line = checkpoint * index['line_step']
+    for chunk in iter_content(document_id, index['lines'][checkpoint], index['length']):
+        i = 0
+        while line < first:
+            newline = chunk.find('\n', i)
+            if newline == -1:
+                i = len(chunk)
+                break
+            line += 1
+            i = newline + 1
+        if line < first:
+            continue
+
+        start = i
+        while i < len(chunk) and (last is None or line <= last):
+            newline = chunk.find('\n', i)
+            if newline == -1:
+                i = len(chunk)
+                break
+            line += 1
+            i = newline + 1
+        if i > start:
+            yield chunk[start:i]
+        if last is not None and line > last:
+            return
@@ -0,0 +1,156 @@
+"""
+Access-controlled file downloads.
+
+Conditional requests are answered from the document row (``ETag`` from the
+content hash, ``Last-Modified`` from ``updated_at``) before the file is
+opened. The bytes are then either handed to the front-end server with
+``X-Accel-Redirect``/``X-Sendfile`` (``DOWNLOAD_SENDFILE_HEADER``) or
+streamed by ``FileResponse``, which WSGI servers such as gunicorn send with
+``os.sendfile``. A single byte range is answered with ``206 Partial
+Content``; multiple ranges get the whole file.
+"""
+import hashlib
+import mimetypes
+import re
+from urllib.parse import quote
+
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe, quote_etag
+
+from .conf import get_setting
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(Exception):
+    """The requested range lies outside the file"""
+
+
+class FileRange:
+    """Reads at most ``length`` bytes of an open file from its current position"""
+
+    # No name, so FileResponse leaves Content-Length to the caller
+    name = ''
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        # Lets the WSGI server sendfile() from the file's current offset
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def document_etag(document):
+    """Strong ETag for the document's file"""
+    tag = document.content_hash or hashlib.sha1(document.file.name.encode('utf-8')).hexdigest()
+    return quote_etag(tag)
+
+
+def download_name(document):
+    """File name offered to the browser"""
+    name = document.title or 'document'
+    suffix = f'.{document.file_type}' if document.file_type else ''
+    return name if not suffix or name.lower().endswith(suffix) else name + suffix
+
+
+def parse_range(header, size):
+    """
+    Return the inclusive ``(start, end)`` of a single-range ``Range`` header,
+    or ``None`` if the whole file should be sent.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    elif last:
+        length = int(last)
+        if not length:
+            raise RangeNotSatisfiable
+        start, end = max(size - length, 0), size - 1
+    else:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable
+    return start, end
+
+
+def _range_applies(request, etag, last_modified):
+    """An If-Range validator that no longer matches means the whole file is wanted"""
+    if_range = request.headers.get('If-Range')
+    if not if_range:
+        return True
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def serve_document(request, document):
+    """Build the download response for ``document``"""
+    etag = document_etag(document)
+    last_modified = int(document.updated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        header = get_setting('DOWNLOAD_SENDFILE_HEADER')
+        response = _offload(document, header) if header else _stream(request, document, etag, last_modified)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Access controlled, so never shared, but always revalidated
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _offload(document, header):
+    """Let the front-end server send the file, including any Range handling"""
+    content_type, _ = mimetypes.guess_type(download_name(document))
+    response = HttpResponse(content_type=content_type or 'application/octet-stream')
+    if header.lower() == 'x-accel-redirect':
+        response[header] = get_setting('DOWNLOAD_ACCEL_REDIRECT_PREFIX') + quote(document.file.name)
+    else:
+        response[header] = document.file.path
+    response['Content-Disposition'] = content_disposition_header(True, download_name(document))
+    return response
+
+
+def _stream(request, document, etag, last_modified):
+    size = document.file_size or document.file.size
+    requested = request.headers.get('Range')
+    byte_range = None
+    if requested and _range_applies(request, etag, last_modified):
+        try:
+            byte_range = parse_range(requested, size)
+        except RangeNotSatisfiable:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    file = document.file.storage.open(document.file.name, 'rb')
+    if byte_range is None:
+        response = FileResponse(file, as_attachment=True, filename=download_name(document))
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(
+            FileRange(file, end - start + 1), as_attachment=True, filename=download_name(document), status=206,
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,217 @@
+"""
+Chunking and embedding of extracted document content.
+
+Content is split into overlapping windows of whitespace-delimited tokens and
+embedded in batches by a pluggable backend. The default backend is a
+deterministic hashing vectorizer that needs no model download or network.
+"""
+import hashlib
+import re
+import threading
+import zlib
+
+import numpy as np
+from django.utils.module_loading import import_string
+
+from . import response_cache, vector_index
+from .conf import get_setting
+from .models import DocumentEmbedding
+
+TOKEN_RE = re.compile(r'\S+')
+WORD_RE = re.compile(r'\w+')
+
+
+def chunk_text(text, window=200, overlap=40):
+    """
+    Yield ``(chunk_index, chunk_text)`` for overlapping token windows.
+
+    Consecutive chunks share ``overlap`` tokens. Only the token offsets of the
+    current window are kept, so memory does not grow with the text.
+    """
+    if overlap >= window:
+        raise ValueError("Chunk overlap must be smaller than the chunk window")
+    step = window - overlap
+    spans = []
+    index = 0
+    emitted_until = 0
+    for match in TOKEN_RE.finditer(text):
+        spans.append(match.span())
+        if len(spans) == window:
+            yield index, text[spans[0][0]:spans[-1][1]]
+            index += 1
+            emitted_until = spans[-1][1]
+            del spans[:step]
+    if spans and spans[-1][1] > emitted_until:
+        yield index, text[spans[0][0]:spans[-1][1]]
+
+
+class EmbeddingBackend:
+    """Base class for embedding backends"""
+
+    dimensions = None
+
+    def embed(self, texts):
+        """Return a ``(len(texts), dimensions)`` float32 array"""
+        raise NotImplementedError
+
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """
+    Signed feature-hashing vectorizer.
+
+    Each lower-cased word is hashed to a column and a sign; rows are
+    L2-normalised so a dot product is a cosine similarity.
+    """
+
+    def __init__(self, dimensions=384):
+        self.dimensions = dimensions
+
+    def embed(self, texts):
+        rows, columns, signs = [], [], []
+        hashes = {}
+        for row, text in enumerate(texts):
+            for word in WORD_RE.findall(text.lower()):
+                value = hashes.get(word)
+                if value is None:
+                    value = hashes[word] = zlib.crc32(word.encode('utf-8'))
+                rows.append(row)
+                columns.append(value % self.dimensions)
+                signs.append(1.0 if value & 0x80000000 else -1.0)
+
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        np.add.at(vectors, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), signs)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_embedding_backend():
+    """Return the configured embedding backend, instantiated once per process"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            backend_class = import_string(get_setting('EMBEDDING_BACKEND'))
+            _backend = backend_class(**get_setting('EMBEDDING_OPTIONS'))
+        return _backend
+
+
+def chunk_hash(text):
+    """Hash identifying a chunk's text, so unchanged chunks keep their vectors"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _delete_embeddings(queryset):
+    """Delete embedding rows without loading their text and vectors, and drop them from the index"""
+    # The caller expires the document's responses once, not a signal per row
+    ids = list(queryset.values_list('id', flat=True))
+    DocumentEmbedding.objects.filter(pk__in=ids).only('id', 'document_id').delete()
+    vector_index.forget(embedding_ids=ids)
+
+
+def embed_document(document, progress=None):
+    """
+    Chunk ``document.content`` and bring its stored embeddings in line with
+    the chunks. A chunk whose text already has a row keeps that row and its
+    vector; only new or changed chunks are embedded, in batches, and rows
+    matching no chunk are deleted in one statement.
+    ``progress(chunks_done, chunk_count)`` is called after each batch.
+
+    Returns the created ``DocumentEmbedding`` rows.
+    """
+    backend = get_embedding_backend()
+    batch_size = get_setting('EMBEDDING_BATCH_SIZE')
+    chunks = chunk_text(
+        document.content or '',
+        window=get_setting('CHUNK_TOKENS'),
+        overlap=get_setting('CHUNK_OVERLAP'),
+    )
+
+    # Rows embedded by another backend can't be kept
+    existing = {}
+    stale = set()
+    for row in document.embeddings.order_by('chunk_index').only('id', 'chunk_index', 'chunk_hash', 'dimensions'):
+        if row.chunk_hash and row.dimensions == backend.dimensions:
+            existing.setdefault(row.chunk_hash, []).append(row)
+        else:
+            stale.add(row.pk)
+
+    moved = []
+    pending = []
+    for index, text in chunks:
+        digest = chunk_hash(text)
+        matches = existing.get(digest)
+        if matches:
+            row = matches.pop(0)
+            if row.chunk_index != index:
+                row.chunk_index = index
+                moved.append(row)
+        else:
+            pending.append((index, text, digest))
+    # Leftovers are removed chunks, and duplicates from earlier runs
+    stale.update(row.pk for rows in existing.values() for row in rows)
+
+    rows = []
+    for start in range(0, len(pending), batch_size):
+        batch = pending[start:start + batch_size]
+        vectors = backend.embed([text for _, text, _ in batch])
+        rows.extend(
+            DocumentEmbedding(
+                document=document,
+                chunk_text=text,
+                chunk_hash=digest,
+                embedding=vector,
+                dimensions=backend.dimensions,
+                chunk_index=index,
+            )
+            for (index, text, digest), vector in zip(batch, vectors)
+        )
+        if progress is not None:
+            progress(start + len(batch), len(pending))
+
+    # Not one transaction: a run that fails halfway is put right by the next one
+    if stale:
+        _delete_embeddings(DocumentEmbedding.objects.filter(pk__in=stale))
+    if moved:
+        DocumentEmbedding.objects.bulk_update(moved, ['chunk_index'], batch_size=batch_size)
+    rows = DocumentEmbedding.objects.bulk_create(rows, batch_size=batch_size)
+    if stale or moved or rows:
+        response_cache.invalidate([document.pk], listings=False)
+    return rows
+
+
+def copy_embeddings(source, document):
+    """
+    Copy the stored chunks and vectors of ``source`` to ``document``,
+    replacing any rows ``document`` already has.
+
+    Returns the created rows, or ``None`` if ``source`` was embedded by a
+    backend with different dimensions and has to be embedded again.
+    """
+    backend = get_embedding_backend()
+    existing = source.embeddings.all()
+    if existing.exclude(dimensions=backend.dimensions).exists():
+        return None
+
+    batch_size = get_setting('EMBEDDING_BATCH_SIZE')
+    _delete_embeddings(document.embeddings.all())
+    rows = []
+    batch = []
+    for embedding in existing.order_by('chunk_index').iterator(chunk_size=batch_size):
+        batch.append(DocumentEmbedding(
+            document=document,
+            chunk_text=embedding.chunk_text,
+            chunk_hash=embedding.chunk_hash or chunk_hash(embedding.chunk_text),
+            embedding=embedding.embedding,
+            dimensions=embedding.dimensions,
+            chunk_index=embedding.chunk_index,
+        ))
+        if len(batch) == batch_size:
+            rows.extend(DocumentEmbedding.objects.bulk_create(batch))
+            batch = []
+    rows.extend(DocumentEmbedding.objects.bulk_create(batch))
+    response_cache.invalidate([document.pk], listings=False)
+    return rows
@@ -0,0 +1,231 @@
+"""
+Ingestion status events.
+
+Ingestion publishes a document's status changes and its progress (pages
+extracted, chunks embedded); the ``events`` endpoint streams them to clients
+as server-sent events. Each server process has one ``Broadcaster`` that fans
+events out to the asyncio queues of its subscribers, so a waiting client
+costs an idle connection rather than a query per poll.
+
+Events cross processes through PostgreSQL ``LISTEN``/``NOTIFY``: publishers
+notify, and one listener thread per server process receives. On other
+databases one poller thread per process reads the status of every watched
+document in a single query each ``EVENTS_POLL_INTERVAL`` seconds; progress
+events then only reach subscribers in the publishing process.
+
+``EventSource`` cannot send an ``Authorization`` header, and a query string
+ends up in access logs, proxies and browser history, so the stream is not
+opened with the user's JWT. Clients first ask for a ticket: a signed value
+naming the user and one document that expires after
+``EVENTS_TICKET_MAX_AGE`` seconds and opens nothing but that stream.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, connections, transaction
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'document_events'
+TICKET_SALT = 'documents.events.ticket'
+TERMINAL_STATUSES = ('completed', 'failed')
+
+# Events a subscriber may fall behind by before the oldest are dropped
+QUEUE_SIZE = 100
+
+
+def _offer(queue, event):
+    if queue.full():
+        queue.get_nowait()
+    queue.put_nowait(event)
+
+
+class Broadcaster:
+    """Fans published events out to the subscribers in this process"""
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, document_id):
+        """Return a queue receiving the events of ``document_id``; call from the event loop"""
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        subscriber = (asyncio.get_running_loop(), queue)
+        with self._lock:
+            self._subscribers.setdefault(document_id, set()).add(subscriber)
+            if self._thread is None:
+                self._start()
+        return queue
+
+    def unsubscribe(self, document_id, queue):
+        with self._lock:
+            subscribers = self._subscribers.get(document_id, set())
+            subscribers.difference_update({s for s in subscribers if s[1] is queue})
+            if not subscribers:
+                self._subscribers.pop(document_id, None)
+
+    def watched(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def dispatch(self, event):
+        """Hand ``event`` to the subscribers of its document, from any thread"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(event['document'], ()))
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(_offer, queue, dict(event))
+            except RuntimeError:
+                # The subscriber's loop has closed
+                pass
+
+    def _start(self):
+        # Started lazily so each server worker gets its own receiver
+        target = self._listen if connection.vendor == 'postgresql' else self._poll
+        self._thread = threading.Thread(target=target, name='document-events', daemon=True)
+        self._thread.start()
+
+    def _listen(self):
+        """Receive NOTIFY payloads on a dedicated connection"""
+        wrapper = connections['default']
+        pause = threading.Event()
+        while True:
+            try:
+                conn = wrapper.get_new_connection(wrapper.get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN {CHANNEL}')
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.dispatch(json.loads(conn.notifies.pop(0).payload))
+            except Exception:
+                logger.exception("Lost the document events listener connection")
+                pause.wait(get_setting('EVENTS_POLL_INTERVAL'))
+
+    def _poll(self):
+        """Turn status changes of watched documents into events"""
+        from .models import Document
+
+        interval = get_setting('EVENTS_POLL_INTERVAL')
+        seen = {}
+        pause = threading.Event()
+        while not pause.wait(interval):
+            watched = self.watched()
+            seen = {pk: status for pk, status in seen.items() if pk in watched}
+            if not watched:
+                continue
+            try:
+                for pk, status in Document.objects.filter(pk__in=watched).values_list('id', 'status'):
+                    if seen.get(pk) != status:
+                        seen[pk] = status
+                        self.dispatch({'document': pk, 'event': 'status', 'status': status})
+            except Exception:
+                logger.exception("Failed to poll document statuses")
+            finally:
+                # This thread owns its connection; don't hold it between polls
+                connection.close()
+
+
+broadcaster = Broadcaster()
+
+
+def publish(document_id, event, **data):
+    """Publish an event for ``document_id`` once the current transaction commits"""
+    payload = {'document': document_id, 'event': event, **data}
+    if connection.vendor == 'postgresql':
+        # NOTIFY is itself delivered on commit
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, json.dumps(payload, cls=DjangoJSONEncoder)])
+    else:
+        transaction.on_commit(lambda: broadcaster.dispatch(payload))
+
+
+def publish_status(document_id, status):
+    publish(document_id, 'status', status=status)
+
+
+def publish_statuses(document_ids, status, batch_size=1000):
+    """Publish the same status for many documents, one query per batch"""
+    events = [{'document': document_id, 'event': 'status', 'status': status} for document_id in document_ids]
+    if connection.vendor != 'postgresql':
+        def dispatch():
+            for event in events:
+                broadcaster.dispatch(event)
+        transaction.on_commit(dispatch)
+        return
+    payloads = [json.dumps(event) for event in events]
+    with connection.cursor() as cursor:
+        for start in range(0, len(payloads), batch_size):
+            cursor.execute(
+                'SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload',
+                [CHANNEL, payloads[start:start + batch_size]],
+            )
+
+
+def progress_publisher(document_id, stage):
+    """Return a ``progress(done, total)`` callback publishing ``stage`` progress"""
+    def progress(done, total):
+        publish(document_id, 'progress', stage=stage, done=done, total=total)
+    return progress
+
+
+def issue_ticket(user, document_id):
+    """A ticket letting ``user`` open the event stream of ``document_id``"""
+    return signing.dumps({'user': user.pk, 'document': document_id}, salt=TICKET_SALT)
+
+
+def read_ticket(ticket, document_id):
+    """The id of the user a ticket for ``document_id`` was issued to, or ``None`` if it is invalid"""
+    try:
+        payload = signing.loads(ticket, salt=TICKET_SALT, max_age=get_setting('EVENTS_TICKET_MAX_AGE'))
+    except signing.BadSignature:
+        return None
+    if payload.get('document') != document_id:
+        return None
+    return payload.get('user')
+
+
+def format_event(event, data):
+    """One server-sent event"""
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+async def stream_events(document_id, get_status):
+    """
+    Yield the server-sent events of ``document_id``: its current status,
+    then progress and status changes until it is completed or failed.
+    ``get_status`` is an async callable returning the current status.
+    """
+    # Subscribe before reading the status so nothing published in between is missed
+    queue = broadcaster.subscribe(document_id)
+    try:
+        status = await get_status()
+        yield format_event('status', {'document': document_id, 'status': status})
+        heartbeat = get_setting('EVENTS_HEARTBEAT_INTERVAL')
+        while status not in TERMINAL_STATUSES:
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=heartbeat)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            name = event.pop('event')
+            if name == 'status':
+                # The poller may report a change this process already published
+                if event['status'] == status:
+                    continue
+                status = event['status']
+            yield format_event(name, event)
+    finally:
+        broadcaster.unsubscribe(document_id, queue)
@@ -0,0 +1,317 @@
+"""
+Process-pool text extraction.
+
+PyPDF2, python-docx and openpyxl are pure Python and hold the GIL, so
+extraction runs in a pool of worker processes. Large PDFs are split into page
+ranges that are extracted in parallel and reassembled in order; every other
+file is handled by one extractor task (see ``documents.extractors``). Every
+file gets a deadline and every worker process an address-space cap, so a
+hostile or broken file cannot hang or exhaust the ingestion worker.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError, wait
+from concurrent.futures.process import BrokenProcessPool
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+COPY_BLOCK_SIZE = 64 * 1024
+
+
+class ExtractionError(Exception):
+    """Raised when a file could not be extracted"""
+
+
+class ExtractionTimeout(ExtractionError):
+    """Raised when a file takes longer than the configured timeout"""
+
+
+def _init_worker(memory_limit_mb):
+    """Cap the address space of an extraction process"""
+    if resource is None or not memory_limit_mb:
+        return
+    limit = memory_limit_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+
+
+class TextWriter:
+    """
+    Append-only text buffer backed by a spooled temporary file.
+
+    Pieces are written straight through instead of being concatenated, so
+    assembling a document is linear in its size and only ``max_size``
+    characters are held in memory while it is written before the buffer
+    rolls over to disk. ``getvalue()`` reads the whole text back into memory.
+    """
+
+    def __init__(self, max_size=4 * 1024 * 1024):
+        self._file = tempfile.SpooledTemporaryFile(
+            max_size=max_size, mode='w+', encoding='utf-8', newline=''
+        )
+        self.length = 0
+
+    def write(self, text):
+        self._file.write(text)
+        self.length += len(text)
+
+    def write_from(self, path):
+        """Stream the contents of a UTF-8 text file into the buffer"""
+        with open(path, 'r', encoding='utf-8', newline='') as source:
+            while True:
+                block = source.read(COPY_BLOCK_SIZE)
+                if not block:
+                    break
+                self.write(block)
+
+    def getvalue(self):
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def iter_pdf_pages(file_path, start=0, stop=None):
+    """Yield the text of each page of a PDF from ``start`` up to ``stop``"""
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        stop = len(reader.pages) if stop is None else stop
+        for page_num in range(start, stop):
+            yield reader.pages[page_num].extract_text()
+
+
+def iter_word_paragraphs(file_path):
+    """Yield the text of each paragraph of a Word document"""
+    import docx
+    for para in docx.Document(file_path).paragraphs:
+        yield para.text
+
+
+def _spool_to_file(pieces, separator):
+    """
+    Write ``pieces`` to a temporary file. Returns its path and the length
+    of each piece written, separator included.
+    """
+    lengths = []
+    with tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', newline='', suffix='.txt', delete=False
+    ) as out:
+        for piece in pieces:
+            out.write(piece)
+            out.write(separator)
+            lengths.append(len(piece) + len(separator))
+    return out.name, lengths
+
+
+def _spool_pages(pages, separator):
+    """
+    Like ``_spool_to_file``, for pages that are themselves iterables of
+    pieces, so a page never has to be held in memory whole. Returns the temp
+    file path and the length of each page, separator included.
+    """
+    lengths = []
+    with tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', newline='', suffix='.txt', delete=False
+    ) as out:
+        for page in pages:
+            length = len(separator)
+            for piece in page:
+                out.write(piece)
+                length += len(piece)
+            out.write(separator)
+            lengths.append(length)
+    return out.name, lengths
+
+
+def _pdf_page_count(file_path):
+    import PyPDF2
+    with open(file_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+
+def _extract_pdf_range(file_path, start, stop):
+    """Extract pages ``start`` (inclusive) to ``stop`` (exclusive) into a temp file"""
+    return _spool_to_file(iter_pdf_pages(file_path, start, stop), "\n\n")
+
+
+def _extract_pdf(file_path):
+    """Extract a whole PDF into a temp file, with its page lengths"""
+    return _extract_pdf_range(file_path, 0, None)
+
+
+def _extract_word(file_path):
+    """Extract a Word document into a temp file; it has no pages"""
+    path, _ = _spool_to_file(iter_word_paragraphs(file_path), "\n")
+    return path, []
+
+
+def page_ranges(page_count, pages_per_task):
+    """Split ``page_count`` pages into consecutive ``(start, stop)`` ranges"""
+    pages_per_task = max(1, pages_per_task)
+    return [
+        (start, min(start + pages_per_task, page_count))
+        for start in range(0, page_count, pages_per_task)
+    ]
+
+
+class ExtractionEngine:
+    """Runs text extraction on a bounded pool of worker processes"""
+
+    def __init__(self, max_workers=None, timeout=300, memory_limit_mb=1024, pdf_pages_per_task=25):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.pdf_pages_per_task = pdf_pages_per_task
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    # Ingestion workers are multi-threaded, which makes fork unsafe
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.memory_limit_mb,),
+                )
+            return self._executor
+
+    def _reset(self, executor):
+        """Kill a pool whose workers are stuck or dead so the next call gets a fresh one"""
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        # There is no public API to kill running workers before Python 3.14
+        for process in list(getattr(executor, '_processes', {}).values()):
+            process.terminate()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _gather(self, executor, futures, deadline, on_result=None):
+        results = []
+        try:
+            for future in futures:
+                results.append(future.result(timeout=max(0, deadline - time.monotonic())))
+                if on_result is not None:
+                    on_result(len(results) - 1)
+        except FutureTimeoutError:
+            self._reset(executor)
+            raise ExtractionTimeout(f"Extraction exceeded {self.timeout} seconds")
+        except BrokenProcessPool:
+            self._reset(executor)
+            raise ExtractionError("Extraction worker crashed")
+        except MemoryError:
+            raise ExtractionError(f"Extraction exceeded {self.memory_limit_mb}MB memory limit")
+        return results
+
+    def _gather_parts(self, executor, futures, deadline, on_result=None):
+        """Gather temp file paths, removing every one written if a part fails"""
+        try:
+            return self._gather(executor, futures, deadline, on_result)
+        except Exception:
+            for future in futures:
+                future.cancel()
+            # Parts already running still write their files; let them finish so those go too
+            wait(futures, timeout=max(0, deadline - time.monotonic()))
+            for future in futures:
+                if future.done() and not future.cancelled() and future.exception() is None:
+                    os.unlink(future.result()[0])
+            raise
+
+    def _assemble(self, parts):
+        """
+        Concatenate the worker output files in order and remove them.
+        Returns the text and the offset at which each piece starts.
+        """
+        offsets = []
+        with TextWriter() as writer:
+            for path, lengths in parts:
+                offset = writer.length
+                for length in lengths:
+                    offsets.append(offset)
+                    offset += length
+                try:
+                    writer.write_from(path)
+                finally:
+                    os.unlink(path)
+            return writer.getvalue(), offsets
+
+    def extract_pdf(self, file_path, progress=None):
+        """
+        Extract a PDF, fanning page ranges out across the pool. Returns the
+        text and the character offset at which each page starts.
+        ``progress(pages_done, page_count)`` is called as ranges complete.
+        """
+        deadline = time.monotonic() + self.timeout
+        executor = self._get_executor()
+        [page_count] = self._gather(executor, [executor.submit(_pdf_page_count, file_path)], deadline)
+        ranges = page_ranges(page_count, self.pdf_pages_per_task)
+        futures = [executor.submit(_extract_pdf_range, file_path, start, stop) for start, stop in ranges]
+        on_result = None
+        if progress is not None:
+            def on_result(index):
+                progress(ranges[index][1], page_count)
+        return self._assemble(self._gather_parts(executor, futures, deadline, on_result))
+
+    def extract(self, extractor, file_path):
+        """
+        Run ``extractor`` on a file in a worker process. Returns the text and
+        the character offset at which each page starts.
+        """
+        deadline = time.monotonic() + self.timeout
+        executor = self._get_executor()
+        return self._assemble(
+            self._gather_parts(executor, [executor.submit(extractor, file_path)], deadline)
+        )
+
+    def extract_word(self, file_path):
+        """Extract a Word document in a worker process"""
+        text, _ = self.extract(_extract_word, file_path)
+        return text
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Return the process-wide extraction engine, creating it on first use"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            from .conf import get_setting
+            _engine = ExtractionEngine(
+                max_workers=get_setting('EXTRACTION_WORKERS'),
+                timeout=get_setting('EXTRACTION_TIMEOUT'),
+                memory_limit_mb=get_setting('EXTRACTION_MEMORY_LIMIT_MB'),
+                pdf_pages_per_task=get_setting('EXTRACTION_PDF_PAGES_PER_TASK'),
+            )
+        return _engine
+
+
+def shutdown_engine():
+    """Stop the process-wide extraction engine's workers, if it was started"""
+    global _engine
+    with _engine_lock:
+        engine, _engine = _engine, None
+    if engine is not None:
+        engine.shutdown()
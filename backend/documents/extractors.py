@@ -0,0 +1,238 @@
+"""
+Extractors for each supported file type.
+
+A file's type is sniffed from its leading bytes, and for Office Open XML
+packages from the parts inside the zip, rather than taken from its
+extension, and its extractor looked up by MIME type in ``EXTRACTORS``.
+``DOCUMENTS['EXTRACTORS']`` adds or replaces entries by dotted path.
+
+An extractor is a top-level function taking a file path. It runs in one of
+the extraction engine's worker processes, writes the text to a temporary
+file and returns ``(path, page_lengths)``: the length of each page
+(spreadsheet sheet, slide), or an empty list for content without pages.
+Spreadsheets are read a row at a time and slides one at a time, so memory
+does not grow with the file; images only have their header and metadata
+read, never their pixels.
+"""
+import codecs
+import posixpath
+import tempfile
+import zipfile
+from xml.etree import ElementTree
+
+from django.utils.module_loading import import_string
+
+from .extraction import (
+    COPY_BLOCK_SIZE, ExtractionError, _extract_pdf, _extract_word, _spool_pages, _spool_to_file, get_engine,
+)
+
+TEXT = 'text/plain'
+PDF = 'application/pdf'
+DOCX = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+XLSX = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+PPTX = 'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+PNG = 'image/png'
+JPEG = 'image/jpeg'
+ZIP = 'application/zip'
+# Legacy binary Office formats (doc, xls, ppt)
+OLE = 'application/x-ole-storage'
+BINARY = 'application/octet-stream'
+
+SNIFF_SIZE = 8192
+
+# Leading bytes of each recognised format
+SIGNATURES = (
+    (b'%PDF-', PDF),
+    (b'\x89PNG\r\n\x1a\n', PNG),
+    (b'\xff\xd8\xff', JPEG),
+    (b'PK\x03\x04', ZIP),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', OLE),
+)
+
+# The part that identifies each kind of Office Open XML package
+PACKAGE_PARTS = (
+    ('word/document.xml', DOCX),
+    ('xl/workbook.xml', XLSX),
+    ('ppt/presentation.xml', PPTX),
+)
+
+PRESENTATION_NS = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+DRAWING_NS = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+RELATIONSHIPS_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+
+class UnsupportedFileType(ExtractionError):
+    """Raised when no extractor is registered for a file's type"""
+
+    def __init__(self, mime_type):
+        super().__init__(f"No extractor for {mime_type}")
+        self.mime_type = mime_type
+
+
+def sniff_type(file_path):
+    """Return the MIME type of a file, judged by its content"""
+    with open(file_path, 'rb') as file:
+        head = file.read(SNIFF_SIZE)
+    for signature, mime_type in SIGNATURES:
+        if head.startswith(signature):
+            break
+    else:
+        return BINARY if b'\0' in head else TEXT
+
+    if mime_type == ZIP:
+        try:
+            with zipfile.ZipFile(file_path) as package:
+                names = set(package.namelist())
+        except zipfile.BadZipFile:
+            return BINARY
+        for part, package_type in PACKAGE_PARTS:
+            if part in names:
+                return package_type
+    return mime_type
+
+
+def _extract_text(file_path):
+    """Copy a text file into a temp file, dropping bytes that aren't UTF-8"""
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    with open(file_path, 'rb') as source, tempfile.NamedTemporaryFile(
+        'w', encoding='utf-8', newline='', suffix='.txt', delete=False
+    ) as out:
+        while True:
+            block = source.read(COPY_BLOCK_SIZE)
+            out.write(decoder.decode(block, final=not block))
+            if not block:
+                break
+    return out.name, []
+
+
+def _sheet_lines(sheet):
+    """Yield the title of a sheet, then one tab-separated line per non-empty row"""
+    yield f"{sheet.title}\n"
+    for row in sheet.iter_rows(values_only=True):
+        cells = ['' if value is None else str(value) for value in row]
+        while cells and not cells[-1]:
+            cells.pop()
+        if cells:
+            yield "\t".join(cells) + "\n"
+
+
+def _extract_spreadsheet(file_path):
+    """Extract an xlsx workbook, one page per sheet"""
+    from openpyxl import load_workbook
+    # Read-only workbooks parse rows as they are iterated
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        return _spool_pages((_sheet_lines(sheet) for sheet in workbook.worksheets), "\n")
+    finally:
+        workbook.close()
+
+
+def _slide_names(package):
+    """Part names of a presentation's slides, in presentation order"""
+    relationships = ElementTree.parse(package.open('ppt/_rels/presentation.xml.rels')).getroot()
+    targets = {rel.get('Id'): rel.get('Target') for rel in relationships}
+    presentation = ElementTree.parse(package.open('ppt/presentation.xml')).getroot()
+    names = []
+    for slide in presentation.iter(f'{{{PRESENTATION_NS}}}sldId'):
+        target = targets[slide.get(f'{{{RELATIONSHIPS_NS}}}id')]
+        if target.startswith('/'):
+            names.append(target[1:])
+        else:
+            names.append(posixpath.normpath(posixpath.join('ppt', target)))
+    return names
+
+
+def _slide_lines(package, name):
+    """Yield each non-empty paragraph of a slide, parsing it incrementally"""
+    text = []
+    with package.open(name) as slide:
+        for _, element in ElementTree.iterparse(slide):
+            if element.tag == f'{{{DRAWING_NS}}}t':
+                text.append(element.text or '')
+            elif element.tag == f'{{{DRAWING_NS}}}p':
+                line = ''.join(text).strip()
+                text = []
+                element.clear()
+                if line:
+                    yield line + "\n"
+
+
+def _extract_presentation(file_path):
+    """Extract a pptx presentation, one page per slide"""
+    with zipfile.ZipFile(file_path) as package:
+        return _spool_pages(
+            (_slide_lines(package, name) for name in _slide_names(package)), "\n"
+        )
+
+
+# Metadata worth indexing, of the EXIF tags an image may carry
+IMAGE_TAGS = ('ImageDescription', 'XPTitle', 'XPSubject', 'XPKeywords', 'Artist', 'Copyright',
+              'Make', 'Model', 'DateTime')
+
+
+def _image_lines(image):
+    yield f"{image.format} image, {image.width}x{image.height} pixels, {image.mode}"
+    # Only EXIF already read with the header: getexif() may decode the whole image
+    from PIL import ExifTags, Image
+    exif = Image.Exif()
+    if 'exif' in image.info:
+        exif.load(image.info['exif'])
+    for name in IMAGE_TAGS:
+        value = exif.get(ExifTags.Base[name])
+        if isinstance(value, bytes):
+            # XP* tags are UTF-16
+            value = value.decode('utf-16-le', errors='ignore').rstrip('\0')
+        if value:
+            yield f"{name}: {value}"
+    # PNG text chunks and the like
+    for key, value in image.info.items():
+        if isinstance(value, str) and value:
+            yield f"{key}: {value}"
+
+
+def _extract_image(file_path):
+    """Extract an image's format, size and descriptive metadata"""
+    from PIL import Image
+    # Opening an image reads its header; the pixels are never decoded
+    with Image.open(file_path) as image:
+        path, _ = _spool_to_file(_image_lines(image), "\n")
+    return path, []
+
+
+# MIME type -> extractor run in a worker process
+EXTRACTORS = {
+    TEXT: _extract_text,
+    PDF: _extract_pdf,
+    DOCX: _extract_word,
+    XLSX: _extract_spreadsheet,
+    PPTX: _extract_presentation,
+    PNG: _extract_image,
+    JPEG: _extract_image,
+}
+
+
+def get_extractor(mime_type):
+    """Return the extractor for ``mime_type``, or ``None`` if there is none"""
+    from .conf import get_setting
+    path = get_setting('EXTRACTORS').get(mime_type)
+    if path is not None:
+        return import_string(path)
+    return EXTRACTORS.get(mime_type)
+
+
+def extract_file(file_path, progress=None):
+    """
+    Extract a file by its sniffed type. Returns the text and the character
+    offset at which each page starts. ``progress(pages_done, page_count)``
+    is called as the pages of a PDF are extracted.
+
+    Raises ``UnsupportedFileType`` if the type has no extractor.
+    """
+    mime_type = sniff_type(file_path)
+    extractor = get_extractor(mime_type)
+    if extractor is None:
+        raise UnsupportedFileType(mime_type)
+    if extractor is _extract_pdf:
+        # Large PDFs are fanned out across the pool
+        return get_engine().extract_pdf(file_path, progress)
+    return get_engine().extract(extractor, file_path)
@@ -0,0 +1,42 @@
+import base64
+
+import numpy as np
+from django.db import models
+
+# Vectors are stored little-endian so the bytes are portable between hosts
+VECTOR_DTYPE = np.dtype('<f4')
+
+
+class VectorField(models.BinaryField):
+    """
+    Stores a one-dimensional float32 vector as raw bytes.
+
+    Values load as read-only NumPy arrays that are views over the bytes
+    returned by the database driver, so decoding does not copy or parse.
+    """
+
+    description = "Float32 vector"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype=VECTOR_DTYPE)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, np.ndarray):
+            return value
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            return np.frombuffer(value, dtype=VECTOR_DTYPE)
+        if isinstance(value, str):
+            return np.frombuffer(base64.b64decode(value), dtype=VECTOR_DTYPE)
+        return np.asarray(value, dtype=VECTOR_DTYPE)
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, (bytes, bytearray, memoryview)):
+            return value
+        return np.ascontiguousarray(value, dtype=VECTOR_DTYPE).tobytes()
+
+    def value_to_string(self, obj):
+        """Binary data is serialized as base64"""
+        value = self.get_prep_value(self.value_from_object(obj))
+        return base64.b64encode(value).decode('ascii') if value is not None else None
@@ -0,0 +1,85 @@
+import logging
+
+from . import events, metrics
+from .content import build_content_index
+from .embeddings import copy_embeddings, embed_document
+from .extractors import UnsupportedFileType, extract_file
+from .models import Document
+from .vector_index import index_embeddings
+
+logger = logging.getLogger(__name__)
+
+
+def process_document(document_id):
+    """
+    Extract content and build embeddings for a document.
+    
+    Errors are raised to the caller so the ingestion queue can decide
+    whether the job should be retried.
+    """
+    document = Document.objects.get(id=document_id)
+    
+    # The same file may already have been processed for another document
+    with metrics.stage('reuse'):
+        embeddings = _reuse_ingestion(document)
+    if embeddings is None:
+        embeddings = _ingest(document)
+    
+    # Update document status
+    document.status = 'completed'
+    document.save(update_fields=['content', 'content_index', 'status', 'updated_at'])
+    events.publish_status(document.pk, document.status)
+    metrics.INGESTED_BYTES.inc(document.file_size)
+    metrics.INGESTED_CHUNKS.inc(len(embeddings))
+    
+    # The index can always be rebuilt from the table, so don't fail the job over it
+    try:
+        with metrics.stage('index'):
+            index_embeddings(embeddings)
+    except Exception:
+        logger.exception("Failed to add document %s to the vector index", document_id)
+
+
+def _reuse_ingestion(document):
+    """
+    Copy the content and embeddings of a completed document with the same
+    file hash. Returns the copied embeddings, or ``None`` if there is none.
+    """
+    if not document.content_hash:
+        return None
+    source = (
+        Document.objects.filter(content_hash=document.content_hash, status='completed')
+        .exclude(pk=document.pk)
+        .only('id', 'content', 'content_index')
+        .first()
+    )
+    if source is None:
+        return None
+    embeddings = copy_embeddings(source, document)
+    if embeddings is not None:
+        document.content = source.content
+        document.content_index = source.content_index
+    return embeddings
+
+
+def _ingest(document):
+    """Extract and embed the content of ``document``; returns the embeddings"""
+    page_offsets = []
+    try:
+        # The extractor is chosen by the file's content, not its extension
+        with metrics.stage('extract'):
+            content, page_offsets = extract_file(
+                document.file.path, events.progress_publisher(document.pk, 'extracting')
+            )
+    except UnsupportedFileType:
+        content = f"File type {document.file_type} is not supported for content extraction."
+    # Any other error, including extraction timeouts and crashed workers, fails
+    # the job so the queue retries it and eventually marks the document failed
+    document.content = content
+    
+    # Index lines and pages so slices of the content can be served
+    document.content_index = build_content_index(document.content, page_offsets)
+    
+    # Chunk and embed the extracted content
+    with metrics.stage('embed'):
+        return embed_document(document, progress=events.progress_publisher(document.pk, 'embedding'))
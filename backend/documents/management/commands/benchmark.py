@@ -0,0 +1,45 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from documents.benchmarking import BENCHMARKS, COMMITTING_BENCHMARKS
+
+
+class Command(BaseCommand):
+    help = "Run a documents benchmark and print its results as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('benchmark', choices=sorted(BENCHMARKS))
+        parser.add_argument(
+            '--option', action='append', default=[], metavar='NAME=VALUE',
+            help="Integer keyword argument passed to the benchmark, e.g. --option pages=5000",
+        )
+        parser.add_argument('--output', help="Also write the results to this file")
+        parser.add_argument(
+            '--yes', action='store_true',
+            help="Allow benchmarks that commit seeded rows to the default database when DEBUG is off",
+        )
+
+    def handle(self, *args, **options):
+        if options['benchmark'] in COMMITTING_BENCHMARKS and not (settings.DEBUG or options['yes']):
+            raise CommandError(
+                f"The {options['benchmark']} benchmark commits seeded users and documents to the "
+                f"default database; pass --yes to run it with DEBUG off"
+            )
+        kwargs = {}
+        for option in options['option']:
+            name, sep, value = option.partition('=')
+            if not sep:
+                raise CommandError(f"Invalid option '{option}', expected NAME=VALUE")
+            try:
+                kwargs[name.replace('-', '_')] = int(value)
+            except ValueError:
+                raise CommandError(f"Option '{name}' must be an integer")
+
+        results = BENCHMARKS[options['benchmark']](**kwargs)
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+        self.stdout.write(output)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from documents.vector_index import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the semantic search vector index from the embeddings table"
+
+    def handle(self, *args, **options):
+        count = rebuild_index()
+        self.stdout.write(f"Indexed {count} embedding(s)")
@@ -0,0 +1,113 @@
+import os
+import signal
+import socket
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from documents.conf import get_setting
+from documents.extraction import shutdown_engine
+from documents.models import IngestionJob
+from documents.queue import claim_jobs, recover_stale_jobs, run_job
+from documents.vector_index import get_index, rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Run an ingestion worker that processes queued document ingestion jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=get_setting('INGESTION_WORKER_CONCURRENCY'),
+            help="Maximum number of jobs processed at the same time by this worker",
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=get_setting('INGESTION_POLL_INTERVAL'),
+            help="Seconds to wait between polls when the queue is empty",
+        )
+        parser.add_argument(
+            '--worker-id', default=f"{socket.gethostname()}:{os.getpid()}",
+            help="Identifier recorded on claimed jobs",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Exit once the queue is drained instead of polling forever",
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        worker_id = options['worker_id']
+        concurrency = max(1, options['concurrency'])
+        poll_interval = options['poll_interval']
+
+        recovered = recover_stale_jobs()
+        if recovered:
+            self.stdout.write(f"Recovered {recovered} stale ingestion job(s)")
+        self.stdout.write(f"Ingestion worker {worker_id} started with concurrency {concurrency}")
+
+        in_flight = {}
+        last_recovery = time.monotonic()
+        rebuild = None
+        # Index rebuilds read every embedding, so they run beside the jobs rather than in one
+        with ThreadPoolExecutor(max_workers=concurrency) as executor, \
+                ThreadPoolExecutor(max_workers=1) as rebuilder:
+            while not self.stopping:
+                close_old_connections()
+                jobs = claim_jobs(worker_id, concurrency - len(in_flight))
+                for job in jobs:
+                    in_flight[executor.submit(self._run, job)] = job.pk
+
+                if in_flight:
+                    done, _ = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        del in_flight[future]
+                    self._heartbeat(worker_id, in_flight.values())
+                elif options['once']:
+                    break
+                else:
+                    time.sleep(poll_interval)
+
+                if time.monotonic() - last_recovery > get_setting('INGESTION_STALE_AFTER') / 2:
+                    recover_stale_jobs()
+                    last_recovery = time.monotonic()
+
+                if (rebuild is None or rebuild.done()) and get_index().needs_rebuild():
+                    rebuild = rebuilder.submit(self._rebuild_index)
+
+            if in_flight:
+                self.stdout.write(f"Waiting for {len(in_flight)} in-flight job(s) to finish")
+
+        shutdown_engine()
+
+        self.stdout.write(f"Ingestion worker {worker_id} stopped")
+
+    def _run(self, job):
+        try:
+            run_job(job)
+        finally:
+            # Worker threads own their database connection
+            connection.close()
+
+    def _rebuild_index(self):
+        try:
+            count = rebuild_index(wait=False)
+            if count is not None:
+                self.stdout.write(f"Rebuilt the vector index with {count} embedding(s)")
+        except Exception as exc:
+            self.stderr.write(f"Failed to rebuild the vector index: {exc}")
+        finally:
+            connection.close()
+
+    def _heartbeat(self, worker_id, job_ids):
+        """Keep in-flight jobs from being treated as stale"""
+        IngestionJob.objects.filter(
+            pk__in=list(job_ids), status='running', locked_by=worker_id
+        ).update(locked_at=timezone.now())
+
+    def _stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from documents.conf import get_setting
+from documents.models import UploadSession
+
+
+class Command(BaseCommand):
+    help = "Delete chunked uploads that have been idle for longer than UPLOAD_SESSION_TTL"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=None, metavar='SECONDS',
+            help="Idle time after which an upload is purged (defaults to UPLOAD_SESSION_TTL)",
+        )
+
+    def handle(self, *args, **options):
+        ttl = options['older_than']
+        if ttl is None:
+            ttl = get_setting('UPLOAD_SESSION_TTL')
+        cutoff = timezone.now() - timedelta(seconds=ttl)
+        # Deleting the sessions deletes their parts, whose files go with them
+        deleted = 0
+        for session in UploadSession.objects.filter(updated_at__lt=cutoff).iterator():
+            session.delete()
+            deleted += 1
+        self.stdout.write(f"Purged {deleted} upload session(s)")
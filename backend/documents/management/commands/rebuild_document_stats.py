@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from documents.stats import rebuild
+
+
+class Command(BaseCommand):
+    help = "Recount the document statistics from the documents table"
+
+    def handle(self, *args, **options):
+        count = rebuild()
+        self.stdout.write(f"Rebuilt {count} counter(s)")
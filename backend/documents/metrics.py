@@ -0,0 +1,408 @@
+"""
+Request and ingestion instrumentation in the Prometheus text format.
+
+One registry of counters and histograms per process is fed by:
+
+- ``MetricsMiddleware``, which times every request and, through a database
+  execute wrapper installed on each connection, counts and times the
+  queries the request runs;
+- ``stage(name)``, which times a block: JWT authentication, serialization,
+  and each stage of ingestion (reuse, extraction, embedding, indexing);
+- ingestion itself, which counts finished jobs and the bytes and chunks
+  they processed.
+
+Queue depth is read from the jobs table when the metrics are scraped.
+Ingestion runs in its own worker processes, so with ``METRICS_DIR`` set each
+process writes a snapshot of its registry there every
+``METRICS_FLUSH_INTERVAL`` seconds and on exit, and a scrape sums every
+snapshot in the directory.
+
+With ``METRICS_ENABLED`` off the middleware removes itself from the stack,
+no execute wrapper is installed and ``stage()`` returns a shared no-op
+context manager, so instrumented code pays for one settings lookup.
+"""
+import atexit
+import bisect
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from .conf import get_setting
+
+logger = logging.getLogger(__name__)
+
+# Seconds; ingestion stages run far longer than requests
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+
+def enabled():
+    return get_setting('METRICS_ENABLED')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Metric:
+    """A named metric with one series per combination of label values"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def snapshot(self):
+        """The series as ``{json label values: value}``"""
+        with self._lock:
+            return {json.dumps(key): self._copy(value) for key, value in self._series.items()}
+
+    def _copy(self, value):
+        return value
+
+    def render(self, series):
+        """Exposition lines for ``series``, as returned by ``snapshot``"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key in sorted(series):
+            lines.extend(self._render_series(json.loads(key), series[key]))
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if not enabled():
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+        snapshots.start()
+
+    @staticmethod
+    def merge(value, other):
+        return value + other
+
+    def _render_series(self, key, value):
+        yield f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        if not enabled():
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            # Per-bucket counts (the last one is +Inf) followed by the sum
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+        snapshots.start()
+
+    def _copy(self, value):
+        return list(value)
+
+    @staticmethod
+    def merge(value, other):
+        return [a + b for a, b in zip(value, other)]
+
+    def _render_series(self, key, value):
+        cumulative = 0
+        for bound, count in zip((*self.buckets, '+Inf'), value[:-1]):
+            cumulative += count
+            le = bound if bound == '+Inf' else _format_value(bound)
+            yield f'{self.name}_bucket{_format_labels(self.labels, key, [("le", le)])} {cumulative}'
+        yield f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(value[-1])}'
+        yield f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}'
+
+
+class Registry:
+    """The metrics of this process"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def merge(self, snapshots):
+        """Sum the series of several snapshots"""
+        merged = {name: {} for name in self.metrics}
+        for snapshot in snapshots:
+            for name, series in snapshot.items():
+                metric = self.metrics.get(name)
+                if metric is None:
+                    continue
+                for key, value in series.items():
+                    current = merged[name].get(key)
+                    merged[name][key] = value if current is None else metric.merge(current, value)
+        return merged
+
+    def render(self, snapshot):
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.extend(metric.render(snapshot.get(name, {})))
+        return lines
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.register(Histogram(
+    'documents_http_request_duration_seconds', "Time to produce a response, by view",
+    labels=('view', 'method', 'status'),
+))
+REQUEST_DB_SECONDS = registry.register(Histogram(
+    'documents_http_request_db_seconds', "Time spent in database queries per request, by view",
+    labels=('view',),
+))
+REQUEST_QUERIES = registry.register(Histogram(
+    'documents_http_request_queries', "Database queries per request, by view",
+    labels=('view',), buckets=QUERY_BUCKETS,
+))
+STAGE_SECONDS = registry.register(Histogram(
+    'documents_stage_duration_seconds', "Time spent in an instrumented stage",
+    labels=('stage',),
+))
+INGESTION_JOBS = registry.register(Counter(
+    'documents_ingestion_jobs_total', "Ingestion jobs run, by result", labels=('result',),
+))
+INGESTED_BYTES = registry.register(Counter(
+    'documents_ingested_bytes_total', "Bytes of documents ingested",
+))
+INGESTED_CHUNKS = registry.register(Counter(
+    'documents_ingested_chunks_total', "Chunks embedded by ingestion",
+))
+
+
+class SnapshotWriter:
+    """Writes this process's registry to ``METRICS_DIR`` so a scrape can sum every process"""
+
+    def __init__(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._thread is not None or not get_setting('METRICS_DIR'):
+            return
+        with self._lock:
+            if self._thread is None:
+                # Started lazily so each forked server worker gets its own writer
+                self._thread = threading.Thread(target=self._run, name='metrics-writer', daemon=True)
+                self._thread.start()
+                atexit.register(self.write)
+
+    def _run(self):
+        pause = threading.Event()
+        while not pause.wait(get_setting('METRICS_FLUSH_INTERVAL')):
+            self.write()
+
+    def write(self):
+        directory = get_setting('METRICS_DIR')
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile('w', dir=directory, suffix='.tmp', delete=False) as out:
+                json.dump(registry.snapshot(), out)
+            os.replace(out.name, os.path.join(directory, f'{os.getpid()}.json'))
+        except OSError:
+            logger.exception("Failed to write metrics snapshot")
+
+    def read_all(self):
+        """Every process's snapshot, this one's current"""
+        directory = get_setting('METRICS_DIR')
+        if not directory:
+            return [registry.snapshot()]
+        self.write()
+        collected = []
+        for name in os.listdir(directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    collected.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed or being replaced
+                continue
+        return collected
+
+
+snapshots = SnapshotWriter()
+
+
+_untimed = nullcontext()
+
+
+def stage(name):
+    """Time a block as stage ``name``: ``with stage('embedding'): ...``"""
+    if not enabled():
+        return _untimed
+    return _timed(name)
+
+
+@contextmanager
+def _timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+
+
+# -- requests ------------------------------------------------------------
+
+class _RequestStats:
+    __slots__ = ('queries', 'db_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+# Shared with the threads sync_to_async runs database calls in
+_current = ContextVar('documents_metrics_request', default=None)
+
+
+def _time_query(execute, sql, params, many, context):
+    current = _current.get()
+    if current is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.queries += 1
+        current.db_seconds += time.perf_counter() - start
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    if enabled() and _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+class MetricsMiddleware:
+    """Time each request and the queries it runs"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        current, token, start = self._begin()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._end(request, response, current, start)
+        return response
+
+    async def __acall__(self, request):
+        current, token, start = self._begin()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._end(request, response, current, start)
+        return response
+
+    def _begin(self):
+        current = _RequestStats()
+        return current, _current.set(current), time.perf_counter()
+
+    def _end(self, request, response, current, start):
+        elapsed = time.perf_counter() - start
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        REQUEST_DB_SECONDS.observe(current.db_seconds, view=view)
+        REQUEST_QUERIES.observe(current.queries, view=view)
+
+
+class TimedJWTAuthentication(JWTAuthentication):
+    """``JWTAuthentication`` reporting token decoding and user lookup as stages"""
+
+    def get_validated_token(self, raw_token):
+        with stage('jwt_decode'):
+            return super().get_validated_token(raw_token)
+
+    def get_user(self, validated_token):
+        with stage('jwt_user'):
+            return super().get_user(validated_token)
+
+
+# -- exposition ------------------------------------------------------------
+
+def queue_depth():
+    """Ingestion jobs waiting or running, by status"""
+    from django.db.models import Count
+    from .models import IngestionJob
+
+    depth = dict.fromkeys(('queued', 'running'), 0)
+    rows = (
+        IngestionJob.objects.filter(status__in=list(depth)).order_by()
+        .values_list('status').annotate(count=Count('id'))
+    )
+    depth.update(rows)
+    return depth
+
+
+def render():
+    """The metrics of every process, and the queue depth, in the text format"""
+    lines = registry.render(registry.merge(snapshots.read_all()))
+    lines.append('# HELP documents_ingestion_queue_jobs Ingestion jobs waiting or running')
+    lines.append('# TYPE documents_ingestion_queue_jobs gauge')
+    for status, count in queue_depth().items():
+        lines.append(f'documents_ingestion_queue_jobs{_format_labels(("status",), (status,))} {count}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,63 @@
+# Converts DocumentEmbedding.embedding from JSON to packed float32 bytes
+
+from django.db import migrations, models
+
+import documents.fields
+
+BATCH_SIZE = 2000
+
+
+def json_to_vector(apps, schema_editor):
+    DocumentEmbedding = apps.get_model('documents', 'DocumentEmbedding')
+    batch = []
+    for row in DocumentEmbedding.objects.exclude(embedding=None).only('id', 'embedding').iterator(chunk_size=BATCH_SIZE):
+        values = row.embedding.get('values', []) if isinstance(row.embedding, dict) else row.embedding
+        row.vector = values
+        row.dimensions = len(values)
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            DocumentEmbedding.objects.bulk_update(batch, ['vector', 'dimensions'])
+            batch = []
+    DocumentEmbedding.objects.bulk_update(batch, ['vector', 'dimensions'])
+
+
+def vector_to_json(apps, schema_editor):
+    DocumentEmbedding = apps.get_model('documents', 'DocumentEmbedding')
+    batch = []
+    for row in DocumentEmbedding.objects.exclude(vector=None).only('id', 'vector').iterator(chunk_size=BATCH_SIZE):
+        row.embedding = {"values": row.vector.tolist()}
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            DocumentEmbedding.objects.bulk_update(batch, ['embedding'])
+            batch = []
+    DocumentEmbedding.objects.bulk_update(batch, ['embedding'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0007_ingestionjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentembedding',
+            name='vector',
+            field=documents.fields.VectorField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='documentembedding',
+            name='dimensions',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython(json_to_vector, vector_to_json),
+        migrations.RemoveField(
+            model_name='documentembedding',
+            name='embedding',
+        ),
+        migrations.RenameField(
+            model_name='documentembedding',
+            old_name='vector',
+            new_name='embedding',
+        ),
+    ]
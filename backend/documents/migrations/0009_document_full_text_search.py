@@ -0,0 +1,57 @@
+# Full-text search: a generated tsvector column with a GIN index on
+# PostgreSQL, an FTS5 table on SQLite (see documents/search.py)
+
+from django.db import migrations
+
+FTS_TABLE = 'documents_document_fts'
+PG_CONTENT_LIMIT = 500000
+
+POSTGRES_SETUP = [
+    f"""
+    ALTER TABLE documents_document ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'B') ||
+        setweight(to_tsvector('english', left(coalesce(content, ''), {PG_CONTENT_LIMIT})), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX documents_document_search_idx ON documents_document USING GIN (search_vector)",
+]
+POSTGRES_TEARDOWN = [
+    "DROP INDEX IF EXISTS documents_document_search_idx",
+    "ALTER TABLE documents_document DROP COLUMN IF EXISTS search_vector",
+]
+SQLITE_SETUP = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE}
+    USING fts5(title, description, content, tokenize='porter unicode61')
+    """,
+    f"""
+    INSERT INTO {FTS_TABLE}(rowid, title, description, content)
+    SELECT id, title, coalesce(description, ''), coalesce(content, '') FROM documents_document
+    """,
+]
+SQLITE_TEARDOWN = [f"DROP TABLE IF EXISTS {FTS_TABLE}"]
+
+
+def install(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_SETUP, 'sqlite': SQLITE_SETUP}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def uninstall(apps, schema_editor):
+    statements = {'postgresql': POSTGRES_TEARDOWN, 'sqlite': SQLITE_TEARDOWN}
+    for sql in statements.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0008_documentembedding_binary_vector'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.2 on 2026-10-18 18:11
+
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def register_hashed_files(apps, schema_editor):
+    """Share one stored copy between documents that already have a content hash"""
+    Document = apps.get_model('documents', 'Document')
+    StoredFile = apps.get_model('documents', 'StoredFile')
+    seen = {}
+    for document in Document.objects.exclude(content_hash='').order_by('created_at', 'id').iterator():
+        stored = seen.get(document.content_hash)
+        if stored is None:
+            seen[document.content_hash] = StoredFile.objects.create(
+                sha256=document.content_hash, name=document.file.name, size=document.file_size, ref_count=1,
+            )
+            continue
+        if document.file.name != stored.name:
+            default_storage.delete(document.file.name)
+            Document.objects.filter(pk=document.pk).update(file=stored.name)
+        stored.ref_count += 1
+        stored.save(update_fields=['ref_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0012_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('name', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='document',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(register_hashed_files, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.0.2 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+def index_existing_content(apps, schema_editor):
+    """Build line indexes for documents extracted before pages were tracked"""
+    from documents.content import build_content_index
+    
+    Document = apps.get_model('documents', 'Document')
+    documents = Document.objects.exclude(content__isnull=True).only('id', 'content')
+    for document in documents.iterator(chunk_size=100):
+        Document.objects.filter(pk=document.pk).update(content_index=build_content_index(document.content))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0013_stored_files'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='document',
+            name='content_index',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(index_existing_content, migrations.RunPython.noop),
+    ]
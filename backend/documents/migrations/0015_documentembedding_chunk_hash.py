@@ -0,0 +1,36 @@
+# Generated by Django 5.0.2 on 2026-10-18 19:02
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def hash_existing_chunks(apps, schema_editor):
+    """Hash the chunks embedded before hashes were stored, so re-ingestion can keep them"""
+    DocumentEmbedding = apps.get_model('documents', 'DocumentEmbedding')
+    rows = DocumentEmbedding.objects.filter(chunk_hash='').only('id', 'chunk_text')
+    batch = []
+    for row in rows.iterator(chunk_size=1000):
+        # The same hash as documents.embeddings.chunk_hash, inlined so later changes there don't alter this migration
+        row.chunk_hash = hashlib.sha256(row.chunk_text.encode('utf-8')).hexdigest()
+        batch.append(row)
+        if len(batch) == 1000:
+            DocumentEmbedding.objects.bulk_update(batch, ['chunk_hash'])
+            batch = []
+    DocumentEmbedding.objects.bulk_update(batch, ['chunk_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0014_document_content_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentembedding',
+            name='chunk_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.RunPython(hash_existing_chunks, migrations.RunPython.noop),
+    ]
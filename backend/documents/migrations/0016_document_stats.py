@@ -0,0 +1,59 @@
+# Generated by Django 5.0.2 on 2026-10-18 18:50
+
+from collections import defaultdict
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def count_existing_documents(apps, schema_editor):
+    """Start the statistics from the documents already stored"""
+    Document = apps.get_model('documents', 'Document')
+    DocumentStat = apps.get_model('documents', 'DocumentStat')
+    counters = defaultdict(lambda: [0, 0])
+    grouped = (
+        Document.objects.order_by()
+        .values_list('uploaded_by_id', 'status', 'file_type')
+        .annotate(count=Count('id'), size=Sum('file_size'))
+    )
+    for owner_id, status, file_type, count, size in grouped:
+        for key in ('total', f'status:{status}', f'type:{file_type}'):
+            for scope in (owner_id, None):
+                counters[scope, key][0] += count
+                counters[scope, key][1] += size or 0
+    DocumentStat.objects.bulk_create(
+        DocumentStat(user_id=owner_id, key=key, count=count, total_size=size)
+        for (owner_id, key), (count, size) in counters.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0015_documentembedding_chunk_hash'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=80)),
+                ('count', models.BigIntegerField(default=0)),
+                ('total_size', models.BigIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='document_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='documentstat',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user', 'key'), name='documents_stat_user_key_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='documentstat',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('key',), name='documents_stat_global_key_unique'),
+        ),
+        migrations.RunPython(count_existing_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.2 on 2026-10-18 19:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0016_document_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='documentstat',
+            name='documents_stat_global_key_unique',
+        ),
+        migrations.AddField(
+            model_name='documentstat',
+            name='shard',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddConstraint(
+            model_name='documentstat',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', True)), fields=('key', 'shard'), name='documents_stat_global_key_shard_unique'),
+        ),
+    ]
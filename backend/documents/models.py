@@ -3,6 +3,12 @@ from django.conf import settings
 import uuid
 import os
 from django.utils import timezone
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import response_cache, search, stats, vector_index
+from .fields import VectorField
 
 
 def document_file_path(instance, filename):
@@ -12,6 +18,56 @@ def document_file_path(instance, filename):
     return os.path.join('documents', filename)
 
 
+class DocumentQuerySet(models.QuerySet):
+    """Keeps the document statistics in step with bulk writes, see documents.stats"""
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        with transaction.atomic(using=self.db, savepoint=False):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            stats.record_created(objs)
+        return objs
+    
+    def update(self, **kwargs):
+        counted = {field: kwargs[field] for field in stats.COUNTED_FIELDS if field in kwargs}
+        if 'uploaded_by_id' in kwargs:
+            counted['uploaded_by'] = kwargs['uploaded_by_id']
+        if not counted:
+            return super().update(**kwargs)
+        if 'uploaded_by' in counted and isinstance(counted['uploaded_by'], models.Model):
+            counted['uploaded_by'] = counted['uploaded_by'].pk
+        
+        expressions = any(hasattr(value, 'resolve_expression') for value in counted.values())
+        with transaction.atomic(using=self.db, savepoint=False):
+            # Locked, so what the rows are counted as can't change until the deltas are applied
+            rows = list(self.select_for_update().order_by('pk').values_list('pk', *stats.COUNTED_COLUMNS))
+            updated = 0
+            new_rows = []
+            for start in range(0, len(rows), stats.LOCK_BATCH_SIZE):
+                pks = [row[0] for row in rows[start:start + stats.LOCK_BATCH_SIZE]]
+                # Only the locked rows, not any matching rows inserted since
+                locked = models.QuerySet(self.model, using=self.db).filter(pk__in=pks)
+                updated += locked.update(**kwargs)
+                if expressions:
+                    # Only the database knows the new values
+                    new_rows += locked.order_by('pk').values_list(*stats.COUNTED_COLUMNS)
+            if not expressions:
+                new_rows = [stats.updated_row(row[1:], counted) for row in rows]
+            stats.record_changed([row[1:] for row in rows], new_rows)
+        return updated
+    
+    def delete(self):
+        with transaction.atomic(using=self.db, savepoint=False):
+            rows = list(self.select_for_update().order_by().values_list('pk', *stats.COUNTED_COLUMNS))
+            deleted = super().delete()
+            stats.record_deleted([row[1:] for row in rows])
+            vector_index.forget(document_ids=[row[0] for row in rows])
+        return deleted
+    
+    delete.alters_data = True
+    delete.queryset_only = True
+    update.alters_data = True
+
+
 class Document(models.Model):
     """Document model for storing document information"""
     
@@ -27,7 +83,9 @@ class Document(models.Model):
     file = models.FileField(upload_to=document_file_path)
     file_size = models.BigIntegerField(default=0)  # Size in bytes
     file_type = models.CharField(max_length=50, blank=True)  # File extension/type
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)  # SHA-256 of the file
     content = models.TextField(blank=True, null=True)  # Extracted text content
+    content_index = models.JSONField(default=dict, blank=True)  # Line and page offsets, see documents.content
     uploaded_by = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         on_delete=models.CASCADE,
@@ -38,24 +96,207 @@ class Document(models.Model):
     last_accessed = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     
+    objects = DocumentQuerySet.as_manager()
+    
     def __str__(self):
         return self.title
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the document is counted as, so saves that leave it alone skip reading it back
+        if set(stats.COUNTED_COLUMNS).issubset(field_names):
+            instance._counted_row = stats.counted_row(instance)
+        return instance
+    
     def save(self, *args, **kwargs):
-        """Update file size and type when saving"""
-        if self.file:
-            self.file_size = self.file.size
-            filename = self.file.name
-            self.file_type = filename.split('.')[-1].lower() if '.' in filename else ''
-        super().save(*args, **kwargs)
+        """Update file size and type, and store a new file by its content hash"""
+        if not self.file or self.file._committed:
+            # Stored files keep the size recorded at upload
+            if self.file and not self.file_type:
+                self.file_type = self._extension(self.file.name)
+            self._save_counted(*args, **kwargs)
+            return
+        
+        from . import blobs
+        self.file_size = self.file.size
+        self.file_type = self._extension(self.file.name)
+        replaced = None
+        if self.pk:
+            replaced = Document.objects.filter(pk=self.pk).values_list('content_hash', flat=True).first()
+        with transaction.atomic():
+            blobs.acquire(self)
+            self._save_counted(*args, **kwargs)
+            if replaced and replaced != self.content_hash:
+                blobs.release(replaced)
+    
+    def _save_counted(self, *args, **kwargs):
+        """Save, updating the document statistics in the same transaction"""
+        update_fields = kwargs.get('update_fields')
+        new_row = stats.counted_row(self)
+        if not self._state.adding and (
+            # Left as loaded, or not saved: the stored row needn't be read back and locked
+            getattr(self, '_counted_row', None) == new_row
+            or update_fields is not None
+            and not set(stats.COUNTED_FIELDS + stats.COUNTED_COLUMNS).intersection(update_fields)
+        ):
+            super().save(*args, **kwargs)
+            return
+        with transaction.atomic():
+            old_row = None
+            if not self._state.adding:
+                # Counted as stored, which may differ from what this instance was loaded with
+                old_row = Document.objects.select_for_update().filter(pk=self.pk).values_list(
+                    *stats.COUNTED_COLUMNS
+                ).first()
+            super().save(*args, **kwargs)
+            if update_fields is not None and old_row is not None:
+                # Fields left out of the save keep their stored values
+                saved = set(update_fields)
+                new_row = tuple(
+                    new if saved.intersection(names) else old
+                    for names, old, new in zip(zip(stats.COUNTED_FIELDS, stats.COUNTED_COLUMNS), old_row, new_row)
+                )
+            if old_row is None:
+                stats.record_created([self])
+            elif old_row != new_row:
+                stats.record_changed([old_row], [new_row])
+        self._counted_row = new_row
+    
+    @staticmethod
+    def _extension(filename):
+        return filename.split('.')[-1].lower() if '.' in filename else ''
     
     def record_access(self):
-        """Record when a document is accessed"""
+        """
+        Record when a document is accessed. The timestamp is buffered and
+        written in batches by ``documents.access.recorder``.
+        """
+        from .access import recorder
         self.last_accessed = timezone.now()
-        self.save(update_fields=['last_accessed'])
+        recorder.record(self.pk, self.last_accessed)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination over each of DocumentViewSet.ordering_fields
+            models.Index(fields=['created_at', 'id'], name='documents_created_keyset_idx'),
+            models.Index(fields=['updated_at', 'id'], name='documents_updated_keyset_idx'),
+            models.Index(fields=['title', 'id'], name='documents_title_keyset_idx'),
+            models.Index(fields=['last_accessed', 'id'], name='documents_accessed_keyset_idx'),
+            # Editors' listings and status filters, newest first
+            models.Index(fields=['uploaded_by', '-created_at', '-id'], name='documents_owner_created_idx'),
+            models.Index(fields=['status', '-created_at', '-id'], name='documents_status_created_idx'),
+            # The recent action only ever reads accessed documents
+            models.Index(
+                fields=['-last_accessed', '-id'],
+                condition=models.Q(last_accessed__isnull=False),
+                name='documents_recent_idx'
+            ),
+        ]
+
+
+# Keep the full-text index in step with the searchable fields
+@receiver(post_save, sender=Document)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or search.INDEXED_FIELDS.intersection(update_fields):
+        search.update_index(instance)
+
+
+@receiver(post_delete, sender=Document)
+def remove_search_index(sender, instance, **kwargs):
+    search.remove_from_index(instance.pk)
+
+
+# Expire cached responses that include the document
+@receiver(post_save, sender=Document)
+@receiver(post_delete, sender=Document)
+def invalidate_document_responses(sender, instance, **kwargs):
+    response_cache.invalidate([instance.pk])
+
+
+def _deleting_owner(origin):
+    """Whether a delete started at a user (or users), taking their documents along"""
+    owner = origin if isinstance(origin, models.Model) else getattr(origin, 'model', None)
+    return owner is not None and owner._meta.label == settings.AUTH_USER_MODEL
+
+
+@receiver(post_delete, sender=Document)
+def count_deleted_document(sender, instance, origin=None, **kwargs):
+    # Queryset deletes count theirs at once
+    if getattr(origin, 'model', None) is Document:
+        return
+    stats.record_deleted([stats.counted_row(instance)], owner_deleted=_deleting_owner(origin))
+
+
+@receiver(post_delete, sender=Document)
+def forget_document_vectors(sender, instance, origin=None, **kwargs):
+    # Queryset deletes and deleted owners forget their documents at once
+    if getattr(origin, 'model', None) is Document or _deleting_owner(origin):
+        return
+    vector_index.forget(document_ids=[instance.pk])
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def forget_owner_vectors(sender, instance, **kwargs):
+    vector_index.forget(document_ids=instance.documents.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Document)
+def release_stored_file(sender, instance, **kwargs):
+    from . import blobs
+    blobs.release(instance.content_hash)
+
+
+class StoredFile(models.Model):
+    """A stored file shared by every document with the same content"""
+    
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    name = models.CharField(max_length=255)  # Storage name of the file
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.name} ({self.ref_count} reference(s))"
+
+
+class DocumentStat(models.Model):
+    """
+    A maintained count and total size of documents, of one owner or a shard
+    of every document (``user`` is null), for one key: ``total``,
+    ``status:<status>`` or ``type:<file_type>``. Kept up to date by
+    ``documents.stats``.
+    """
+    
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='document_stats'
+    )
+    key = models.CharField(max_length=80)
+    shard = models.PositiveSmallIntegerField(default=0)  # Global counters only, see documents.stats
+    count = models.BigIntegerField(default=0)
+    total_size = models.BigIntegerField(default=0)  # Sum of file_size in bytes
+    
+    def __str__(self):
+        return f"{self.key} of {self.user_id or f'all ({self.shard})'}: {self.count}"
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'key'],
+                condition=models.Q(user__isnull=False),
+                name='documents_stat_user_key_unique'
+            ),
+            models.UniqueConstraint(
+                fields=['key', 'shard'],
+                condition=models.Q(user__isnull=True),
+                name='documents_stat_global_key_shard_unique'
+            ),
+        ]
 
 
 class DocumentEmbedding(models.Model):
@@ -67,12 +308,117 @@ class DocumentEmbedding(models.Model):
         related_name='embeddings'
     )
     chunk_text = models.TextField()
-    embedding = models.JSONField(null=True, blank=True)
+    chunk_hash = models.CharField(max_length=64, blank=True)  # SHA-256 of chunk_text
+    embedding = VectorField(null=True, blank=True)  # float32 bytes
+    dimensions = models.PositiveSmallIntegerField(default=0)
     chunk_index = models.IntegerField()
     created_at = models.DateTimeField(auto_now_add=True)
     
     def __str__(self):
         return f"Embedding for {self.document.title} - Chunk {self.chunk_index}"
     
+    def save(self, *args, **kwargs):
+        """Keep the dimension metadata in sync with the vector"""
+        self.dimensions = len(self.embedding) if self.embedding is not None else 0
+        super().save(*args, **kwargs)
+    
     class Meta:
         ordering = ['document', 'chunk_index']
+
+
+@receiver(post_save, sender=DocumentEmbedding)
+@receiver(post_delete, sender=DocumentEmbedding)
+def invalidate_embedding_responses(sender, instance, origin=None, **kwargs):
+    # Deleting a document already expires its responses, once rather than per chunk,
+    # and so do bulk deletes of chunks
+    if isinstance(origin, Document) or getattr(origin, 'model', None) in (Document, DocumentEmbedding):
+        return
+    response_cache.invalidate([instance.document_id], listings=False)
+
+
+class IngestionJob(models.Model):
+    """Durable queue entry for a single document ingestion run"""
+    
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    
+    document = models.ForeignKey(
+        Document,
+        on_delete=models.CASCADE,
+        related_name='ingestion_jobs'
+    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Ingestion job {self.pk} for {self.document_id} ({self.status})"
+    
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='documents_job_claim_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """A resumable upload whose parts are stored until it is completed"""
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='upload_sessions'
+    )
+    filename = models.CharField(max_length=255)
+    title = models.CharField(max_length=255, blank=True)
+    description = models.TextField(blank=True, null=True)
+    size = models.BigIntegerField(null=True, blank=True)  # Declared total size, if known
+    received = models.BigIntegerField(default=0)  # Bytes stored so far
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload {self.pk} of {self.filename} ({self.received} bytes)"
+    
+    class Meta:
+        ordering = ['-created_at']
+
+
+class UploadPart(models.Model):
+    """One stored chunk of an upload session"""
+    
+    session = models.ForeignKey(
+        UploadSession,
+        on_delete=models.CASCADE,
+        related_name='parts'
+    )
+    offset = models.BigIntegerField()
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64)
+    name = models.CharField(max_length=255)  # Storage name of the chunk
+    
+    def __str__(self):
+        return f"Part at {self.offset} of upload {self.session_id}"
+    
+    class Meta:
+        ordering = ['session', 'offset']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'offset'], name='documents_upload_part_offset_unique'),
+        ]
+
+
+@receiver(post_delete, sender=UploadPart)
+def delete_upload_part_file(sender, instance, **kwargs):
+    name = instance.name
+    transaction.on_commit(lambda: default_storage.delete(name))
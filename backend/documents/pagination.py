@@ -0,0 +1,168 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the ordering field plus the primary key.
+
+    Each page is fetched with ``WHERE (field, id) < (last_field, last_id)``
+    instead of ``OFFSET``, so every page costs the same as the first, and no
+    ``COUNT(*)`` is issued. The ordering comes from the view's
+    ``keyset_ordering`` if set, otherwise from the ``ordering`` query
+    parameter restricted to the view's ``ordering_fields``.
+    """
+
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+    page_size_query_param = 'page_size'
+    page_size = 10
+    max_page_size = 100
+    default_ordering = '-created_at'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, request, view):
+        """Return ``(field, descending)`` for this request"""
+        ordering = getattr(view, 'keyset_ordering', None)
+        if ordering is None:
+            ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+            allowed = getattr(view, 'ordering_fields', None) or []
+            if ordering.lstrip('-') not in allowed:
+                raise ValidationError({self.ordering_query_param: f"Cannot order by '{ordering}'."})
+        return ordering.lstrip('-'), ordering.startswith('-')
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request, field, descending):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            if cursor['f'] != field or cursor['d'] != descending:
+                raise ValueError("Cursor belongs to a different ordering")
+            return cursor['v'], int(cursor['k'])
+        except (ValueError, TypeError, KeyError, UnicodeEncodeError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, field, descending, value, key):
+        payload = json.dumps({'f': field, 'd': descending, 'v': value, 'k': key}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        return self._set_page(list(self.page_queryset(queryset, request, view)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """``paginate_queryset`` with the page fetched by the async ORM"""
+        return self._set_page([row async for row in self.page_queryset(queryset, request, view)])
+
+    def page_queryset(self, queryset, request, view):
+        """The query for the requested page, plus one row to tell whether another follows"""
+        self.request = request
+        field, descending = self.get_ordering(request, view)
+        model_field = queryset.model._meta.get_field(field)
+        self.field, self.descending = field, descending
+
+        # Rows keep the database's natural NULL placement so a plain
+        # (field, id) index can be scanned in either direction
+        descending_prefix = '-' if descending else ''
+        queryset = queryset.order_by(f'{descending_prefix}{field}', f'{descending_prefix}{self.tiebreaker}')
+        nulls_last = descending != connections[queryset.db].features.nulls_order_largest
+
+        cursor = self.decode_cursor(request, field, descending)
+        if cursor is not None:
+            raw_value, key = cursor
+            after = 'lt' if descending else 'gt'
+            if raw_value is None:
+                position = Q(**{f'{field}__isnull': True, f'{self.tiebreaker}__{after}': key})
+                if not nulls_last:
+                    position |= Q(**{f'{field}__isnull': False})
+            else:
+                try:
+                    value = model_field.to_python(raw_value)
+                except Exception:
+                    raise NotFound(self.invalid_cursor_message)
+                position = Q(**{f'{field}__{after}': value}) | Q(**{field: value, f'{self.tiebreaker}__{after}': key})
+                if model_field.null and nulls_last:
+                    position |= Q(**{f'{field}__isnull': True})
+            queryset = queryset.filter(position)
+
+        self.page_size = self.get_page_size(request)
+        return queryset[:self.page_size + 1]
+
+    def _set_page(self, rows):
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        value = getattr(last, self.field)
+        if value is not None and not isinstance(value, (str, int, float)):
+            value = value.isoformat()
+        cursor = self.encode_cursor(self.field, self.descending, value, getattr(last, self.tiebreaker))
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """``PageNumberPagination`` that can also fetch its page with the async ORM"""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Counted up front so the paginator never queries synchronously
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            number = paginator.validate_number(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        # Same bounds as Paginator.page()
+        bottom = (number - 1) * page_size
+        top = bottom + page_size
+        if top + paginator.orphans >= paginator.count:
+            top = paginator.count
+        rows = [row async for row in queryset[bottom:top]]
+        self.page = paginator._get_page(rows, number, paginator)
+        if paginator.num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        return rows
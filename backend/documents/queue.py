@@ -0,0 +1,156 @@
+"""
+Database-backed ingestion queue.
+
+Jobs are rows in ``IngestionJob``. Web requests only enqueue; the
+``ingestion_worker`` management command claims jobs with row locking and
+runs them, so ingestion capacity scales with the number of worker processes.
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import events, metrics, response_cache
+from .conf import get_setting
+from .ingestion import process_document
+from .models import Document, IngestionJob
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_ingestion(document):
+    """Mark a document as processing and queue an ingestion job for it"""
+    with transaction.atomic():
+        document.status = 'processing'
+        document.save(update_fields=['status', 'updated_at'])
+        events.publish_status(document.pk, document.status)
+        return IngestionJob.objects.create(
+            document=document,
+            max_attempts=get_setting('INGESTION_MAX_ATTEMPTS'),
+        )
+
+
+def enqueue_ingestion_many(document_ids):
+    """Mark many documents as processing and queue their jobs in one transaction"""
+    with transaction.atomic():
+        Document.objects.filter(pk__in=document_ids).update(status='processing', updated_at=timezone.now())
+        IngestionJob.objects.bulk_create(
+            IngestionJob(document_id=document_id, max_attempts=get_setting('INGESTION_MAX_ATTEMPTS'))
+            for document_id in document_ids
+        )
+        response_cache.invalidate(document_ids)
+        events.publish_statuses(document_ids, 'processing')
+
+
+def claim_jobs(worker_id, limit):
+    """
+    Claim up to ``limit`` runnable jobs for ``worker_id``.
+
+    Candidate rows are locked with ``SKIP LOCKED`` where the database supports
+    it; the conditional update on ``status`` keeps claims exclusive on
+    databases without row locks (SQLite serialises the write instead).
+    """
+    if limit <= 0:
+        return []
+
+    now = timezone.now()
+    with transaction.atomic():
+        candidate_ids = list(
+            IngestionJob.objects.select_for_update(skip_locked=True)
+            .filter(status='queued', run_after__lte=now)
+            .order_by('run_after', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+        if not candidate_ids:
+            return []
+        IngestionJob.objects.filter(id__in=candidate_ids, status='queued').update(
+            status='running',
+            locked_by=worker_id,
+            locked_at=now,
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+
+    return list(
+        IngestionJob.objects.filter(id__in=candidate_ids, status='running', locked_by=worker_id)
+    )
+
+
+def run_job(job):
+    """Run a claimed job, recording success or scheduling a retry"""
+    try:
+        process_document(job.document_id)
+    except Document.DoesNotExist:
+        # The document was deleted after the job was queued
+        IngestionJob.objects.filter(pk=job.pk).delete()
+        metrics.INGESTION_JOBS.inc(result='deleted')
+    except Exception as exc:
+        logger.exception("Ingestion job %s failed", job.pk)
+        _fail_job(job, exc)
+        metrics.INGESTION_JOBS.inc(result='error')
+    else:
+        job.status = 'completed'
+        job.last_error = ''
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+        metrics.INGESTION_JOBS.inc(result='completed')
+
+
+def _fail_job(job, exc):
+    """Requeue a failed job with exponential backoff, or give up on it"""
+    job.last_error = str(exc)
+    if job.attempts < job.max_attempts:
+        backoff = get_setting('INGESTION_RETRY_BACKOFF') * 2 ** (job.attempts - 1)
+        job.status = 'queued'
+        job.run_after = timezone.now() + timedelta(seconds=backoff)
+        job.save(update_fields=['status', 'run_after', 'last_error', 'updated_at'])
+        return
+
+    with transaction.atomic():
+        job.status = 'failed'
+        job.save(update_fields=['status', 'last_error', 'updated_at'])
+        Document.objects.filter(pk=job.document_id).update(status='failed', updated_at=timezone.now())
+        response_cache.invalidate([job.document_id])
+        events.publish_status(job.document_id, 'failed')
+
+
+def recover_stale_jobs():
+    """
+    Requeue jobs whose worker stopped heartbeating and re-enqueue documents
+    left in ``processing`` without any live job.
+
+    Returns the number of jobs recovered.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=get_setting('INGESTION_STALE_AFTER'))
+    recovered = 0
+
+    with transaction.atomic():
+        stale = IngestionJob.objects.select_for_update(skip_locked=True).filter(
+            status='running', locked_at__lt=cutoff
+        )
+        for job in stale:
+            if job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.run_after = now
+            else:
+                job.status = 'failed'
+                Document.objects.filter(pk=job.document_id).update(status='failed', updated_at=now)
+                response_cache.invalidate([job.document_id])
+                events.publish_status(job.document_id, 'failed')
+            job.last_error = f"Worker {job.locked_by} did not finish the job"
+            job.locked_by = ''
+            job.save(update_fields=['status', 'run_after', 'last_error', 'locked_by', 'updated_at'])
+            recovered += 1
+
+    orphaned = Document.objects.filter(status='processing').exclude(
+        ingestion_jobs__status__in=['queued', 'running']
+    )
+    jobs = [
+        IngestionJob(document=document, max_attempts=get_setting('INGESTION_MAX_ATTEMPTS'))
+        for document in orphaned.only('id')
+    ]
+    IngestionJob.objects.bulk_create(jobs)
+
+    return recovered + len(jobs)
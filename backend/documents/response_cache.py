@@ -0,0 +1,214 @@
+"""
+Versioned response cache for document reads.
+
+``list``, ``recent`` and ``retrieve`` responses are cached under keys built
+from the action, the user's role and visibility scope (the same split as
+``DocumentViewSet.get_queryset``), the request URL and the current values
+of the version keys the response depends on. Writes never delete entries;
+they bump the versions, which orphans every dependent entry at once:
+
+* the listings version, bumped whenever any document changes,
+* a per-document version, bumped when that document or its embeddings
+  change or its buffered ``last_accessed`` time is flushed,
+* the access version, bumped when buffered ``last_accessed`` times are
+  flushed; only listings ordered by them (``recent``, or ``list`` with
+  ``ordering=last_accessed``) depend on it. Other listings may show
+  ``last_accessed`` times up to ``RESPONSE_CACHE_TIMEOUT`` old, rather than
+  being dropped on every flush.
+
+Versions are bumped when the write happens and again after the surrounding
+transaction commits, so a response cached from the pre-commit data in
+between is orphaned too. The cache is the one named by
+``RESPONSE_CACHE_ALIAS``. Versions only reach the processes that share it,
+so unless ``RESPONSE_CACHE_TIMEOUT`` is set, responses are only cached when
+that is a shared backend (database, Redis, Memcached, ...): with per-process
+local memory the ingestion worker's and other web workers' writes would go
+unseen. The validator headers of a cached response are kept with it, so
+conditional requests are answered from the cache as well.
+"""
+import asyncio
+import functools
+import hashlib
+import time
+
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+from .conf import get_setting
+
+KEY_PREFIX = 'documents'
+LISTINGS_VERSION = f'{KEY_PREFIX}:version:listings'
+ACCESS_VERSION = f'{KEY_PREFIX}:version:access'
+
+# Response headers stored with the data and sent again on every hit
+KEPT_HEADERS = ('ETag', 'Last-Modified', 'Cache-Control')
+
+# Seconds responses are cached for when RESPONSE_CACHE_TIMEOUT is None and the cache is shared
+SHARED_TIMEOUT = 300
+
+# Backends whose entries, and so whose version bumps, stay in one process
+PROCESS_LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def document_version(document_id):
+    return f'{KEY_PREFIX}:version:document:{document_id}'
+
+
+def get_cache():
+    return caches[get_setting('RESPONSE_CACHE_ALIAS')]
+
+
+def cache_timeout():
+    """Seconds to cache responses for, or 0 when the cache is off"""
+    timeout = get_setting('RESPONSE_CACHE_TIMEOUT')
+    if timeout is None:
+        return 0 if isinstance(get_cache(), PROCESS_LOCAL_BACKENDS) else SHARED_TIMEOUT
+    return timeout
+
+
+def _new_version():
+    # Never reuse a value, so entries cached before a version key was evicted stay orphaned
+    return time.time_ns()
+
+
+def get_versions(keys):
+    """Return the current value of each version key, creating missing ones"""
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(keys):
+    """``get_versions`` for async views"""
+    cache = get_cache()
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, _new_version(), None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def bump(keys):
+    """Give each version key a new value"""
+    if keys:
+        get_cache().set_many(dict.fromkeys(keys, _new_version()), None)
+
+
+def invalidate(document_ids=(), listings=True):
+    """Expire cached responses for documents, now and again on commit"""
+    keys = [document_version(pk) for pk in document_ids]
+    if listings:
+        keys.append(LISTINGS_VERSION)
+    bump(keys)
+    if transaction.get_connection().in_atomic_block:
+        # Responses cached from another connection before the commit are stale too
+        transaction.on_commit(lambda: bump(keys))
+
+
+def visibility_scope(user):
+    """The part of the cache key that mirrors DocumentViewSet.get_queryset"""
+    if user.is_admin or user.role == 'viewer':
+        return 'all'
+    return f'owner:{user.pk}'
+
+
+def listing_versions(request, **kwargs):
+    if 'last_accessed' in request.query_params.get('ordering', ''):
+        return [LISTINGS_VERSION, ACCESS_VERSION]
+    return [LISTINGS_VERSION]
+
+
+def recent_versions(request, **kwargs):
+    return [LISTINGS_VERSION, ACCESS_VERSION]
+
+
+def document_versions(request, pk=None, **kwargs):
+    return [document_version(pk)]
+
+
+def _response_key(view, request, versions):
+    user = request.user
+    url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    parts = [
+        view.action, user.role, visibility_scope(user), request.accepted_renderer.format, *versions, url,
+    ]
+    return f'{KEY_PREFIX}:response:' + ':'.join(str(part) for part in parts)
+
+
+def _cached(request, entry):
+    """The response for a cache entry, or ``304`` if the client already has it"""
+    data, headers = entry
+    response = get_conditional_response(
+        request, etag=headers.get('ETag'),
+        last_modified=parse_http_date_safe(headers.get('Last-Modified', '')),
+    ) or Response(data)
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def _entry(response):
+    headers = {name: response[name] for name in KEPT_HEADERS if response.has_header(name)}
+    return response.data, headers
+
+
+def cached_response(versions, on_hit=None):
+    """
+    Cache the ``200`` responses of a viewset method, sync or async.
+
+    ``versions(request, **kwargs)`` names the version keys the response
+    depends on. ``on_hit(view, request, **kwargs)`` runs when a response is
+    served from the cache, for side effects the skipped method would have had.
+    """
+    def decorator(method):
+        if asyncio.iscoroutinefunction(method):
+            @functools.wraps(method)
+            async def async_wrapper(self, request, *args, **kwargs):
+                timeout = cache_timeout()
+                if not timeout:
+                    return await method(self, request, *args, **kwargs)
+
+                key = _response_key(self, request, await aget_versions(versions(request, **kwargs)))
+                cache = get_cache()
+                entry = await cache.aget(key)
+                if entry is not None:
+                    if on_hit is not None:
+                        on_hit(self, request, **kwargs)
+                    return _cached(request, entry)
+
+                response = await method(self, request, *args, **kwargs)
+                if response.status_code == 200:
+                    await cache.aset(key, _entry(response), timeout)
+                return response
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            timeout = cache_timeout()
+            if not timeout:
+                return method(self, request, *args, **kwargs)
+
+            key = _response_key(self, request, get_versions(versions(request, **kwargs)))
+            cache = get_cache()
+            entry = cache.get(key)
+            if entry is not None:
+                if on_hit is not None:
+                    on_hit(self, request, **kwargs)
+                return _cached(request, entry)
+
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, _entry(response), timeout)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,118 @@
+"""
+Full-text search over document title, description and extracted content.
+
+PostgreSQL keeps a generated, weighted ``tsvector`` column with a GIN index
+(created by migration 0009, not declared on the model). SQLite keeps an FTS5
+table keyed by document id, updated from the ``post_save``/``post_delete``
+signals when the indexed fields change. Other databases fall back to
+``icontains`` matching without ranking.
+"""
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, TextField, Value
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import BaseFilterBackend
+
+FTS_TABLE = 'documents_document_fts'
+INDEXED_FIELDS = {'title', 'description', 'content'}
+SNIPPET_START, SNIPPET_STOP = '<mark>', '</mark>'
+
+# PostgreSQL rejects tsvectors over 1MB, so only the start of huge contents is indexed
+PG_CONTENT_LIMIT = 500000
+
+
+def update_index(document):
+    """Refresh the SQLite FTS row for ``document`` (PostgreSQL maintains itself)"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [document.pk])
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description, content) VALUES (%s, %s, %s, %s)",
+            [document.pk, document.title, document.description or '', document.content or ''],
+        )
+
+
+def add_to_index(documents):
+    """Add SQLite FTS rows for newly created ``documents`` in one statement"""
+    if connection.vendor != 'sqlite' or not documents:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE}(rowid, title, description, content) VALUES (%s, %s, %s, %s)",
+            [(document.pk, document.title, document.description or '', document.content or '')
+             for document in documents],
+        )
+
+
+def remove_from_index(document_id):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [document_id])
+
+
+def _fts5_query(query):
+    """Turn free text into an FTS5 query that ANDs every word as a literal"""
+    words = re.findall(r'\w+', query)
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def search_documents(queryset, query):
+    """
+    Filter ``queryset`` to documents matching ``query``, best match first.
+
+    Results are annotated with ``rank`` (higher is better) and ``snippet``,
+    a fragment of the best matching field with the hits wrapped in ``<mark>``.
+    """
+    vendor = connection.vendor
+    if vendor == 'postgresql':
+        tsquery = "websearch_to_tsquery('english', %s)"
+        headline = (
+            f"ts_headline('english', coalesce(documents_document.description, '') || ' ' || "
+            f"left(coalesce(documents_document.content, ''), {PG_CONTENT_LIMIT}), {tsquery}, "
+            f"'StartSel={SNIPPET_START}, StopSel={SNIPPET_STOP}, MaxFragments=2, MaxWords=20')"
+        )
+        return queryset.annotate(
+            rank=RawSQL(f"ts_rank_cd(documents_document.search_vector, {tsquery})", [query], output_field=FloatField()),
+            snippet=RawSQL(headline, [query], output_field=TextField()),
+        ).filter(
+            id__in=RawSQL(f"SELECT id FROM documents_document WHERE search_vector @@ {tsquery}", [query])
+        ).order_by('-rank', '-id')
+
+    if vendor == 'sqlite':
+        match = _fts5_query(query)
+        if not match:
+            return queryset.none()
+        correlated = f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND rowid = documents_document.id"
+        return queryset.annotate(
+            # bm25() is lower-is-better; weight title over description over content
+            rank=RawSQL(f"(SELECT -bm25({FTS_TABLE}, 10.0, 5.0, 1.0) {correlated})", [match], output_field=FloatField()),
+            snippet=RawSQL(
+                f"(SELECT snippet({FTS_TABLE}, -1, '{SNIPPET_START}', '{SNIPPET_STOP}', '...', 20) {correlated})",
+                [match], output_field=TextField(),
+            ),
+        ).filter(
+            id__in=RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+        ).order_by('-rank', '-id')
+
+    matches = Q()
+    for field in INDEXED_FIELDS:
+        matches |= Q(**{f'{field}__icontains': query})
+    return queryset.filter(matches).annotate(
+        rank=Value(0.0, output_field=FloatField()),
+        snippet=Value('', output_field=TextField()),
+    )
+
+
+class FullTextSearchFilter(BaseFilterBackend):
+    """Ranked full-text search driven by the ``search`` query parameter"""
+
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_documents(queryset, query)
@@ -1,9 +1,26 @@
 from rest_framework import serializers
-from .models import Document, DocumentEmbedding
+from rest_framework.reverse import reverse
+from .conf import get_setting
+from .models import Document, DocumentEmbedding, UploadSession
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# File extensions accepted for upload
+VALID_EXTENSIONS = ['pdf', 'doc', 'docx', 'txt', 'xls', 'xlsx', 'ppt', 'pptx', 'jpg', 'jpeg', 'png']
+
+# Larger files use chunked uploads
+MAX_FILE_SIZE = 10 * 1024 * 1024
+
+
+def validate_extension(filename):
+    """Reject file names whose extension is not in VALID_EXTENSIONS"""
+    ext = filename.split('.')[-1].lower()
+    if ext not in VALID_EXTENSIONS:
+        raise serializers.ValidationError(
+            f"Unsupported file extension. Allowed extensions are: {', '.join(VALID_EXTENSIONS)}"
+        )
+
 
 class DocumentSerializer(serializers.ModelSerializer):
     """Serializer for the Document model"""
@@ -19,17 +36,25 @@ class DocumentSerializer(serializers.ModelSerializer):
     type = serializers.CharField(source='file_type', read_only=True)
     owner = serializers.CharField(source='uploaded_by.email', read_only=True)
     file_url = serializers.SerializerMethodField()
+    download_url = serializers.SerializerMethodField()
+    
+    # The extracted content itself is served in slices by the content action
+    content_url = serializers.SerializerMethodField()
+    content_length = serializers.SerializerMethodField()
+    line_count = serializers.SerializerMethodField()
+    page_count = serializers.SerializerMethodField()
     
     class Meta:
         model = Document
         fields = (
-            'id', 'title', 'name', 'description', 'file', 'file_url', 'uploaded_by', 
-            'created_at', 'updated_at', 'last_accessed', 'status', 'content',
+            'id', 'title', 'name', 'description', 'file', 'file_url', 'download_url', 'uploaded_by', 
+            'created_at', 'updated_at', 'last_accessed', 'status',
+            'content_url', 'content_length', 'line_count', 'page_count',
             'size', 'type', 'owner'
         )
         read_only_fields = (
             'id', 'created_at', 'updated_at', 'status', 'file_size', 
-            'file_type', 'last_accessed', 'content'
+            'file_type', 'last_accessed'
         )
     
     def get_name(self, obj):
@@ -43,19 +68,30 @@ class DocumentSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.file.url)
         return None
     
+    def get_download_url(self, obj):
+        """Get the access-controlled download URL"""
+        return reverse('documents:document-download', args=[obj.pk], request=self.context.get('request'))
+    
+    def get_content_url(self, obj):
+        """Get the URL that streams the extracted content"""
+        return reverse('documents:document-content', args=[obj.pk], request=self.context.get('request'))
+    
+    def get_content_length(self, obj):
+        return obj.content_index.get('length', 0)
+    
+    def get_line_count(self, obj):
+        return obj.content_index.get('line_count', 0)
+    
+    def get_page_count(self, obj):
+        # Content without page breaks is a single page
+        return len(obj.content_index.get('pages') or [0]) if obj.content_index else 0
+    
     def validate_file(self, value):
         """Validate the file extension"""
-        # List of allowed file extensions
-        valid_extensions = ['pdf', 'doc', 'docx', 'txt', 'xls', 'xlsx', 'ppt', 'pptx', 'jpg', 'jpeg', 'png']
-        
-        ext = value.name.split('.')[-1].lower()
-        if ext not in valid_extensions:
-            raise serializers.ValidationError(
-                f"Unsupported file extension. Allowed extensions are: {', '.join(valid_extensions)}"
-            )
+        validate_extension(value.name)
         
-        # Check file size (limit to 10MB)
-        if value.size > 10 * 1024 * 1024:
+        # Check file size (limit to 10MB, larger files use chunked uploads)
+        if value.size > MAX_FILE_SIZE:
             raise serializers.ValidationError("File size cannot exceed 10MB")
             
         return value
@@ -64,10 +100,28 @@ class DocumentSerializer(serializers.ModelSerializer):
 class DocumentEmbeddingSerializer(serializers.ModelSerializer):
     """Serializer for the DocumentEmbedding model"""
     
+    embedding = serializers.SerializerMethodField()
+    
     class Meta:
         model = DocumentEmbedding
-        fields = ('id', 'document', 'chunk_text', 'embedding', 'chunk_index', 'created_at')
-        read_only_fields = ('id', 'created_at')
+        fields = ('id', 'document', 'chunk_text', 'embedding', 'dimensions', 'chunk_index', 'created_at')
+        read_only_fields = ('id', 'dimensions', 'created_at')
+    
+    def get_embedding(self, obj):
+        """Return the stored float32 vector as a list of floats"""
+        return obj.embedding.tolist() if obj.embedding is not None else None
+
+
+class DocumentChunkResultSerializer(serializers.ModelSerializer):
+    """Serializer for a semantic search hit"""
+    
+    document_title = serializers.CharField(source='document.title', read_only=True)
+    score = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = DocumentEmbedding
+        fields = ('id', 'document', 'document_title', 'chunk_index', 'chunk_text', 'score')
+        read_only_fields = fields
 
 
 class DocumentListSerializer(serializers.ModelSerializer):
@@ -93,4 +147,85 @@ class DocumentListSerializer(serializers.ModelSerializer):
     
     def get_name(self, obj):
         """Get the name of the file (using the title or original filename)"""
-        return obj.title 
\ No newline at end of file
+        return obj.title 
+
+
+class DocumentSearchResultSerializer(DocumentListSerializer):
+    """Serializer for a full-text search hit"""
+    
+    rank = serializers.FloatField(read_only=True)
+    snippet = serializers.CharField(read_only=True)
+    
+    class Meta(DocumentListSerializer.Meta):
+        fields = DocumentListSerializer.Meta.fields + ('rank', 'snippet')
+
+
+class BulkDocumentIdsSerializer(serializers.Serializer):
+    """The documents a bulk operation applies to"""
+    
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False)
+    
+    def validate_ids(self, value):
+        """Limit the batch size and drop repeated ids"""
+        limit = get_setting('BULK_MAX_DOCUMENTS')
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} documents can be changed at once")
+        return list(dict.fromkeys(value))
+
+
+class BulkStatusSerializer(BulkDocumentIdsSerializer):
+    """Documents and the status to give them"""
+    
+    # Processing and completed are set by the ingestion queue, which also queues the job
+    status = serializers.ChoiceField(
+        choices=[(value, label) for value, label in Document.STATUS_CHOICES if value in ('pending', 'failed')]
+    )
+
+
+class BulkUploadSerializer(serializers.Serializer):
+    """Files uploaded together, each becoming a document"""
+    
+    files = serializers.ListField(child=serializers.FileField(), allow_empty=False)
+    description = serializers.CharField(required=False, allow_blank=True, default='')
+    ingest = serializers.BooleanField(required=False, default=False)
+    
+    def validate_files(self, value):
+        """Validate every file, reporting the errors of all of them"""
+        limit = get_setting('BULK_MAX_FILES')
+        if len(value) > limit:
+            raise serializers.ValidationError(f"At most {limit} files can be uploaded at once")
+        errors = {}
+        for file in value:
+            try:
+                validate_extension(file.name)
+                if file.size > MAX_FILE_SIZE:
+                    raise serializers.ValidationError("File size cannot exceed 10MB")
+            except serializers.ValidationError as e:
+                errors[file.name] = e.detail
+        if errors:
+            raise serializers.ValidationError(errors)
+        return value
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Serializer for a chunked upload session"""
+    
+    offset = serializers.IntegerField(source='received', read_only=True)
+    
+    class Meta:
+        model = UploadSession
+        fields = ('id', 'filename', 'title', 'description', 'size', 'offset', 'created_at', 'updated_at')
+        read_only_fields = ('id', 'offset', 'created_at', 'updated_at')
+    
+    def validate_filename(self, value):
+        """Validate the file extension"""
+        validate_extension(value)
+        return value
+    
+    def validate_size(self, value):
+        """Validate the declared size against the upload limit"""
+        if value is not None and not 0 < value <= get_setting('UPLOAD_MAX_SIZE'):
+            raise serializers.ValidationError(
+                f"File size must be between 1 and {get_setting('UPLOAD_MAX_SIZE')} bytes"
+            )
+        return value
@@ -0,0 +1,201 @@
+"""
+Maintained document statistics.
+
+``DocumentStat`` keeps a counter row for each owner and key, and for
+everyone (``user`` null) a row per key and shard. The keys are ``total``,
+``status:<status>`` and ``type:<file_type>``, and each row holds a document
+count and the summed ``file_size``. Every write that creates or deletes
+documents, or changes what they are counted as, applies its deltas in the
+same transaction, so the statistics are a read of a few rows however many
+documents there are.
+
+The global counters are split over ``STATS_GLOBAL_SHARDS`` rows per key, an
+owner's documents always counting towards the same shard, so concurrent
+writes by different owners rarely wait on the same row lock; reading them
+sums the shards.
+
+Saves and deletes of single documents are counted by ``Document.save`` and a
+``post_delete`` handler; ``bulk_create``, ``update`` and queryset deletes by
+``DocumentQuerySet``. Changes lock the affected documents with
+``SELECT ... FOR UPDATE`` and count their deltas from the locked rows, so
+racing writes can't make the counters drift; an ``update`` to expressions
+reads the locked rows back to see what they became. Only writes that bypass
+the ORM go uncounted; ``rebuild`` recounts everything from the documents
+table.
+"""
+from collections import defaultdict
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+
+from .conf import get_setting
+
+# Document fields the counters depend on
+COUNTED_FIELDS = ('uploaded_by', 'status', 'file_type', 'file_size')
+COUNTED_COLUMNS = ('uploaded_by_id', 'status', 'file_type', 'file_size')
+
+TOTAL = 'total'
+
+# Counters per UPDATE; SQLite limits how deeply the conditions can nest
+UPDATE_BATCH_SIZE = 200
+
+# Locked documents updated per statement, within SQLite's limit on query parameters
+LOCK_BATCH_SIZE = 500
+
+
+def _keys(status, file_type):
+    return (TOTAL, f'status:{status}', f'type:{file_type}')
+
+
+def _shard(owner_id):
+    return (owner_id or 0) % get_setting('STATS_GLOBAL_SHARDS')
+
+
+def counted_row(document):
+    """What ``document`` is counted as: ``(owner_id, status, file_type, file_size)``"""
+    return (document.uploaded_by_id, document.status, document.file_type, document.file_size)
+
+
+def count_groups(queryset):
+    """
+    The documents of ``queryset`` in one grouped query, as
+    ``(owner_id, status, file_type, count, total_size)`` groups
+    """
+    grouped = (
+        queryset.order_by().values_list(*COUNTED_COLUMNS[:3])
+        .annotate(count=Count('id'), size=Sum('file_size'))
+    )
+    return [(owner_id, status, file_type, count, size or 0) for owner_id, status, file_type, count, size in grouped]
+
+
+def updated_row(row, values):
+    """A counted ``row`` after an update setting the counted fields in ``values``"""
+    return tuple(values.get(field, old) for field, old in zip(COUNTED_FIELDS, row))
+
+
+def deltas(groups, sign=1, owner_deleted=False):
+    """
+    Counter deltas for adding (``sign=1``) or removing (``-1``) the documents
+    in ``(owner_id, status, file_type, count, total_size)`` groups, keyed
+    ``(owner_id, shard, key)``. With ``owner_deleted`` only the global
+    counters change: the owner's rows go with them.
+    """
+    changes = defaultdict(lambda: [0, 0])
+    for owner_id, status, file_type, count, size in groups:
+        scopes = [(None, _shard(owner_id))]
+        if owner_id is not None and not owner_deleted:
+            scopes.append((owner_id, 0))
+        for key in _keys(status, file_type):
+            for owner, shard in scopes:
+                change = changes[owner, shard, key]
+                change[0] += sign * count
+                change[1] += sign * (size or 0)
+    return changes
+
+
+def _groups(rows):
+    return [(owner_id, status, file_type, 1, size) for owner_id, status, file_type, size in rows]
+
+
+def merge(*changes):
+    merged = defaultdict(lambda: [0, 0])
+    for change in changes:
+        for scope_key, (count, size) in change.items():
+            merged[scope_key][0] += count
+            merged[scope_key][1] += size
+    return merged
+
+
+def _condition(owner_id, shard, key):
+    if owner_id is None:
+        return Q(user__isnull=True, shard=shard, key=key)
+    return Q(user_id=owner_id, key=key)
+
+
+def apply(changes):
+    """Add ``{(owner_id, shard, key): [count, size]}`` to the counters, in one query plus one per ``UPDATE_BATCH_SIZE``"""
+    from .models import DocumentStat
+
+    changes = {scope_key: change for scope_key, change in changes.items() if change != [0, 0]}
+    if not changes:
+        return
+    # Counters are created at zero and then updated, so concurrent creators can't lose a delta
+    DocumentStat.objects.bulk_create(
+        [DocumentStat(user_id=owner_id, shard=shard, key=key) for owner_id, shard, key in changes],
+        ignore_conflicts=True,
+    )
+    scope_keys = list(changes)
+    for start in range(0, len(scope_keys), UPDATE_BATCH_SIZE):
+        conditions = {scope_key: _condition(*scope_key) for scope_key in scope_keys[start:start + UPDATE_BATCH_SIZE]}
+        DocumentStat.objects.filter(reduce(or_, conditions.values())).update(
+            count=F('count') + Case(
+                *(When(condition, then=Value(changes[scope_key][0])) for scope_key, condition in conditions.items()),
+                default=Value(0),
+            ),
+            total_size=F('total_size') + Case(
+                *(When(condition, then=Value(changes[scope_key][1])) for scope_key, condition in conditions.items()),
+                default=Value(0),
+            ),
+        )
+
+
+def record_created(documents):
+    apply(deltas(_groups(counted_row(document) for document in documents)))
+
+
+def record_deleted(rows, owner_deleted=False):
+    """Count out documents counted as ``rows``; an owner being deleted takes its own rows along"""
+    apply(deltas(_groups(rows), -1, owner_deleted=owner_deleted))
+
+
+def record_changed(old_rows, new_rows):
+    apply(merge(deltas(_groups(old_rows), -1), deltas(_groups(new_rows))))
+
+
+def summary(user=None):
+    """
+    The statistics of ``user``'s documents, or of every document: the total,
+    and the count and size by status and by file type.
+    """
+    from .models import Document, DocumentStat
+
+    # The global counters are summed over their shards
+    counters = (
+        DocumentStat.objects.filter(user=user).order_by().values_list('key')
+        .annotate(Sum('count'), Sum('total_size'))
+    )
+    result = {
+        'count': 0,
+        'total_size': 0,
+        'by_status': {status: {'count': 0, 'total_size': 0} for status, _ in Document.STATUS_CHOICES},
+        'by_type': {},
+    }
+    for key, count, total_size in counters:
+        if key == TOTAL:
+            result['count'], result['total_size'] = count, total_size
+        elif key.startswith('status:'):
+            result['by_status'][key[len('status:'):]] = {'count': count, 'total_size': total_size}
+        elif count:
+            result['by_type'][key[len('type:'):]] = {'count': count, 'total_size': total_size}
+    return result
+
+
+def count_documents(Document):
+    """Counter values, keyed ``(owner_id, shard, key)``, computed from the documents table"""
+    return merge(deltas(count_groups(Document.objects.all())))
+
+
+def rebuild():
+    """Recount every counter from the documents table; returns the number of counters"""
+    from .models import Document, DocumentStat
+
+    with transaction.atomic():
+        counters = count_documents(Document)
+        DocumentStat.objects.all().delete()
+        DocumentStat.objects.bulk_create(
+            DocumentStat(user_id=owner_id, shard=shard, key=key, count=count, total_size=size)
+            for (owner_id, shard, key), (count, size) in counters.items()
+        )
+    return len(counters)
@@ -1,13 +1,63 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework import status
 from django.urls import reverse
-from .models import Document, DocumentEmbedding
+from django.utils import timezone
+from . import extractors, metrics, stats
+from .access import AccessRecorder
+from .benchmarking import bench_api, bench_document_indexes
+from .bulk import set_documents_status, upload_documents
+from .embeddings import HashingEmbeddingBackend, chunk_text, embed_document
+from .events import broadcaster, issue_ticket, read_ticket
+from .content import build_content_index
+from .extraction import ExtractionEngine, ExtractionTimeout, TextWriter, _spool_to_file, page_ranges
+from .extractors import UnsupportedFileType, extract_file, get_extractor, sniff_type
+from .ingestion import process_document
+from .models import Document, DocumentEmbedding, DocumentStat, IngestionJob, StoredFile, UploadSession
+from .queue import claim_jobs, enqueue_ingestion, recover_stale_jobs, run_job
+from .uploads import UploadClosed, complete_upload, upload_file_name
+from .vector_index import VectorIndex, index_embeddings
 
 User = get_user_model()
 
+# Keep the vector index written during ingestion tests out of the project tree
+INDEX_DIR = tempfile.mkdtemp()
+TEST_DOCUMENTS = {**settings.DOCUMENTS, 'VECTOR_INDEX_DIR': INDEX_DIR}
+temporary_index = override_settings(DOCUMENTS=TEST_DOCUMENTS)
+
+
+def setUpModule():
+    temporary_index.enable()
+
+
+def tearDownModule():
+    temporary_index.disable()
+    shutil.rmtree(INDEX_DIR, ignore_errors=True)
+
 
 class DocumentModelTests(TestCase):
     """Tests for the Document model"""
@@ -80,14 +130,30 @@ class DocumentEmbeddingModelTests(TestCase):
         embedding = DocumentEmbedding.objects.create(
             document=self.document,
             chunk_text="This is a test chunk",
-            embedding={"values": [0.1, 0.2, 0.3]},
+            embedding=[0.1, 0.2, 0.3],
             chunk_index=1
         )
         
         self.assertEqual(embedding.document, self.document)
         self.assertEqual(embedding.chunk_text, "This is a test chunk")
-        self.assertEqual(embedding.embedding, {"values": [0.1, 0.2, 0.3]})
         self.assertEqual(embedding.chunk_index, 1)
+        self.assertEqual(embedding.dimensions, 3)
+        
+    def test_embedding_stored_as_float32_bytes(self):
+        """Test embeddings round-trip through packed float32 storage."""
+        DocumentEmbedding.objects.create(
+            document=self.document,
+            chunk_text="This is a test chunk",
+            embedding=[0.1, 0.2, 0.3],
+            chunk_index=1
+        )
+        
+        embedding = DocumentEmbedding.objects.get(document=self.document)
+        self.assertIsInstance(embedding.embedding, np.ndarray)
+        self.assertEqual(embedding.embedding.dtype, np.float32)
+        np.testing.assert_allclose(embedding.embedding, [0.1, 0.2, 0.3], rtol=1e-6)
+        raw = DocumentEmbedding.objects.values_list('embedding', flat=True).get()
+        self.assertEqual(len(bytes(raw)), 12)
 
 
 class PublicDocumentAPITests(TestCase):
@@ -180,3 +246,1991 @@ class PrivateDocumentApiTests(TestCase):
             )
         
         self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class IngestionQueueTests(TestCase):
+    """Tests for the database-backed ingestion queue"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.editor_user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.document = Document.objects.create(
+            title="Queued Document",
+            file=SimpleUploadedFile("queued.txt", b"queued file content"),
+            uploaded_by=self.editor_user
+        )
+        
+    def test_trigger_ingestion_enqueues_job(self):
+        """Test triggering ingestion queues a job instead of processing inline."""
+        self.client.force_authenticate(user=self.editor_user)
+        res = self.client.post(
+            reverse('documents:document-trigger-ingestion', args=[self.document.id])
+        )
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'processing')
+        self.assertEqual(
+            IngestionJob.objects.filter(document=self.document, status='queued').count(), 1
+        )
+        
+    def test_claim_and_run_job(self):
+        """Test a claimed job is processed and the document completed."""
+        enqueue_ingestion(self.document)
+        
+        jobs = claim_jobs('worker-1', 5)
+        self.assertEqual(len(jobs), 1)
+        self.assertEqual(claim_jobs('worker-2', 5), [])
+        
+        run_job(jobs[0])
+        
+        self.document.refresh_from_db()
+        self.assertEqual(self.document.status, 'completed')
+        self.assertEqual(self.document.content, "queued file content")
+        jobs[0].refresh_from_db()
+        self.assertEqual(jobs[0].status, 'completed')
+        
+    def test_failed_job_is_retried_with_backoff(self):
+        """Test a failing job is requeued until its attempts run out."""
+        job = enqueue_ingestion(self.document)
+        
+        with mock.patch('documents.queue.process_document', side_effect=RuntimeError('boom')):
+            for attempt in range(job.max_attempts):
+                IngestionJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+                claimed = claim_jobs('worker-1', 1)
+                self.assertEqual(len(claimed), 1)
+                run_job(claimed[0])
+                
+        job.refresh_from_db()
+        self.document.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertEqual(job.attempts, job.max_attempts)
+        self.assertEqual(job.last_error, 'boom')
+        self.assertEqual(self.document.status, 'failed')
+        
+    def test_extraction_errors_reach_the_retry_path(self):
+        """Test an extraction timeout fails the job instead of completing the document with an error."""
+        job = enqueue_ingestion(self.document)
+        claimed = claim_jobs('worker-1', 1)
+        
+        with mock.patch('documents.ingestion.extract_file', side_effect=ExtractionTimeout('too slow')):
+            run_job(claimed[0])
+        
+        job.refresh_from_db()
+        self.document.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertEqual(job.last_error, 'too slow')
+        self.assertEqual(self.document.status, 'processing')
+        self.assertFalse(DocumentEmbedding.objects.filter(document=self.document).exists())
+        
+    def test_recover_stale_jobs(self):
+        """Test stale running jobs and orphaned documents are requeued."""
+        job = enqueue_ingestion(self.document)
+        claim_jobs('worker-1', 1)
+        IngestionJob.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(hours=1)
+        )
+        orphan = Document.objects.create(
+            title="Orphaned Document",
+            file=SimpleUploadedFile("orphan.txt", b"orphan"),
+            uploaded_by=self.editor_user,
+            status='processing'
+        )
+        
+        self.assertEqual(recover_stale_jobs(), 2)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'queued')
+        self.assertTrue(IngestionJob.objects.filter(document=orphan, status='queued').exists())
+
+
+class ExtractionEngineTests(TestCase):
+    """Tests for the process-pool extraction engine"""
+    
+    def setUp(self):
+        self.engine = ExtractionEngine(max_workers=1, timeout=60)
+        self.addCleanup(self.engine.shutdown)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        
+    def test_page_ranges(self):
+        """Test PDFs are split into ordered, contiguous page ranges."""
+        self.assertEqual(page_ranges(0, 25), [])
+        self.assertEqual(page_ranges(60, 25), [(0, 25), (25, 50), (50, 60)])
+        
+    def test_text_writer_spools_to_disk(self):
+        """Test the text writer keeps pieces in order past its memory limit."""
+        with TextWriter(max_size=16) as writer:
+            for i in range(10):
+                writer.write(f"page {i}\n")
+            self.assertTrue(writer._file._rolled)
+            self.assertEqual(writer.getvalue(), "".join(f"page {i}\n" for i in range(10)))
+            self.assertEqual(writer.length, 70)
+        
+    def test_extract_word(self):
+        """Test Word documents are extracted in a worker process."""
+        import docx
+        path = os.path.join(self.tmpdir, 'test.docx')
+        doc = docx.Document()
+        doc.add_paragraph('First paragraph')
+        doc.add_paragraph('Second paragraph')
+        doc.save(path)
+        
+        self.assertEqual(self.engine.extract_word(path), "First paragraph\nSecond paragraph\n")
+        
+    def test_failed_part_removes_every_other_part(self):
+        """Test a failing range cancels pending ranges and removes the files of running ones."""
+        def write_part(delay):
+            time.sleep(delay)
+            fd, path = tempfile.mkstemp(dir=self.tmpdir)
+            os.close(fd)
+            return path, []
+        
+        def fail():
+            raise ValueError("bad page")
+        
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            futures = [executor.submit(fail), executor.submit(write_part, 0.2), executor.submit(write_part, 0)]
+            with self.assertRaises(ValueError):
+                self.engine._gather_parts(executor, futures, time.monotonic() + 10)
+        
+        self.assertEqual(os.listdir(self.tmpdir), [])
+        
+    def test_extract_broken_pdf_raises(self):
+        """Test a corrupt PDF surfaces as an error instead of hanging."""
+        path = os.path.join(self.tmpdir, 'broken.pdf')
+        with open(path, 'wb') as f:
+            f.write(b'not a pdf')
+        
+        with self.assertRaises(Exception):
+            self.engine.extract_pdf(path)
+
+
+class EmbeddingPipelineTests(TestCase):
+    """Tests for chunking and embedding extracted content"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='test@example.com',
+            password='testpass123'
+        )
+        
+    def test_chunk_text_overlapping_windows(self):
+        """Test content is split into overlapping token windows."""
+        text = " ".join(f"w{i}" for i in range(10))
+        chunks = list(chunk_text(text, window=4, overlap=1))
+        
+        self.assertEqual(chunks, [
+            (0, "w0 w1 w2 w3"),
+            (1, "w3 w4 w5 w6"),
+            (2, "w6 w7 w8 w9"),
+        ])
+        self.assertEqual(list(chunk_text("", window=4, overlap=1)), [])
+        
+    def test_hashing_backend_is_deterministic(self):
+        """Test the hashing vectorizer returns stable unit vectors."""
+        backend = HashingEmbeddingBackend(dimensions=64)
+        vectors = backend.embed(["the quick brown fox", "the quick brown fox", ""])
+        
+        self.assertEqual(vectors.shape, (3, 64))
+        self.assertTrue((vectors[0] == vectors[1]).all())
+        self.assertAlmostEqual(float((vectors[0] ** 2).sum()), 1.0, places=5)
+        self.assertFalse(vectors[2].any())
+        
+    def test_embed_document_bulk_creates_chunks(self):
+        """Test all chunks of a document are written in a single insert."""
+        document = Document.objects.create(
+            title="Long Document",
+            file=SimpleUploadedFile("long.txt", b"file content"),
+            uploaded_by=self.user,
+            content=" ".join(f"token{i}" for i in range(1000))
+        )
+        
+        # One read of the existing chunks, one insert
+        with self.assertNumQueries(2):
+            count = len(embed_document(document))
+        
+        self.assertEqual(count, document.embeddings.count())
+        self.assertEqual(
+            list(document.embeddings.values_list('chunk_index', flat=True)),
+            list(range(count))
+        )
+
+
+class VectorIndexTests(TestCase):
+    """Tests for the IVF vector index and semantic search endpoint"""
+    
+    def setUp(self):
+        self.index = VectorIndex(tempfile.mkdtemp(), nprobe=4)
+        self.addCleanup(shutil.rmtree, self.index.path)
+        rng = np.random.default_rng(1)
+        self.vectors = rng.normal(size=(500, 16)).astype(np.float32)
+        self.vectors /= np.linalg.norm(self.vectors, axis=1, keepdims=True)
+        
+    def test_build_and_search(self):
+        """Test an indexed vector is its own nearest neighbour."""
+        rows = [(i, i % 5, vector) for i, vector in enumerate(self.vectors)]
+        self.assertEqual(self.index.build(rows, len(rows), 16), 500)
+        
+        hits = self.index.search(self.vectors[42], k=3)
+        self.assertEqual(hits[0][:2], (42, 2))
+        self.assertAlmostEqual(hits[0][2], 1.0, places=5)
+        
+        hits = self.index.search(self.vectors[42], k=3, allowed_document_ids=[0, 1])
+        self.assertTrue(all(document_id in (0, 1) for _, document_id, _ in hits))
+        
+    def test_incremental_add_is_visible_to_other_handles(self):
+        """Test vectors added after a build are found through a fresh handle."""
+        self.index.build([], 0, 16)
+        self.index.add([7, 8], [1, 1], self.vectors[:2])
+        
+        reader = VectorIndex(self.index.path)
+        self.assertEqual(reader.search(self.vectors[1], k=1)[0][0], 8)
+        self.index.add([9], [2], self.vectors[2:3])
+        self.assertEqual(reader.search(self.vectors[2], k=1)[0][0], 9)
+        
+    def test_adds_write_new_delta_segments(self):
+        """Test each add writes a segment of its own, leaving earlier ones alone until they are merged."""
+        self.index.build([], 0, 16)
+        self.index.add([1], [1], self.vectors[:1])
+        generation = self.index._current_generation()
+        first = os.path.join(self.index.path, generation, 'delta-vectors-1.npy')
+        written = os.stat(first).st_mtime_ns
+        self.index.add([2], [1], self.vectors[1:2])
+        self.assertEqual(os.stat(first).st_mtime_ns, written)
+        self.assertEqual(self.index._read_manifest(generation)['delta'], [1, 2])
+        
+        with mock.patch('documents.vector_index.DELTA_SEGMENT_LIMIT', 3):
+            self.assertEqual(self.index.add([3], [1], self.vectors[2:3]), 3)
+        self.assertEqual(self.index._read_manifest(generation)['delta'], [3])
+        self.assertFalse(os.path.exists(first))
+        reader = VectorIndex(self.index.path)
+        for i in range(3):
+            self.assertEqual(reader.search(self.vectors[i], k=1)[0][0], i + 1)
+        
+    def test_removed_vectors_are_not_found(self):
+        """Test tombstoned embeddings and documents are filtered out, also across a rebuild."""
+        rows = [(i, i % 5, vector) for i, vector in enumerate(self.vectors)]
+        self.index.build(rows, len(rows), 16)
+        
+        self.index.remove(embedding_ids=[42])
+        self.index.remove(document_ids=[3])
+        reader = VectorIndex(self.index.path, nprobe=4)
+        hits = reader.search(self.vectors[42], k=20)
+        self.assertNotIn(42, [embedding_id for embedding_id, _, _ in hits])
+        self.assertNotIn(3, [document_id for _, document_id, _ in hits])
+        
+        # A rebuild that read the rows before they were deleted keeps their tombstones
+        self.index.build(rows, len(rows), 16)
+        self.assertNotEqual(reader.search(self.vectors[42], k=1)[0][0], 42)
+        # One that no longer holds them drops the tombstones
+        live = [row for row in rows if row[0] != 42 and row[1] != 3]
+        self.index.build(live, len(live), 16)
+        self.index._load()
+        self.assertIsNone(self.index._deleted)
+        
+    def test_needs_rebuild(self):
+        """Test a rebuild is asked for once the delta outgrows its limit."""
+        index = VectorIndex(self.index.path, delta_limit=2)
+        index.build([], 0, 16)
+        index.add([1, 2], [1, 1], self.vectors[:2])
+        self.assertFalse(index.needs_rebuild())
+        
+        index.add([3], [1], self.vectors[2:3])
+        self.assertTrue(index.needs_rebuild())
+        
+    def test_deleted_documents_leave_search(self):
+        """Test the vectors of a deleted document are no longer found."""
+        editor = User.objects.create_user(email='editor@example.com', password='testpass123', role='editor')
+        document = Document.objects.create(
+            title="Doomed", file=SimpleUploadedFile("doomed.txt", b"x"), uploaded_by=editor,
+            content="quarterly revenue grew in the northern region"
+        )
+        with self.settings(DOCUMENTS={**settings.DOCUMENTS, 'VECTOR_INDEX_DIR': self.index.path}):
+            embeddings = embed_document(document)
+            index_embeddings(embeddings)
+            with self.captureOnCommitCallbacks(execute=True):
+                document.delete()
+        
+        reader = VectorIndex(self.index.path)
+        self.assertEqual(reader.search(embeddings[0].embedding, k=5), [])
+        
+    def test_semantic_search_respects_visibility(self):
+        """Test editors only get chunks of their own documents."""
+        editor = User.objects.create_user(email='editor@example.com', password='testpass123', role='editor')
+        other = User.objects.create_user(email='other@example.com', password='testpass123', role='editor')
+        own = Document.objects.create(
+            title="Own", file=SimpleUploadedFile("own.txt", b"x"), uploaded_by=editor,
+            content="quarterly revenue grew in the northern region"
+        )
+        foreign = Document.objects.create(
+            title="Foreign", file=SimpleUploadedFile("foreign.txt", b"x"), uploaded_by=other,
+            content="quarterly revenue grew in the northern region"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(user=editor)
+        with self.settings(DOCUMENTS={**settings.DOCUMENTS, 'VECTOR_INDEX_DIR': self.index.path}):
+            index_embeddings(embed_document(own) + embed_document(foreign))
+            res = self.client.get(
+                reverse('documents:document-semantic-search'), {'q': 'northern revenue'}
+            )
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual([hit['document'] for hit in res.data], [own.id])
+        self.assertGreater(res.data[0]['score'], 0)
+
+
+class FullTextSearchTests(TestCase):
+    """Tests for full-text search over document content"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.editor_user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.other_editor = User.objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.client.force_authenticate(user=self.editor_user)
+        
+    def _create(self, title, user=None, **fields):
+        return Document.objects.create(
+            title=title,
+            file=SimpleUploadedFile("doc.txt", b"file content"),
+            uploaded_by=user or self.editor_user,
+            **fields
+        )
+        
+    def test_search_ranks_and_highlights_content(self):
+        """Test content matches are found, ranked and highlighted."""
+        title_hit = self._create("Kubernetes migration plan")
+        content_hit = self._create("Notes", content="We discussed the kubernetes cluster upgrade.")
+        self._create("Unrelated", content="Nothing to see here.")
+        
+        res = self.client.get(reverse('documents:document-search'), {'q': 'kubernetes'})
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        ids = [result['id'] for result in res.data['results']]
+        self.assertEqual(ids, [title_hit.id, content_hit.id])
+        self.assertIn('<mark>kubernetes</mark>', res.data['results'][1]['snippet'])
+        
+    def test_index_follows_ingestion_updates(self):
+        """Test content written after upload becomes searchable."""
+        document = self._create("Report")
+        res = self.client.get(reverse('documents:document-search'), {'q': 'photosynthesis'})
+        self.assertEqual(res.data['count'], 0)
+        
+        document.content = "A study of photosynthesis."
+        document.save(update_fields=['content'])
+        res = self.client.get(reverse('documents:document-search'), {'q': 'photosynthesis'})
+        self.assertEqual(res.data['count'], 1)
+        
+        document.delete()
+        res = self.client.get(reverse('documents:document-search'), {'q': 'photosynthesis'})
+        self.assertEqual(res.data['count'], 0)
+        
+    def test_search_respects_visibility(self):
+        """Test editors don't find other editors' documents."""
+        self._create("Budget", user=self.other_editor, content="confidential budget")
+        
+        res = self.client.get(reverse('documents:document-search'), {'q': 'budget'})
+        
+        self.assertEqual(res.data['count'], 0)
+
+
+class AccessTrackingTests(TestCase):
+    """Tests for buffered last_accessed tracking"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='viewer@example.com',
+            password='testpass123',
+            role='viewer'
+        )
+        self.documents = [
+            Document.objects.create(
+                title=f"Document {i}",
+                file=SimpleUploadedFile(f"doc{i}.txt", b"file content"),
+                uploaded_by=self.user
+            )
+            for i in range(3)
+        ]
+        self.recorder = AccessRecorder()
+        # Flush explicitly instead of from the background thread
+        self.recorder._start = mock.Mock()
+        
+    def test_retrieve_does_not_write(self):
+        """Test reading a document buffers the access instead of updating the row."""
+        self.client.force_authenticate(user=self.user)
+        document = self.documents[0]
+        
+        with mock.patch('documents.access.recorder', self.recorder):
+            with CaptureQueriesContext(connection) as queries:
+                res = self.client.get(reverse('documents:document-detail', args=[document.id]))
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIsNotNone(res.data['last_accessed'])
+        self.assertFalse(any(q['sql'].startswith('UPDATE') for q in queries))
+        document.refresh_from_db()
+        self.assertIsNone(document.last_accessed)
+        
+    def test_flush_coalesces_into_one_update(self):
+        """Test buffered accesses are written with a single UPDATE."""
+        now = timezone.now()
+        for document in self.documents:
+            self.recorder.record(document.id, now - timedelta(minutes=5))
+            self.recorder.record(document.id, now)
+        
+        with self.assertNumQueries(1):
+            self.assertEqual(self.recorder.flush(), 3)
+        
+        for document in self.documents:
+            document.refresh_from_db()
+            self.assertEqual(document.last_accessed, now)
+        self.assertEqual(self.recorder.flush(), 0)
+
+
+class DocumentQueryCountTests(TestCase):
+    """Guard the number of queries each document endpoint issues"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='viewer@example.com',
+            password='testpass123',
+            role='viewer'
+        )
+        owners = [
+            User.objects.create_user(email=f'owner{i}@example.com', password='testpass123', role='editor')
+            for i in range(5)
+        ]
+        self.documents = [
+            Document.objects.create(
+                title=f"Document {i}",
+                file=SimpleUploadedFile(f"doc{i}.txt", b"file content"),
+                uploaded_by=owners[i % len(owners)],
+                content="extracted text " * 100,
+                last_accessed=timezone.now()
+            )
+            for i in range(10)
+        ]
+        self.client.force_authenticate(user=self.user)
+        
+    def test_list_query_count(self):
+        """Test listing issues its validator aggregate, a count and a single joined select."""
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(reverse('documents:document-list'))
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 10)
+        self.assertEqual(len(queries), 3)
+        self.assertNotIn('"content"', queries[2]['sql'])
+        
+    def test_recent_query_count(self):
+        """Test the recent action issues its validator aggregate and a single joined select."""
+        with self.assertNumQueries(2):
+            res = self.client.get(reverse('documents:document-recent'))
+        
+        self.assertEqual(len(res.data), 10)
+        
+    def test_detail_query_count(self):
+        """Test retrieving a document issues a single joined select."""
+        with mock.patch('documents.access.recorder'):
+            with self.assertNumQueries(1):
+                res = self.client.get(
+                    reverse('documents:document-detail', args=[self.documents[0].id])
+                )
+        
+        self.assertEqual(res.data['owner'], 'owner0@example.com')
+
+
+class KeysetPaginationTests(TestCase):
+    """Tests for the opt-in cursor pagination mode"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='viewer@example.com',
+            password='testpass123',
+            role='viewer'
+        )
+        created_at = timezone.now()
+        self.documents = []
+        for i in range(25):
+            document = Document.objects.create(
+                title=f"Document {i % 7}",
+                file=SimpleUploadedFile(f"doc{i}.txt", b"file content"),
+                uploaded_by=self.user,
+                last_accessed=created_at - timedelta(minutes=i) if i % 3 else None
+            )
+            self.documents.append(document)
+        # Give several documents the same timestamp to exercise the tiebreaker
+        Document.objects.update(created_at=created_at)
+        self.client.force_authenticate(user=self.user)
+        
+    def _walk(self, url, params):
+        ids = []
+        res = self.client.get(url, params)
+        while True:
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', res.data)
+            ids.extend(document['id'] for document in res.data['results'])
+            if not res.data['next']:
+                return ids
+            res = self.client.get(res.data['next'])
+        
+    def test_cursor_pages_cover_every_document_once(self):
+        """Test walking the cursor visits each document exactly once, in order."""
+        url = reverse('documents:document-list')
+        for ordering in ['-created_at', 'title', '-last_accessed', 'last_accessed']:
+            ids = self._walk(url, {'pagination': 'cursor', 'ordering': ordering})
+            self.assertEqual(sorted(ids), sorted(d.id for d in self.documents), ordering)
+            expected = list(
+                Document.objects.order_by(
+                    ordering, '-id' if ordering.startswith('-') else 'id'
+                ).values_list('id', flat=True)
+            )
+            self.assertEqual(ids, expected, ordering)
+        
+    def test_cursor_page_skips_count(self):
+        """Test a cursor page and its validator only read the page's window, never COUNT(*)."""
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('documents:document-list'), {'pagination': 'cursor'})
+        
+        self.assertEqual(len(queries), 2)
+        for query in queries:
+            self.assertNotIn('COUNT(*)', query['sql'].upper())
+            self.assertIn('LIMIT 11', query['sql'].upper())
+        
+    def test_recent_with_cursor(self):
+        """Test the recent action can be walked with a cursor."""
+        ids = self._walk(
+            reverse('documents:document-recent'), {'pagination': 'cursor', 'page_size': 4}
+        )
+        
+        expected = [d.id for d in self.documents if d.last_accessed is not None]
+        self.assertEqual(ids, expected)
+        
+    def test_invalid_cursor(self):
+        """Test a tampered cursor is rejected."""
+        res = self.client.get(reverse('documents:document-list'), {'cursor': 'garbage'})
+        
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DocumentIndexBenchmarkTests(TestCase):
+    """Tests for the document index benchmark"""
+    
+    def test_listing_queries_use_indexes(self):
+        """Test the listing queries are served by the composite and partial indexes."""
+        results = bench_document_indexes(documents=2000, owners=20, repeat=1)
+        
+        queries = results['queries']
+        self.assertEqual(queries['editor_list']['indexes'], ['documents_owner_created_idx'])
+        self.assertEqual(queries['status_filter']['indexes'], ['documents_status_created_idx'])
+        self.assertEqual(queries['recent']['indexes'], ['documents_recent_idx'])
+        for name, query in queries.items():
+            self.assertFalse(query['sequential_scan'], name)
+        # The seeded rows are rolled back
+        self.assertFalse(Document.objects.exists())
+
+
+class ChunkedUploadTests(TestCase):
+    """Tests for resumable, chunked uploads"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.data = b"".join(b"line %d of a large report\n" % i for i in range(2000))
+        
+    def _open(self, **extra):
+        res = self.client.post(
+            reverse('documents:upload-list'), {'filename': 'report.txt', 'title': 'Report', **extra}
+        )
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        return reverse('documents:upload-detail', args=[res.data['id']])
+        
+    def _append(self, url, offset, data):
+        return self.client.patch(
+            url, data, content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+        
+    def test_upload_in_parts(self):
+        """Test parts are assembled into a document with its size and hash."""
+        url = self._open(size=len(self.data))
+        part_size = 16000
+        for offset in range(0, len(self.data), part_size):
+            res = self._append(url, offset, self.data[offset:offset + part_size])
+            self.assertEqual(res.status_code, status.HTTP_200_OK)
+            self.assertEqual(res.data['offset'], min(offset + part_size, len(self.data)))
+        session = UploadSession.objects.get()
+        part_names = list(session.parts.values_list('name', flat=True))
+        self.assertEqual(len(part_names), -(-len(self.data) // part_size))
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(url.rstrip('/') + '/complete/')
+        
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        document = Document.objects.get(id=res.data['id'])
+        self.assertEqual(document.title, 'Report')
+        self.assertEqual(document.file_size, len(self.data))
+        self.assertEqual(document.file_type, 'txt')
+        self.assertEqual(document.content_hash, hashlib.sha256(self.data).hexdigest())
+        with document.file.open('rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertFalse(any(default_storage.exists(name) for name in part_names))
+        document.file.delete(save=False)
+        
+    def test_completing_moves_the_uploaded_file(self):
+        """Test the parts are written into one file that becomes the document's file without a copy."""
+        url = self._open(size=len(self.data))
+        self._append(url, 0, self.data[:30000])
+        self._append(url, 30000, self.data[30000:])
+        path = default_storage.path(upload_file_name(UploadSession.objects.get()))
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        inode = os.stat(path).st_ino
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(url.rstrip('/') + '/complete/')
+        
+        document = Document.objects.get(id=res.data['id'])
+        self.assertEqual(os.stat(document.file.path).st_ino, inode)
+        self.assertFalse(os.path.exists(path))
+        document.file.delete(save=False)
+        
+    def test_upload_is_completed_once(self):
+        """Test completing an upload a second time, as a racing request would, creates no second document."""
+        url = self._open()
+        self._append(url, 0, self.data)
+        session = UploadSession.objects.get()
+        stale = UploadSession.objects.get()
+        document = complete_upload(session)
+        self.addCleanup(document.file.delete, save=False)
+        
+        with self.assertRaises(UploadClosed):
+            complete_upload(stale)
+        
+        self.assertEqual(Document.objects.count(), 1)
+        
+    def test_resume_reports_offset(self):
+        """Test a part at the wrong offset is rejected with the stored offset."""
+        url = self._open()
+        self._append(url, 0, self.data[:1000])
+        
+        res = self._append(url, 0, self.data[:1000])
+        
+        self.assertEqual(res.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(res.data['offset'], 1000)
+        self.assertEqual(self.client.get(url).data['offset'], 1000)
+        
+    def test_part_beyond_declared_size(self):
+        """Test bytes past the declared size are refused."""
+        url = self._open(size=100)
+        
+        res = self._append(url, 0, self.data[:101])
+        
+        self.assertEqual(res.status_code, status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        self.assertEqual(UploadSession.objects.get().received, 0)
+        
+    def test_complete_before_all_parts(self):
+        """Test an upload cannot be completed while bytes are missing."""
+        url = self._open(size=len(self.data))
+        self._append(url, 0, self.data[:1000])
+        
+        res = self.client.post(url.rstrip('/') + '/complete/')
+        
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Document.objects.exists())
+        
+    def test_invalid_extension(self):
+        """Test an upload of an unsupported file type is refused up front."""
+        res = self.client.post(reverse('documents:upload-list'), {'filename': 'script.py'})
+        
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        
+    def test_viewer_cannot_upload(self):
+        """Test viewers cannot open an upload."""
+        viewer = User.objects.create_user(email='viewer@example.com', password='testpass123', role='viewer')
+        self.client.force_authenticate(user=viewer)
+        
+        res = self.client.post(reverse('documents:upload-list'), {'filename': 'report.txt'})
+        
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class ContentAddressedStorageTests(TestCase):
+    """Tests for deduplicated file storage and ingestion reuse"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.data = b"the same report uploaded twice " * 20
+        
+    def _create(self, data, name="report.txt"):
+        return Document.objects.create(
+            title=name,
+            file=SimpleUploadedFile(name, data),
+            uploaded_by=self.user
+        )
+        
+    def test_identical_uploads_share_a_file(self):
+        """Test identical files are stored once and counted per document."""
+        first = self._create(self.data)
+        second = self._create(self.data, name="copy.txt")
+        other = self._create(b"different bytes")
+        
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertNotEqual(first.file.name, other.file.name)
+        self.assertEqual(second.file_type, 'txt')
+        self.assertEqual(first.content_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertEqual(StoredFile.objects.get(pk=first.content_hash).ref_count, 2)
+        other.delete()
+        
+    def test_file_deleted_with_last_reference(self):
+        """Test the stored file outlives every document but the last."""
+        first = self._create(self.data)
+        second = self._create(self.data)
+        name = first.file.name
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(name))
+        self.assertEqual(StoredFile.objects.get(pk=second.content_hash).ref_count, 1)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(default_storage.exists(name))
+        self.assertFalse(StoredFile.objects.exists())
+        
+    def test_duplicate_reuses_ingestion(self):
+        """Test a duplicate upload copies content and embeddings instead of extracting."""
+        first = self._create(self.data)
+        process_document(first.id)
+        second = self._create(self.data)
+        
+        with mock.patch('documents.ingestion._ingest') as ingest:
+            process_document(second.id)
+        
+        ingest.assert_not_called()
+        second.refresh_from_db()
+        self.assertEqual(second.status, 'completed')
+        self.assertEqual(second.content, self.data.decode())
+        copied = list(second.embeddings.order_by('chunk_index'))
+        original = list(first.embeddings.order_by('chunk_index'))
+        self.assertEqual(len(copied), len(original))
+        np.testing.assert_array_equal(copied[0].embedding, original[0].embedding)
+
+
+class DocumentDownloadTests(TestCase):
+    """Tests for the document download action"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.data = bytes(range(256)) * 40
+        self.document = Document.objects.create(
+            title="Manual",
+            file=SimpleUploadedFile("manual.pdf", self.data),
+            uploaded_by=self.user
+        )
+        self.url = reverse('documents:document-download', args=[self.document.id])
+        self.client.force_authenticate(user=self.user)
+        patcher = mock.patch('documents.access.recorder')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+    def test_download_whole_file(self):
+        """Test the file is streamed with validators and a download name."""
+        res = self.client.get(self.url)
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(res.streaming_content), self.data)
+        self.assertEqual(res['ETag'], f'"{self.document.content_hash}"')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertEqual(res['Content-Type'], 'application/pdf')
+        self.assertIn('filename="Manual.pdf"', res['Content-Disposition'])
+        
+    def test_range_request(self):
+        """Test a byte range is answered with 206 and only those bytes."""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=100-299')
+        
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(res.streaming_content), self.data[100:300])
+        self.assertEqual(res['Content-Range'], f'bytes 100-299/{len(self.data)}')
+        self.assertEqual(res['Content-Length'], '200')
+        
+        res = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b"".join(res.streaming_content), self.data[-10:])
+        
+    def test_unsatisfiable_range(self):
+        """Test a range past the end of the file is rejected."""
+        res = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.data)}-')
+        
+        self.assertEqual(res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(res['Content-Range'], f'bytes */{len(self.data)}')
+        
+    def test_stale_if_range_sends_whole_file(self):
+        """Test a range with an outdated If-Range validator gets the whole file."""
+        res = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"outdated"')
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(res.streaming_content), self.data)
+        
+    def test_not_modified(self):
+        """Test a matching If-None-Match is answered with 304 and no body."""
+        etag = self.client.get(self.url)['ETag']
+        
+        res = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res.content, b"")
+        
+    def test_sendfile_offload(self):
+        """Test the file can be handed to nginx with X-Accel-Redirect."""
+        with self.settings(DOCUMENTS={**settings.DOCUMENTS, 'DOWNLOAD_SENDFILE_HEADER': 'X-Accel-Redirect'}):
+            res = self.client.get(self.url)
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['X-Accel-Redirect'], f'/protected-media/{self.document.file.name}')
+        self.assertEqual(res.content, b"")
+        
+    def test_download_respects_visibility(self):
+        """Test editors cannot download other editors' documents."""
+        other = User.objects.create_user(email='other@example.com', password='testpass123', role='editor')
+        self.client.force_authenticate(user=other)
+        
+        res = self.client.get(self.url)
+        
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class DocumentContentTests(TestCase):
+    """Tests for streaming slices of extracted content"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.lines = [f"line {i} of the extracted text\n" for i in range(1, 2501)]
+        self.text = "".join(self.lines)
+        pages = [0, len("".join(self.lines[:1000])), len("".join(self.lines[:2000]))]
+        self.document = Document.objects.create(
+            title="Long Document",
+            file=SimpleUploadedFile("long.txt", b"file content"),
+            uploaded_by=self.user,
+            content=self.text,
+            content_index=build_content_index(self.text, pages),
+            status='completed'
+        )
+        self.url = reverse('documents:document-content', args=[self.document.id])
+        self.client.force_authenticate(user=self.user)
+        # Small reads so slices span several chunks
+        patcher = mock.patch('documents.content.READ_CHUNK', 1000)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        
+    def _get(self, **params):
+        res = self.client.get(self.url, params)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return b"".join(res.streaming_content).decode('utf-8')
+        
+    def test_detail_omits_content(self):
+        """Test the detail payload describes the content instead of including it."""
+        with mock.patch('documents.access.recorder'):
+            res = self.client.get(reverse('documents:document-detail', args=[self.document.id]))
+        
+        self.assertNotIn('content', res.data)
+        self.assertEqual(res.data['content_length'], len(self.text))
+        self.assertEqual(res.data['line_count'], 2500)
+        self.assertEqual(res.data['page_count'], 3)
+        
+    def test_whole_content(self):
+        """Test the content streams in full without a slice."""
+        self.assertEqual(self._get(), self.text)
+        
+    def test_char_slice(self):
+        """Test a character range is served inclusive of both ends."""
+        self.assertEqual(self._get(chars='10-2509'), self.text[10:2510])
+        self.assertEqual(self._get(chars=f'{len(self.text) - 5}-'), self.text[-5:])
+        
+    def test_line_slice(self):
+        """Test line ranges, including ones past the indexed checkpoints."""
+        self.assertEqual(self._get(lines='1-3'), "".join(self.lines[:3]))
+        self.assertEqual(self._get(lines='998-1003'), "".join(self.lines[997:1003]))
+        self.assertEqual(self._get(lines='2400-'), "".join(self.lines[2399:]))
+        
+    def test_page_slice(self):
+        """Test pages are resolved from the stored page offsets."""
+        self.assertEqual(self._get(pages='2-2'), "".join(self.lines[1000:2000]))
+        self.assertEqual(self._get(pages='3-'), "".join(self.lines[2000:]))
+        
+    def test_invalid_slices(self):
+        """Test malformed and out of range slices are rejected."""
+        self.assertEqual(self.client.get(self.url, {'lines': 'x-2'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(self.url, {'pages': '5-3'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            self.client.get(self.url, {'pages': '4-'}).status_code,
+            status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        
+    def test_assembled_page_offsets(self):
+        """Test the extraction engine reports where each page starts."""
+        engine = ExtractionEngine(max_workers=1)
+        
+        text, offsets = engine._assemble([
+            _spool_to_file(["a", "bb"], "\n\n"), _spool_to_file(["ccc"], "\n\n")
+        ])
+        
+        self.assertEqual(text, "a\n\nbb\n\nccc\n\n")
+        self.assertEqual(offsets, [0, 3, 7])
+
+
+@override_settings(DOCUMENTS={**TEST_DOCUMENTS, 'RESPONSE_CACHE_TIMEOUT': 300})
+class ResponseCacheTests(TestCase):
+    """Tests for the versioned document response cache"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.editor = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.other_editor = User.objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.document = Document.objects.create(
+            title="Cached Document",
+            file=SimpleUploadedFile("cached.txt", b"file content"),
+            uploaded_by=self.editor
+        )
+        self.client.force_authenticate(user=self.editor)
+        
+    def test_repeat_list_skips_database(self):
+        """Test a repeated listing is served without any query."""
+        url = reverse('documents:document-list')
+        first = self.client.get(url)
+        
+        with self.assertNumQueries(0):
+            second = self.client.get(url)
+        
+        self.assertEqual(second.data, first.data)
+        
+    def test_write_invalidates_listing(self):
+        """Test saving a document expires cached listings."""
+        url = reverse('documents:document-list')
+        self.client.get(url)
+        
+        Document.objects.create(
+            title="New Document",
+            file=SimpleUploadedFile("new.txt", b"new content"),
+            uploaded_by=self.editor
+        )
+        
+        self.assertEqual(self.client.get(url).data['count'], 2)
+        
+    def test_scope_is_part_of_the_key(self):
+        """Test one editor's cached listing is never served to another."""
+        url = reverse('documents:document-list')
+        self.client.get(url)
+        
+        self.client.force_authenticate(user=self.other_editor)
+        res = self.client.get(url)
+        
+        self.assertEqual(res.data['count'], 0)
+        
+    def test_cached_retrieve_records_access(self):
+        """Test a cached detail response is still recorded as an access and expires on update."""
+        url = reverse('documents:document-detail', args=[self.document.id])
+        with mock.patch('documents.access.recorder'):
+            self.client.get(url)
+        
+        with mock.patch('documents.access.recorder') as recorder:
+            with self.assertNumQueries(0):
+                self.client.get(url)
+        recorder.record.assert_called_once()
+        self.assertEqual(recorder.record.call_args[0][0], self.document.id)
+        
+        self.document.title = "Renamed"
+        self.document.save()
+        with mock.patch('documents.access.recorder'):
+            self.assertEqual(self.client.get(url).data['title'], "Renamed")
+        
+    def test_flushed_access_expires_details_and_recent(self):
+        """Test flushed access times expire cached details and recent listings, but not other listings."""
+        list_url = reverse('documents:document-list')
+        recent_url = reverse('documents:document-recent')
+        detail_url = reverse('documents:document-detail', args=[self.document.id])
+        recorder = AccessRecorder()
+        with mock.patch('documents.access.recorder', recorder), mock.patch.object(recorder, '_start'):
+            self.client.get(list_url)
+            self.assertEqual(self.client.get(recent_url).data, [])
+            accessed = self.client.get(detail_url).data['last_accessed']
+            self.assertEqual(self.client.get(detail_url).data['last_accessed'], accessed)
+            
+            recorder.flush()
+            
+            self.assertNotEqual(self.client.get(detail_url).data['last_accessed'], accessed)
+            self.assertEqual(len(self.client.get(recent_url).data), 1)
+            with self.assertNumQueries(0):
+                self.client.get(list_url)
+        
+    def test_off_with_process_local_cache(self):
+        """Test responses are not cached by default while the cache is local to the process."""
+        url = reverse('documents:document-list')
+        self.client.get(url)
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'RESPONSE_CACHE_TIMEOUT': None}):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+        self.assertTrue(queries)
+
+
+@override_settings(DOCUMENTS={**TEST_DOCUMENTS, 'RESPONSE_CACHE_TIMEOUT': 0})
+class ConditionalGetTests(TestCase):
+    """Tests for ETag and Last-Modified validation of document reads"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='viewer@example.com',
+            password='testpass123',
+            role='viewer'
+        )
+        self.document = Document.objects.create(
+            title="Validated Document",
+            file=SimpleUploadedFile("validated.txt", b"file content"),
+            uploaded_by=self.user
+        )
+        self.client.force_authenticate(user=self.user)
+        
+    def test_list_not_modified(self):
+        """Test a listing revalidated with its ETag is a 304 without serializing."""
+        url = reverse('documents:document-list')
+        first = self.client.get(url)
+        self.assertIn('ETag', first)
+        self.assertNotIn('Last-Modified', first)
+        
+        with mock.patch('documents.views.DocumentViewSet.get_serializer') as get_serializer:
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], first['ETag'])
+        get_serializer.assert_not_called()
+        
+    def test_list_not_modified_in_one_query(self):
+        """Test a listing is revalidated from one aggregate, without fetching or counting the page."""
+        url = reverse('documents:document-list')
+        etag = self.client.get(url)['ETag']
+        
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('MAX(', queries[0]['sql'].upper())
+        
+    def test_list_etag_changes_with_rows(self):
+        """Test updating or deleting a listed document changes the listing's ETag."""
+        url = reverse('documents:document-list')
+        Document.objects.create(
+            title="Second Document",
+            file=SimpleUploadedFile("second.txt", b"second content"),
+            uploaded_by=self.user
+        )
+        etag = self.client.get(url)['ETag']
+        
+        self.document.title = "Renamed"
+        self.document.save()
+        res = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        
+        self.document.delete()
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(again.status_code, status.HTTP_200_OK)
+        self.assertEqual(again.data['count'], 1)
+        
+    def test_cursor_page_etag_changes_with_window(self):
+        """Test deleting a row of a cursor page changes its ETag though the window stays full."""
+        for i in range(3):
+            Document.objects.create(
+                title=f"Windowed {i}",
+                file=SimpleUploadedFile(f"windowed{i}.txt", b"content"),
+                uploaded_by=self.user
+            )
+        url = reverse('documents:document-list')
+        params = {'pagination': 'cursor', 'page_size': 2}
+        etag = self.client.get(url, params)['ETag']
+        
+        Document.objects.order_by('-created_at', '-id').first().delete()
+        res = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        
+    def test_recent_not_modified(self):
+        """Test the recent listing is validated by its rows' access times."""
+        self.document.last_accessed = timezone.now()
+        self.document.save()
+        url = reverse('documents:document-recent')
+        etag = self.client.get(url)['ETag']
+        
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        Document.objects.filter(pk=self.document.pk).update(last_accessed=timezone.now() + timedelta(seconds=1))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, status.HTTP_200_OK)
+        
+    def test_detail_validators(self):
+        """Test a detail response is revalidated by ETag and by date, and still counts as an access."""
+        url = reverse('documents:document-detail', args=[self.document.id])
+        with mock.patch('documents.access.recorder'):
+            first = self.client.get(url)
+        self.assertEqual(first['Cache-Control'], 'private, no-cache')
+        
+        with mock.patch('documents.access.recorder') as recorder:
+            by_etag = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            by_date = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        
+        self.assertEqual(by_etag.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(by_date.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(recorder.record.call_count, 2)
+        
+        self.document.title = "Renamed"
+        self.document.save()
+        with mock.patch('documents.access.recorder'):
+            res = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(res.data['title'], "Renamed")
+        
+    def test_cached_response_keeps_validators(self):
+        """Test a response served from the response cache is revalidated without queries."""
+        url = reverse('documents:document-list')
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'RESPONSE_CACHE_TIMEOUT': 300}):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                res = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(res['ETag'], first['ETag'])
+
+
+@mock.patch('documents.events.Broadcaster._start')
+class IngestionEventsTests(TestCase):
+    """Tests for the server-sent ingestion event stream"""
+    
+    def setUp(self):
+        self.editor = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.other_editor = User.objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.document = Document.objects.create(
+            title="Streamed Document",
+            file=SimpleUploadedFile("streamed.txt", b"file content"),
+            uploaded_by=self.editor,
+            status='processing'
+        )
+        self.url = reverse('documents:document-events', args=[self.document.id])
+        
+    async def _read_events(self, response, count):
+        events = []
+        iterator = aiter(response.streaming_content)
+        while len(events) < count:
+            chunk = await asyncio.wait_for(anext(iterator), timeout=5)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith('event:'):
+                name, data = chunk.strip().split('\n')
+                events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+        return events, iterator
+        
+    async def test_stream_requires_authentication(self, _start):
+        """Test the stream rejects missing credentials and documents the user cannot see."""
+        client = AsyncClient()
+        res = await client.get(self.url)
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        token = str(AccessToken.for_user(self.other_editor))
+        res = await client.get(self.url, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        
+    async def test_stream_opens_with_ticket_only(self, _start):
+        """Test the stream takes a ticket for its document in the query, but never a JWT."""
+        client = AsyncClient()
+        token = str(AccessToken.for_user(self.editor))
+        res = await client.get(self.url, {'token': token})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        other = await Document.objects.acreate(
+            title="Other Document",
+            file=SimpleUploadedFile("other.txt", b"other content"),
+            uploaded_by=self.editor
+        )
+        res = await client.get(self.url, {'ticket': issue_ticket(self.editor, other.id)})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'EVENTS_TICKET_MAX_AGE': -1}):
+            res = await client.get(self.url, {'ticket': issue_ticket(self.editor, self.document.id)})
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+        
+        # A finished document's stream ends after its status
+        await Document.objects.filter(pk=self.document.id).aupdate(status='completed')
+        res = await client.get(self.url, {'ticket': issue_ticket(self.editor, self.document.id)})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len([chunk async for chunk in res.streaming_content]), 1)
+        
+    def test_stream_refused_under_wsgi(self, _start):
+        """Test the stream is refused outside ASGI rather than holding a worker."""
+        res = self.client.get(self.url, {'ticket': issue_ticket(self.editor, self.document.id)})
+        self.assertEqual(res.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+        
+    def test_ticket_endpoint(self, _start):
+        """Test tickets are only issued for documents the user can see."""
+        client = APIClient()
+        client.force_authenticate(user=self.other_editor)
+        res = client.post(reverse('documents:document-events-ticket', args=[self.document.id]))
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        
+        client.force_authenticate(user=self.editor)
+        res = client.post(reverse('documents:document-events-ticket', args=[self.document.id]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(read_ticket(res.data['ticket'], self.document.id), self.editor.id)
+        
+    async def test_stream_pushes_progress_until_completed(self, _start):
+        """Test published progress and status events are streamed and end the stream."""
+        token = str(AccessToken.for_user(self.editor))
+        res = await AsyncClient().get(self.url, headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        
+        [first], iterator = await self._read_events(res, 1)
+        self.assertEqual(first, ('status', {'document': self.document.id, 'status': 'processing'}))
+        
+        document_id = self.document.id
+        broadcaster.dispatch({'document': document_id, 'event': 'progress', 'stage': 'embedding', 'done': 8, 'total': 16})
+        # A repeated status is not sent twice
+        broadcaster.dispatch({'document': document_id, 'event': 'status', 'status': 'processing'})
+        broadcaster.dispatch({'document': document_id, 'event': 'status', 'status': 'completed'})
+        
+        events = []
+        async for chunk in iterator:
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            name, data = chunk.strip().split('\n')
+            events.append((name[len('event: '):], json.loads(data[len('data: '):])))
+        self.assertEqual(events, [
+            ('progress', {'document': document_id, 'stage': 'embedding', 'done': 8, 'total': 16}),
+            ('status', {'document': document_id, 'status': 'completed'}),
+        ])
+        self.assertEqual(broadcaster.watched(), [])
+        
+    def test_ingestion_publishes_events(self, _start):
+        """Test ingestion publishes embedding progress and its final status."""
+        with mock.patch('documents.events.broadcaster.dispatch') as dispatch:
+            with self.captureOnCommitCallbacks(execute=True):
+                process_document(self.document.id)
+        
+        events = [call.args[0] for call in dispatch.call_args_list]
+        self.assertEqual(events[0]['event'], 'progress')
+        self.assertEqual(events[0]['stage'], 'embedding')
+        self.assertEqual(events[-1], {'document': self.document.id, 'event': 'status', 'status': 'completed'})
+
+
+class AsyncReadEndpointTests(TestCase):
+    """Tests for the async read path served under ASGI"""
+    
+    def setUp(self):
+        self.editor = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.other_editor = User.objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.documents = [
+            Document.objects.create(
+                title=f"Async Document {i}",
+                file=SimpleUploadedFile(f"async{i}.txt", b"file content"),
+                uploaded_by=self.editor,
+                last_accessed=timezone.now() if i % 2 else None
+            )
+            for i in range(12)
+        ]
+        DocumentEmbedding.objects.create(
+            document=self.documents[0],
+            chunk_text="first chunk",
+            embedding=np.zeros(4, dtype=np.float32),
+            dimensions=4,
+            chunk_index=0
+        )
+        self.client = AsyncClient()
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.editor)}'}
+        
+    async def test_list_is_paginated(self):
+        """Test the async list returns numbered pages like the sync one."""
+        res = await self.client.get(reverse('documents:document-list'), {'page': 2}, headers=self.auth)
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['count'], 12)
+        self.assertEqual(len(res.json()['results']), 2)
+        self.assertIsNone(res.json()['next'])
+        
+        res = await self.client.get(reverse('documents:document-list'), {'page': 3}, headers=self.auth)
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        
+    async def test_detail_and_scope(self):
+        """Test the async detail honours the editor's scope and answers 304."""
+        url = reverse('documents:document-detail', args=[self.documents[0].id])
+        with mock.patch('documents.access.recorder'):
+            res = await self.client.get(url, headers=self.auth)
+            self.assertEqual(res.json()['title'], "Async Document 0")
+            again = await self.client.get(url, headers={**self.auth, 'If-None-Match': res['ETag']})
+        self.assertEqual(again.status_code, status.HTTP_304_NOT_MODIFIED)
+        
+        other = {'Authorization': f'Bearer {AccessToken.for_user(self.other_editor)}'}
+        self.assertEqual((await self.client.get(url, headers=other)).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual((await self.client.get(url)).status_code, status.HTTP_401_UNAUTHORIZED)
+        
+    async def test_recent_with_cursor(self):
+        """Test the async recent action serves keyset pages."""
+        res = await self.client.get(
+            reverse('documents:document-recent'), {'pagination': 'cursor', 'page_size': 4}, headers=self.auth
+        )
+        
+        self.assertEqual(len(res.json()['results']), 4)
+        self.assertIsNotNone(res.json()['next'])
+        
+    async def test_embeddings_list(self):
+        """Test the async embeddings list."""
+        res = await self.client.get(
+            reverse('documents:document-embeddings', args=[self.documents[0].id]), headers=self.auth
+        )
+        
+        self.assertEqual(res.json()['count'], 1)
+        self.assertEqual(res.json()['results'][0]['chunk_text'], "first chunk")
+        
+    async def test_writes_use_the_sync_view(self):
+        """Test other methods on an async route are handed to the sync viewset."""
+        url = reverse('documents:document-detail', args=[self.documents[0].id])
+        res = await self.client.patch(url, {'title': "Renamed"}, content_type='application/json', headers=self.auth)
+        
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.json()['title'], "Renamed")
+
+
+@mock.patch('documents.access.recorder')
+class BulkOperationTests(TestCase):
+    """Tests for the bulk document endpoints"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.editor = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.other_editor = User.objects.create_user(
+            email='other@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.documents = [
+            Document.objects.create(
+                title=f"Bulk Document {i}",
+                file=SimpleUploadedFile(f"bulk{i}.txt", f"content {i}".encode()),
+                uploaded_by=self.editor,
+                status='failed' if i % 2 else 'completed'
+            )
+            for i in range(4)
+        ]
+        self.foreign = Document.objects.create(
+            title="Foreign Document",
+            file=SimpleUploadedFile("foreign.txt", b"foreign content"),
+            uploaded_by=self.other_editor
+        )
+        self.client.force_authenticate(user=self.editor)
+        
+    def test_bulk_upload(self, recorder):
+        """Test several files are uploaded in one request and queued for ingestion."""
+        files = [SimpleUploadedFile(f"new{i}.txt", f"new content {i}".encode()) for i in range(3)]
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post(
+                reverse('documents:document-bulk-upload'),
+                {'files': files, 'description': "Batch", 'ingest': 'true'},
+                format='multipart'
+            )
+        
+        self.assertEqual(res.status_code, status.HTTP_201_CREATED)
+        self.assertEqual([doc['title'] for doc in res.data], ['new0.txt', 'new1.txt', 'new2.txt'])
+        created = Document.objects.filter(description="Batch")
+        self.assertEqual(created.count(), 3)
+        self.assertTrue(all(doc.status == 'processing' and doc.content_hash for doc in created))
+        self.assertEqual(IngestionJob.objects.filter(document__in=created).count(), 3)
+        
+    def test_bulk_upload_rejects_invalid_files(self, recorder):
+        """Test one invalid file rejects the whole batch."""
+        files = [
+            SimpleUploadedFile("good.txt", b"good"),
+            SimpleUploadedFile("bad.exe", b"bad"),
+        ]
+        res = self.client.post(reverse('documents:document-bulk-upload'), {'files': files}, format='multipart')
+        
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('bad.exe', res.data['files'])
+        self.assertFalse(Document.objects.filter(title="good.txt").exists())
+        
+    def test_bulk_delete_checks_the_whole_set(self, recorder):
+        """Test a batch including another editor's document changes nothing."""
+        ids = [doc.id for doc in self.documents]
+        res = self.client.post(
+            reverse('documents:document-bulk-delete'), {'ids': ids + [self.foreign.id]}, format='json'
+        )
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(res.data['ids'], [self.foreign.id])
+        self.assertEqual(Document.objects.count(), 5)
+        
+        res = self.client.post(reverse('documents:document-bulk-delete'), {'ids': ids}, format='json')
+        self.assertEqual(res.data, {'deleted': 4})
+        self.assertEqual(list(Document.objects.values_list('id', flat=True)), [self.foreign.id])
+        
+    def test_bulk_ingest_skips_completed_documents(self, recorder):
+        """Test only pending and failed documents are queued, in one request."""
+        ids = [doc.id for doc in self.documents]
+        # Including three to count the status change in the statistics
+        with self.assertNumQueries(9):
+            res = self.client.post(reverse('documents:document-bulk-ingest'), {'ids': ids}, format='json')
+        
+        self.assertEqual(res.data['queued'], ids[1::2])
+        self.assertEqual(res.data['skipped'], ids[0::2])
+        self.assertEqual(
+            set(IngestionJob.objects.values_list('document_id', flat=True)), set(ids[1::2])
+        )
+        
+    def test_bulk_status(self, recorder):
+        """Test the status of many documents is changed at once."""
+        ids = [doc.id for doc in self.documents]
+        res = self.client.post(
+            reverse('documents:document-bulk-status'), {'ids': ids, 'status': 'pending'}, format='json'
+        )
+        
+        self.assertEqual(res.data, {'updated': 4})
+        self.assertEqual(Document.objects.filter(status='pending').count(), 5)
+        
+    def test_bulk_status_leaves_ingestion_states_to_the_queue(self, recorder):
+        """Test documents cannot be marked processing or completed without being ingested."""
+        ids = [doc.id for doc in self.documents]
+        before = dict(Document.objects.values_list('id', 'status'))
+        for value in ('processing', 'completed'):
+            res = self.client.post(
+                reverse('documents:document-bulk-status'), {'ids': ids, 'status': value}, format='json'
+            )
+            self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(dict(Document.objects.values_list('id', 'status')), before)
+        
+    def test_viewers_cannot_bulk_change(self, recorder):
+        """Test viewers are refused bulk operations."""
+        viewer = User.objects.create_user(email='viewer@example.com', password='testpass123', role='viewer')
+        self.client.force_authenticate(user=viewer)
+        res = self.client.post(
+            reverse('documents:document-bulk-delete'), {'ids': [self.documents[0].id]}, format='json'
+        )
+        
+        self.assertEqual(res.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class IncrementalEmbeddingTests(TestCase):
+    """Tests for re-embedding only the chunks that changed"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.words = [f"token{i}" for i in range(2000)]
+        self.document = Document.objects.create(
+            title="Long Document",
+            file=SimpleUploadedFile("long.txt", b"file content"),
+            uploaded_by=self.user,
+            content=" ".join(self.words)
+        )
+        self.original = embed_document(self.document)
+        
+    def _rows(self):
+        return list(self.document.embeddings.order_by('chunk_index').values_list('id', 'chunk_index', 'chunk_hash'))
+        
+    def test_unchanged_content_embeds_nothing(self):
+        """Test re-embedding the same content keeps every row and writes none."""
+        before = self._rows()
+        
+        with mock.patch.object(HashingEmbeddingBackend, 'embed') as embed:
+            created = embed_document(self.document)
+        
+        embed.assert_not_called()
+        self.assertEqual(created, [])
+        self.assertEqual(self._rows(), before)
+        
+    def test_edited_chunk_is_replaced(self):
+        """Test only the chunks containing an edit are embedded again."""
+        before = self._rows()
+        self.words[1000] = "edited"
+        self.document.content = " ".join(self.words)
+        
+        with mock.patch.object(HashingEmbeddingBackend, 'embed', wraps=HashingEmbeddingBackend(384).embed) as embed:
+            created = embed_document(self.document)
+        
+        [texts] = embed.call_args.args
+        self.assertTrue(all("edited" in text for text in texts))
+        after = self._rows()
+        self.assertEqual([index for _, index, _ in after], list(range(len(before))))
+        self.assertEqual({pk for pk, _, _ in after} - {pk for pk, _, _ in before}, {row.pk for row in created})
+        self.assertEqual(len(before) - len(set(before) & set(after)), len(created))
+        
+    def test_removed_and_duplicate_chunks_are_deleted(self):
+        """Test stale chunks and duplicates from earlier runs are removed in bulk."""
+        DocumentEmbedding.objects.bulk_create(
+            DocumentEmbedding(document=self.document, chunk_text=row.chunk_text, chunk_hash=row.chunk_hash,
+                              embedding=row.embedding, dimensions=row.dimensions, chunk_index=row.chunk_index)
+            for row in self.original
+        )
+        self.document.content = " ".join(self.words[:500])
+        
+        created = embed_document(self.document)
+        
+        expected = list(chunk_text(self.document.content, window=200, overlap=40))
+        self.assertEqual(
+            list(self.document.embeddings.order_by('chunk_index').values_list('chunk_index', 'chunk_text')),
+            expected
+        )
+        self.assertEqual(len(created), 1)
+        
+    def test_reingestion_does_not_duplicate_rows(self):
+        """Test processing a document again leaves one row per chunk."""
+        document = Document.objects.create(
+            title="Report",
+            file=SimpleUploadedFile("report.txt", " ".join(self.words).encode()),
+            uploaded_by=self.user
+        )
+        process_document(document.id)
+        count = document.embeddings.count()
+        
+        process_document(document.id)
+        
+        self.assertEqual(document.embeddings.count(), count)
+        self.assertEqual(
+            document.embeddings.values('chunk_index').distinct().count(), count
+        )
+
+
+def _write_presentation(path, slides):
+    """Write a minimal pptx whose slide parts are numbered in reverse of their order"""
+    p = 'http://schemas.openxmlformats.org/presentationml/2006/main'
+    a = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+    r = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+    count = len(slides)
+    with zipfile.ZipFile(path, 'w') as package:
+        package.writestr('ppt/presentation.xml', (
+            f'<p:presentation xmlns:p="{p}" xmlns:r="{r}"><p:sldIdLst>'
+            + ''.join(f'<p:sldId id="{256 + i}" r:id="rId{i}"/>' for i in range(count))
+            + '</p:sldIdLst></p:presentation>'
+        ))
+        package.writestr('ppt/_rels/presentation.xml.rels', (
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            + ''.join(f'<Relationship Id="rId{i}" Target="slides/slide{count - i}.xml"/>' for i in range(count))
+            + '</Relationships>'
+        ))
+        for i, paragraphs in enumerate(slides):
+            package.writestr(f'ppt/slides/slide{count - i}.xml', (
+                f'<p:sld xmlns:p="{p}" xmlns:a="{a}"><p:cSld><p:spTree><p:sp><p:txBody>'
+                + ''.join(f'<a:p><a:r><a:t>{text}</a:t></a:r></a:p>' for text in paragraphs)
+                + '</p:txBody></p:sp></p:spTree></p:cSld></p:sld>'
+            ))
+
+
+class ExtractorRegistryTests(TestCase):
+    """Tests for choosing and running extractors by sniffed file type"""
+    
+    def setUp(self):
+        self.engine = ExtractionEngine(max_workers=1, timeout=60)
+        self.addCleanup(self.engine.shutdown)
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        
+    def _path(self, name, data=None):
+        path = os.path.join(self.tmpdir, name)
+        if data is not None:
+            with open(path, 'wb') as f:
+                f.write(data)
+        return path
+        
+    def test_sniff_type_ignores_extension(self):
+        """Test file types are recognised by their content."""
+        import docx
+        word = self._path('report.pdf')
+        docx.Document().save(word)
+        slides = self._path('slides.bin')
+        _write_presentation(slides, [["Title"]])
+        
+        self.assertEqual(sniff_type(word), extractors.DOCX)
+        self.assertEqual(sniff_type(slides), extractors.PPTX)
+        self.assertEqual(sniff_type(self._path('scan.txt', b'%PDF-1.4 ...')), extractors.PDF)
+        self.assertEqual(sniff_type(self._path('a.jpg', b'\x89PNG\r\n\x1a\n....')), extractors.PNG)
+        self.assertEqual(sniff_type(self._path('old.doc', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1')), extractors.OLE)
+        self.assertEqual(sniff_type(self._path('notes.xlsx', b'plain words')), extractors.TEXT)
+        
+    def test_extract_spreadsheet_by_sheet(self):
+        """Test workbooks are extracted row by row with a page per sheet."""
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.active.title = "Budget"
+        workbook.active.append(["Item", "Cost"])
+        workbook.active.append(["Paper", 12])
+        workbook.create_sheet("Notes").append([None, "checked"])
+        path = self._path('budget.xlsx')
+        workbook.save(path)
+        
+        text, offsets = self.engine.extract(get_extractor(sniff_type(path)), path)
+        
+        self.assertEqual(text, "Budget\nItem\tCost\nPaper\t12\n\nNotes\n\tchecked\n\n")
+        self.assertEqual(offsets, [0, text.index("Notes")])
+        
+    def test_extract_presentation_in_slide_order(self):
+        """Test slides are extracted in presentation order with a page each."""
+        path = self._path('deck.pptx')
+        _write_presentation(path, [["Welcome", "Agenda"], ["Results"]])
+        
+        text, offsets = self.engine.extract(get_extractor(sniff_type(path)), path)
+        
+        self.assertEqual(text, "Welcome\nAgenda\n\nResults\n\n")
+        self.assertEqual(offsets, [0, text.index("Results")])
+        
+    def test_extract_image_metadata(self):
+        """Test images yield their format, size and text metadata."""
+        from PIL import Image, PngImagePlugin
+        info = PngImagePlugin.PngInfo()
+        info.add_text('Description', 'Signed delivery note')
+        path = self._path('scan.png')
+        Image.new('RGB', (40, 30)).save(path, pnginfo=info)
+        
+        text, offsets = self.engine.extract(get_extractor(sniff_type(path)), path)
+        
+        self.assertEqual(text, "PNG image, 40x30 pixels, RGB\nDescription: Signed delivery note\n")
+        self.assertEqual(offsets, [])
+        
+    def test_configured_extractor_and_unsupported_types(self):
+        """Test settings can register extractors and unknown types raise."""
+        path = self._path('legacy.xls', b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1' + b'\0' * 64)
+        
+        with self.assertRaises(UnsupportedFileType):
+            extract_file(path)
+        with self.settings(DOCUMENTS={
+            **settings.DOCUMENTS, 'EXTRACTORS': {extractors.OLE: 'documents.extractors._extract_text'}
+        }):
+            self.assertIs(get_extractor(extractors.OLE), extractors._extract_text)
+
+
+@mock.patch('documents.access.recorder')
+class DocumentStatisticsTests(TestCase):
+    """Tests for the maintained document statistics"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.admin = User.objects.create_user(
+            email='admin@example.com',
+            password='testpass123',
+            role='admin'
+        )
+        self.editor = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.report = Document.objects.create(
+            title="Report",
+            file=SimpleUploadedFile("report.pdf", b"%PDF-1.4 report"),
+            uploaded_by=self.editor
+        )
+        self.notes = Document.objects.create(
+            title="Notes",
+            file=SimpleUploadedFile("notes.txt", b"some notes"),
+            uploaded_by=self.admin
+        )
+        
+    def assertCountersMatchDocuments(self):
+        stored = {
+            (owner_id, shard, key): [count, size]
+            for owner_id, shard, key, count, size in DocumentStat.objects.values_list(
+                'user_id', 'shard', 'key', 'count', 'total_size'
+            )
+            if count or size
+        }
+        self.assertEqual(stored, dict(stats.count_documents(Document)))
+        
+    def test_saves_are_counted(self, recorder):
+        """Test creating and changing documents one at a time updates the counters."""
+        enqueue_ingestion(self.report)
+        # An instance loaded before the change is counted as stored
+        stale = Document.objects.get(pk=self.notes.pk)
+        Document.objects.filter(pk=self.notes.pk).update(status='failed')
+        stale.status = 'completed'
+        stale.save(update_fields=['status', 'updated_at'])
+        
+        own = stats.summary(self.editor)
+        self.assertEqual(own['count'], 1)
+        self.assertEqual(own['total_size'], 15)
+        self.assertEqual(own['by_status']['processing'], {'count': 1, 'total_size': 15})
+        self.assertEqual(own['by_status']['pending'], {'count': 0, 'total_size': 0})
+        self.assertEqual(own['by_type'], {'pdf': {'count': 1, 'total_size': 15}})
+        everyone = stats.summary()
+        self.assertEqual(everyone['count'], 2)
+        self.assertEqual(everyone['by_status']['completed']['count'], 1)
+        self.assertEqual(everyone['by_status']['failed']['count'], 0)
+        self.assertCountersMatchDocuments()
+        
+    def test_bulk_writes_are_counted(self, recorder):
+        """Test bulk creates, status updates and deletes keep the counters exact."""
+        files = [SimpleUploadedFile(f"batch{i}.txt", b"x" * (i + 1)) for i in range(3)]
+        uploaded = upload_documents(files, self.editor, ingest=True)
+        self.assertCountersMatchDocuments()
+        
+        set_documents_status(Document.objects.filter(file_type='txt'), 'failed')
+        self.assertCountersMatchDocuments()
+        
+        Document.objects.filter(pk__in=[document.pk for document in uploaded[:2]]).delete()
+        self.report.delete()
+        self.assertCountersMatchDocuments()
+        self.assertEqual(stats.summary()['by_type'], {'txt': {'count': 2, 'total_size': 13}})
+        
+    def test_expression_updates_count_the_locked_rows(self, recorder):
+        """Test updating counted fields to expressions counts what the locked rows became, without a recount."""
+        with mock.patch('documents.stats.rebuild') as rebuild:
+            Document.objects.filter(pk=self.report.pk).update(file_size=F('file_size') * 2)
+        
+        rebuild.assert_not_called()
+        self.assertEqual(stats.summary(self.editor)['total_size'], 30)
+        self.assertCountersMatchDocuments()
+        
+    def test_saves_leaving_counted_fields_alone(self, recorder):
+        """Test saving a loaded document without changing what it is counted as adds no query."""
+        document = Document.objects.get(pk=self.report.pk)
+        document.title = "Renamed"
+        
+        with CaptureQueriesContext(connection) as queries:
+            document.save()
+        
+        self.assertFalse([query for query in queries if query['sql'].startswith('SELECT')])
+        self.assertFalse(DocumentStat.objects.filter(count__lt=0).exists())
+        
+    def test_global_counters_are_sharded(self, recorder):
+        """Test owners count towards their own shard of the global counters, read as one."""
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'STATS_GLOBAL_SHARDS': 4}):
+            stats.rebuild()
+            shards = set(DocumentStat.objects.filter(user=None, key='total').values_list('shard', flat=True))
+            self.assertEqual(shards, {self.editor.pk % 4, self.admin.pk % 4})
+            self.assertEqual(stats.summary()['count'], 2)
+            self.assertCountersMatchDocuments()
+        
+    def test_deleting_an_owner(self, recorder):
+        """Test deleting a user drops their counters and their documents from the totals."""
+        self.editor.delete()
+        
+        self.assertFalse(DocumentStat.objects.filter(key='type:pdf', count__gt=0).exists())
+        self.assertCountersMatchDocuments()
+        
+    def test_stats_endpoint(self, recorder):
+        """Test the stats endpoint reads a constant number of rows, scoped to the user."""
+        self.client.force_authenticate(user=self.editor)
+        with self.assertNumQueries(1):
+            res = self.client.get(reverse('documents:document-stats'))
+        self.assertEqual(res.data['user'], self.editor.pk)
+        self.assertEqual(res.data['count'], 1)
+        
+        self.client.force_authenticate(user=self.admin)
+        res = self.client.get(reverse('documents:document-stats'))
+        self.assertIsNone(res.data['user'])
+        self.assertEqual(res.data['count'], 2)
+        self.assertEqual(set(res.data['by_type']), {'pdf', 'txt'})
+        res = self.client.get(reverse('documents:document-stats'), {'user': self.editor.pk})
+        self.assertEqual(res.data['by_type'], {'pdf': {'count': 1, 'total_size': 15}})
+        self.assertEqual(
+            self.client.get(reverse('documents:document-stats'), {'user': 'x'}).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        
+    def test_many_counters(self, recorder):
+        """Test changes to more counters than fit in one update are all applied."""
+        uploaded = upload_documents(
+            [SimpleUploadedFile(f"file-{number}.{extension}", f"file {number}".encode())
+             for number, extension in enumerate(['txt', 'csv', 'md', 'json', 'xml'])],
+            uploaded_by=self.admin
+        )
+        
+        with mock.patch.object(stats, 'UPDATE_BATCH_SIZE', 2):
+            Document.objects.filter(pk__in=[document.pk for document in uploaded]).update(status='failed')
+        
+        self.assertCountersMatchDocuments()
+        
+    def test_rebuild(self, recorder):
+        """Test the counters can be recounted from the documents."""
+        DocumentStat.objects.update(count=99)
+        
+        stats.rebuild()
+        
+        self.assertCountersMatchDocuments()
+
+
+@mock.patch('documents.access.recorder')
+@override_settings(DOCUMENTS={**TEST_DOCUMENTS, 'METRICS_ENABLED': True})
+class MetricsTests(TestCase):
+    """Tests for the request and ingestion metrics"""
+    
+    def setUp(self):
+        self.client = APIClient()
+        self.user = User.objects.create_user(
+            email='editor@example.com',
+            password='testpass123',
+            role='editor'
+        )
+        self.document = Document.objects.create(
+            title="Notes",
+            file=SimpleUploadedFile("notes.txt", b"some notes to ingest"),
+            uploaded_by=self.user
+        )
+        # The test connection was opened before metrics were enabled
+        metrics.install_query_timer(sender=None, connection=connection)
+        self.addCleanup(connection.execute_wrappers.remove, metrics._time_query)
+        for metric in metrics.registry.metrics.values():
+            metric._series.clear()
+            
+    def scrape(self, **extra):
+        res = self.client.get(reverse('metrics'), **extra)
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        return res.content.decode()
+        
+    def test_requests_are_timed(self, recorder):
+        """Test a request records its latency, queries and authentication stages."""
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        res = self.client.get(reverse('documents:document-detail', args=[self.document.pk]))
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        
+        body = self.scrape()
+        self.assertIn(
+            'documents_http_request_duration_seconds_count'
+            '{view="documents:document-detail",method="GET",status="200"} 1', body
+        )
+        queries = metrics.REQUEST_QUERIES.snapshot()['["documents:document-detail"]']
+        # Every observation falls in a bucket above zero queries
+        self.assertEqual(queries[0], 0)
+        self.assertEqual(sum(queries[:-1]), 1)
+        self.assertIn('documents_stage_duration_seconds_count{stage="jwt_decode"} 1', body)
+        self.assertIn('documents_stage_duration_seconds_count{stage="jwt_user"} 1', body)
+        self.assertIn('documents_stage_duration_seconds_count{stage="serialize"} 1', body)
+        
+    def test_ingestion_is_counted(self, recorder):
+        """Test ingestion records its stages, throughput and the queue depth."""
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'METRICS_ENABLED': True}):
+            job = enqueue_ingestion(self.document)
+            run_job(job)
+            enqueue_ingestion(self.document)
+            body = self.scrape()
+        
+        self.assertIn('documents_ingestion_jobs_total{result="completed"} 1', body)
+        self.assertIn(f'documents_ingested_bytes_total {self.document.file_size}', body)
+        self.assertIn('documents_ingested_chunks_total 1', body)
+        for name in ('reuse', 'extract', 'embed', 'index'):
+            self.assertIn(f'documents_stage_duration_seconds_count{{stage="{name}"}} 1', body)
+        self.assertIn('documents_ingestion_queue_jobs{status="queued"} 1', body)
+        
+    def test_processes_are_summed(self, recorder):
+        """Test a scrape sums the snapshots other processes wrote to METRICS_DIR."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        other = {'documents_ingested_chunks_total': {'[]': 5}}
+        with open(os.path.join(directory, '1.json'), 'w') as f:
+            json.dump(other, f)
+        
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'METRICS_ENABLED': True, 'METRICS_DIR': directory}):
+            metrics.INGESTED_CHUNKS.inc(2)
+            body = self.scrape()
+        
+        self.assertIn('documents_ingested_chunks_total 7', body)
+        self.assertTrue(os.path.exists(os.path.join(directory, f'{os.getpid()}.json')))
+        
+    def test_token_required(self, recorder):
+        """Test the endpoint requires the configured token."""
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'METRICS_ENABLED': True, 'METRICS_TOKEN': 's3cret'}):
+            res = self.client.get(reverse('metrics'))
+            self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+            self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+        
+    def test_disabled(self, recorder):
+        """Test nothing is recorded or served when metrics are disabled."""
+        with override_settings(DOCUMENTS={**settings.DOCUMENTS, 'METRICS_ENABLED': False}):
+            with metrics.stage('extract'):
+                pass
+            metrics.INGESTION_JOBS.inc(result='completed')
+            res = self.client.get(reverse('metrics'))
+        
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(metrics.registry.snapshot()['documents_stage_duration_seconds'], {})
+        self.assertEqual(metrics.registry.snapshot()['documents_ingestion_jobs_total'], {})
+
+
+@mock.patch('documents.access.recorder')
+class ApiBenchmarkTests(TestCase):
+    """Tests for the API and ingestion benchmark"""
+    
+    def test_endpoints_and_ingestion_are_measured(self, recorder):
+        """Test every endpoint and ingestion is measured and the seeded data is removed."""
+        results = bench_api(documents=300, owners=5, embedded=50, chunks=2, requests=3, ingest=2, file_kb=4)
+        
+        self.assertEqual(set(results['endpoints']), {
+            'list', 'list_cursor', 'editor_list', 'detail', 'recent', 'search', 'semantic_search', 'stats', 'upload'
+        })
+        for name, endpoint in results['endpoints'].items():
+            self.assertEqual(endpoint['errors'], 0, name)
+            self.assertLessEqual(endpoint['p50_ms'], endpoint['p99_ms'])
+            self.assertGreater(endpoint['queries_per_request'], 0)
+        self.assertEqual(results['ingestion']['documents'], 2)
+        self.assertGreater(results['ingestion']['chunks'], 0)
+        self.assertEqual(set(results['peak_memory_mb']), {'seeding', 'requests', 'ingestion'})
+        self.assertGreater(results['peak_memory_mb']['ingestion'], 0)
+        json.dumps(results)
+        self.assertFalse(Document.objects.exists())
+        self.assertFalse(User.objects.exists())
+        
+    def test_command_requires_confirmation(self, recorder):
+        """Test the command refuses to commit benchmark data with DEBUG off unless told to."""
+        with self.assertRaises(CommandError):
+            call_command('benchmark', 'api', stdout=io.StringIO())
+        self.assertFalse(User.objects.exists())
@@ -0,0 +1,180 @@
+"""
+Resumable, chunked uploads.
+
+A client opens an ``UploadSession``, appends the file in parts and then
+completes it. Each part is streamed from the request body straight into the
+session's file in the default storage, at its offset, while its size and
+SHA-256 are computed, so no request holds more than one read block in
+memory. Completing the upload hashes the file once and renames it into
+place as the document's file, so its bytes are written only once; a file
+whose bytes are already stored is then dropped in favour of the existing
+copy (see ``documents.blobs``). Writing in place needs a storage with local
+paths, such as ``FileSystemStorage``.
+
+Appending and completing lock the session row, so parts of one upload are
+written one at a time and an upload is completed at most once.
+
+The per-part hashes are not chained into the file's hash: ``hashlib``
+objects cannot be saved to the session or shared between server processes,
+and parts of one upload may reach different processes. The whole-file hash
+is instead taken in one read of the assembled file on completion, which
+costs SHA-256 CPU time over the file but no extra write.
+"""
+import hashlib
+import os
+import shutil
+
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import blobs
+from .conf import get_setting
+from .models import Document, UploadPart, UploadSession
+
+
+class UploadError(Exception):
+    """An upload request that cannot be applied"""
+
+
+class UploadOffsetMismatch(UploadError):
+    """The part does not start where the stored bytes end"""
+
+
+class UploadTooLarge(UploadError):
+    """The upload would exceed its declared or maximum size"""
+
+
+class UploadIncomplete(UploadError):
+    """The upload was completed before all of its bytes arrived"""
+
+
+class UploadClosed(UploadError):
+    """The upload was already completed or purged"""
+
+
+class HashingReader:
+    """File-like wrapper that counts and hashes the bytes read through it"""
+
+    def __init__(self, stream, limit=None):
+        self.stream = stream
+        self.limit = limit
+        self.size = 0
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        if self.limit is not None:
+            remaining = self.limit - self.size
+            if remaining <= 0:
+                return b''
+            size = remaining if size is None or size < 0 else min(size, remaining)
+        data = self.stream.read(size)
+        self.size += len(data)
+        self.sha256.update(data)
+        return data
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+
+def max_upload_size(session):
+    limit = get_setting('UPLOAD_MAX_SIZE')
+    return min(session.size, limit) if session.size is not None else limit
+
+
+def upload_file_name(session):
+    """Storage name of the file the parts of ``session`` are written into"""
+    return f"{get_setting('UPLOAD_DIR')}/{session.pk}"
+
+
+def _lock_session(session):
+    """Lock the row of ``session`` and refresh it; call inside a transaction"""
+    locked = UploadSession.objects.select_for_update().filter(pk=session.pk).first()
+    if locked is None:
+        raise UploadClosed("The upload was already completed")
+    session.received, session.size = locked.received, locked.size
+    return session
+
+
+def append_part(session, stream, offset, length):
+    """
+    Write ``length`` bytes read from ``stream`` into the file of ``session``
+    at ``offset``. Returns the stored ``UploadPart``.
+    """
+    with transaction.atomic():
+        _lock_session(session)
+        if offset != session.received:
+            raise UploadOffsetMismatch(f"Expected offset {session.received}, got {offset}")
+        if length > get_setting('UPLOAD_PART_MAX_SIZE') or offset + length > max_upload_size(session):
+            raise UploadTooLarge("Part exceeds the allowed upload size")
+
+        name = upload_file_name(session)
+        path = default_storage.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        reader = HashingReader(stream, limit=length)
+        # Bytes left past the offset by an interrupted part are overwritten
+        with open(path, 'wb' if offset == 0 else 'r+b') as f:
+            f.seek(offset)
+            shutil.copyfileobj(reader, f)
+        if reader.size != length:
+            # The client went away mid-part; it resumes from the stored offset
+            raise UploadIncomplete(f"Received {reader.size} of {length} bytes")
+
+        part = UploadPart.objects.create(
+            session=session, offset=offset, size=length, sha256=reader.hexdigest(), name=name,
+        )
+        UploadSession.objects.filter(pk=session.pk).update(
+            received=F('received') + length, updated_at=timezone.now(),
+        )
+    session.received = offset + length
+    return part
+
+
+def complete_upload(session):
+    """Turn the file of ``session`` into a new ``Document``"""
+    moved = None
+    try:
+        with transaction.atomic():
+            _lock_session(session)
+            if session.size is not None and session.received != session.size:
+                raise UploadIncomplete(f"Received {session.received} of {session.size} bytes")
+            if not session.received:
+                raise UploadIncomplete("No data was uploaded")
+
+            path = default_storage.path(upload_file_name(session))
+            with open(path, 'rb') as f:
+                reader = HashingReader(f, limit=session.received)
+                while reader.read(1024 * 1024):
+                    pass
+            if reader.size != session.received:
+                raise UploadIncomplete(f"Assembled {reader.size} of {session.received} bytes")
+            # Drop bytes an interrupted last part left behind
+            os.truncate(path, session.received)
+
+            document = Document(
+                title=session.title or session.filename,
+                description=session.description,
+                uploaded_by=session.uploaded_by,
+                file_type=Document._extension(session.filename),
+                file_size=reader.size,
+                content_hash=reader.hexdigest(),
+            )
+            name = default_storage.get_available_name(
+                document.file.field.generate_filename(document, session.filename)
+            )
+            target = default_storage.path(name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+            moved = target
+            document.file = name
+            # Keeps the existing copy instead if these bytes are already stored
+            blobs.acquire(document)
+            document.save()
+            session.delete()
+    except Exception:
+        if moved is not None:
+            # Put the file back, so completing can be retried
+            os.replace(moved, path)
+        raise
+    return document
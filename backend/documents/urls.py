@@ -1,18 +1,24 @@
 from django.urls import path, include
-from rest_framework.routers import DefaultRouter
-from .views import DocumentViewSet, DocumentEmbeddingViewSet
+from rest_framework.routers import DefaultRouter, SimpleRouter
+from .views import DocumentViewSet, DocumentEmbeddingViewSet, UploadSessionViewSet, document_events
 
 app_name = 'documents'
 
 router = DefaultRouter()
 router.register('', DocumentViewSet)
 
+# Registered ahead of the documents so 'uploads' isn't taken for a document id
+upload_router = SimpleRouter()
+upload_router.register('uploads', UploadSessionViewSet, basename='upload')
+
 # Nested router for document embeddings
 embedding_patterns = [
     path('<int:document_id>/embeddings/', DocumentEmbeddingViewSet.as_view({'get': 'list'}), name='document-embeddings'),
+    path('<int:pk>/events/', document_events, name='document-events'),
 ]
 
 urlpatterns = [
+    path('', include(upload_router.urls)),
     path('', include(router.urls)),
     path('', include(embedding_patterns)),
 ] 
\ No newline at end of file
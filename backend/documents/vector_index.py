@@ -0,0 +1,488 @@
+"""
+Approximate nearest-neighbour index over ``DocumentEmbedding`` vectors.
+
+The index is an IVF (inverted file) index built with NumPy: vectors are
+clustered with k-means, stored sorted by cluster, and a query only scores the
+``nprobe`` clusters whose centroids are closest to it. Vectors added after a
+build go to small delta segments, one file set per batch, that are scanned
+exhaustively until the next rebuild; once there are ``DELTA_SEGMENT_LIMIT``
+of them they are merged into one. Deleted embeddings and documents are
+recorded as tombstones that searches filter out, until a rebuild leaves them
+out of the index. Rebuilds run in the ingestion worker, beside the jobs, once
+the delta or the tombstones outgrow ``VECTOR_INDEX_DELTA_LIMIT``, or through
+the ``build_vector_index`` command.
+
+Everything lives in ``.npy`` files loaded with ``mmap_mode='r'``, so starting
+a worker maps the index instead of rebuilding it. A build writes a new
+generation directory and then swaps the ``CURRENT`` pointer, and every delta
+and tombstone write replaces ``manifest.json``, so readers in other
+processes always see a complete index and pick up changes on their next
+search.
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+from django.db import transaction
+
+from .fields import VECTOR_DTYPE
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BASE_FILES = ('centroids', 'offsets', 'vectors', 'ids', 'documents')
+DELTA_FILES = ('vectors', 'ids', 'documents')
+# Delta segments kept before they are merged into one
+DELTA_SEGMENT_LIMIT = 32
+# Deleted embedding ids and document ids
+DELETED_FILES = ('ids', 'documents')
+
+
+def _save(path, array):
+    """Write an array next to ``path`` and move it into place atomically"""
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+def _top_k(scores, k):
+    """Indices of the ``k`` highest scores, best first"""
+    if len(scores) > k:
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind='stable')]
+
+
+def kmeans(vectors, clusters, iterations=10, seed=0):
+    """Spherical k-means on L2-normalised ``vectors``; returns the centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignment, vectors)
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        # Keep the previous centroid for clusters that lost all their members
+        empty = norms[:, 0] == 0
+        sums[empty] = centroids[empty]
+        norms[empty] = 1
+        centroids = (sums / norms).astype(VECTOR_DTYPE)
+    return centroids
+
+
+class VectorIndex:
+    """IVF index stored under ``path``"""
+
+    def __init__(self, path, nprobe=8, delta_limit=50000, train_sample=20000, block_size=8192):
+        self.path = path
+        self.nprobe = nprobe
+        self.delta_limit = delta_limit
+        self.train_sample = train_sample
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._generation = None
+        self._deleted_version = None
+        self._base = None
+        # Mapped delta segments by version, in the order they were added
+        self._delta = {}
+        self._deleted = None
+
+    # -- storage -------------------------------------------------------
+
+    def _current_generation(self):
+        try:
+            with open(os.path.join(self.path, 'CURRENT')) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _read_manifest(self, generation):
+        with open(os.path.join(self.path, generation, 'manifest.json')) as f:
+            return json.load(f)
+
+    def _write_manifest(self, generation, manifest):
+        path = os.path.join(self.path, generation, 'manifest.json')
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialise index writers across threads and processes"""
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock, open(os.path.join(self.path, 'LOCK'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _load(self, retries=3):
+        """Map the current generation and delta segments, reloading only what changed"""
+        for attempt in range(retries):
+            try:
+                return self._load_current()
+            except FileNotFoundError:
+                # A writer replaced the files between reading CURRENT and mapping them
+                if attempt == retries - 1:
+                    raise
+
+    def _load_current(self):
+        generation = self._current_generation()
+        if generation is None:
+            self._generation, self._base, self._delta, self._deleted = None, None, {}, None
+            return
+        manifest = self._read_manifest(generation)
+        directory = os.path.join(self.path, generation)
+        if generation != self._generation:
+            self._base = {
+                name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                for name in BASE_FILES
+            }
+            self._generation = generation
+            self._delta = {}
+            self._deleted_version = None
+        if list(self._delta) != manifest['delta']:
+            self._delta = {
+                version: self._delta.get(version) or self._load_segment(directory, version, mmap_mode='r')
+                for version in manifest['delta']
+            }
+        deleted = manifest.get('deleted', 0)
+        if deleted != self._deleted_version:
+            self._deleted = {
+                name: np.load(os.path.join(directory, f"deleted-{name}-{deleted}.npy"))
+                for name in DELETED_FILES
+            } if deleted else None
+            self._deleted_version = deleted
+
+    @staticmethod
+    def _load_segment(directory, version, mmap_mode=None):
+        return {
+            name: np.load(os.path.join(directory, f"delta-{name}-{version}.npy"), mmap_mode=mmap_mode)
+            for name in DELTA_FILES
+        }
+
+    @contextmanager
+    def rebuilding(self, wait=True):
+        """
+        Hold the rebuild lock, so one process rebuilds at a time; yields
+        whether it was taken, which without ``wait`` it may not be.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, 'REBUILD'), 'w') as lock_file:
+            if fcntl is None:
+                yield True
+                return
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def needs_rebuild(self):
+        """Whether the delta or the tombstones have outgrown ``delta_limit``"""
+        with self._lock:
+            self._load()
+            delta, deleted = self._delta, self._deleted
+        pending = sum(len(segment['ids']) for segment in delta.values())
+        if deleted is not None:
+            pending = max(pending, len(deleted['ids']) + len(deleted['documents']))
+        return pending > self.delta_limit
+
+    # -- building ------------------------------------------------------
+
+    def build(self, rows, count, dimensions):
+        """
+        Build and publish a new generation from ``rows``, an iterable of
+        ``(embedding_id, document_id, vector)`` yielding ``count`` items.
+        """
+        generation, filled = self._build_generation(rows, count, dimensions)
+        with self._write_lock():
+            previous = self._publish(generation)
+        if previous:
+            # Processes that still map the old files keep them alive on POSIX
+            shutil.rmtree(os.path.join(self.path, previous), ignore_errors=True)
+        return filled
+
+    def _build_generation(self, rows, count, dimensions):
+        generation = f"gen-{time.time_ns()}"
+        directory = os.path.join(self.path, generation)
+        os.makedirs(directory)
+
+        staged = os.path.join(directory, 'staged-vectors.npy')
+        vectors = np.lib.format.open_memmap(staged, mode='w+', dtype=VECTOR_DTYPE, shape=(count, dimensions))
+        ids = np.empty(count, dtype=np.int64)
+        documents = np.empty(count, dtype=np.int64)
+        filled = 0
+        for embedding_id, document_id, vector in rows:
+            if filled == count:
+                break
+            if vector is None or len(vector) != dimensions:
+                continue
+            vectors[filled] = vector
+            ids[filled] = embedding_id
+            documents[filled] = document_id
+            filled += 1
+        vectors, ids, documents = vectors[:filled], ids[:filled], documents[:filled]
+
+        if filled:
+            clusters = max(1, min(1024, int(np.sqrt(filled))))
+            sample = np.sort(np.random.default_rng(0).choice(filled, min(filled, self.train_sample), replace=False))
+            centroids = kmeans(np.asarray(vectors[sample]), min(clusters, len(sample)))
+        else:
+            centroids = np.zeros((1, dimensions), dtype=VECTOR_DTYPE)
+
+        assignment = np.empty(filled, dtype=np.int32)
+        for start in range(0, filled, self.block_size):
+            block = np.asarray(vectors[start:start + self.block_size])
+            assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind='stable')
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=offsets[1:])
+
+        ordered = np.lib.format.open_memmap(
+            os.path.join(directory, 'vectors.npy'), mode='w+', dtype=VECTOR_DTYPE, shape=(filled, dimensions)
+        )
+        for start in range(0, filled, self.block_size):
+            ordered[start:start + self.block_size] = vectors[order[start:start + self.block_size]]
+        ordered.flush()
+        del ordered, vectors
+        os.unlink(staged)
+
+        np.save(os.path.join(directory, 'centroids.npy'), centroids)
+        np.save(os.path.join(directory, 'offsets.npy'), offsets)
+        np.save(os.path.join(directory, 'ids.npy'), ids[order])
+        np.save(os.path.join(directory, 'documents.npy'), documents[order])
+        self._write_manifest(generation, {'dimensions': dimensions, 'delta': [], 'delta_size': 0, 'deleted': 0})
+        return generation, filled
+
+    def _publish(self, generation):
+        """
+        Point ``CURRENT`` at ``generation`` and return the previous one.
+
+        Vectors added to the previous generation while the new one was being
+        built are carried over so they are not lost, and so are tombstones
+        of vectors the new generation still holds. Callers hold the write lock.
+        """
+        previous = self._current_generation()
+        if previous:
+            old = self._read_manifest(previous)
+            old_directory = os.path.join(self.path, previous)
+            directory = os.path.join(self.path, generation)
+            held = {name: np.load(os.path.join(directory, f"{name}.npy")) for name in DELETED_FILES}
+            if old['delta']:
+                segments = [self._load_segment(old_directory, version) for version in old['delta']]
+                delta = {
+                    name: np.concatenate([segment[name] for segment in segments]) for name in DELTA_FILES
+                }
+                missing = ~np.isin(delta['ids'], held['ids'])
+                if missing.any():
+                    self._append_delta(generation, {name: delta[name][missing] for name in DELTA_FILES})
+                    held = {name: np.concatenate([held[name], delta[name][missing]]) for name in DELETED_FILES}
+            if old.get('deleted'):
+                deleted = {
+                    name: np.load(os.path.join(old_directory, f"deleted-{name}-{old['deleted']}.npy"))
+                    for name in DELETED_FILES
+                }
+                self._append_deleted(generation, {
+                    name: deleted[name][np.isin(deleted[name], held[name])] for name in DELETED_FILES
+                })
+
+        with open(os.path.join(self.path, 'CURRENT.tmp'), 'w') as f:
+            f.write(generation)
+        os.replace(os.path.join(self.path, 'CURRENT.tmp'), os.path.join(self.path, 'CURRENT'))
+        return previous
+
+    def _append_delta(self, generation, new):
+        """
+        Write ``new`` as a delta segment of its own, merging the segments once
+        there are ``DELTA_SEGMENT_LIMIT`` of them; returns the delta size
+        """
+        directory = os.path.join(self.path, generation)
+        manifest = self._read_manifest(generation)
+        segments = manifest['delta']
+        size = manifest['delta_size'] + len(new['ids'])
+        version = max(segments, default=0) + 1
+        merged = segments if len(segments) + 1 >= DELTA_SEGMENT_LIMIT else []
+        if merged:
+            loaded = [self._load_segment(directory, segment) for segment in merged]
+            new = {name: np.concatenate([segment[name] for segment in loaded] + [new[name]]) for name in DELTA_FILES}
+        for name in DELTA_FILES:
+            _save(os.path.join(directory, f"delta-{name}-{version}.npy"), new[name])
+        segments = [version] if merged else segments + [version]
+        self._write_manifest(generation, dict(manifest, delta=segments, delta_size=size))
+        for segment in merged:
+            for name in DELTA_FILES:
+                os.unlink(os.path.join(directory, f"delta-{name}-{segment}.npy"))
+        return size
+
+    def _append_deleted(self, generation, new):
+        """Write a new tombstone version holding the old tombstones plus ``new``"""
+        if not any(len(new[name]) for name in DELETED_FILES):
+            return
+        directory = os.path.join(self.path, generation)
+        manifest = self._read_manifest(generation)
+        current = manifest.get('deleted', 0)
+        version = current + 1
+        for name in DELETED_FILES:
+            combined = np.asarray(new[name], dtype=np.int64)
+            if current:
+                combined = np.concatenate([np.load(os.path.join(directory, f"deleted-{name}-{current}.npy")), combined])
+            _save(os.path.join(directory, f"deleted-{name}-{version}.npy"), np.unique(combined))
+        self._write_manifest(generation, dict(manifest, deleted=version))
+        for name in DELETED_FILES:
+            if current:
+                os.unlink(os.path.join(directory, f"deleted-{name}-{current}.npy"))
+
+    def remove(self, embedding_ids=(), document_ids=()):
+        """Hide embeddings, and every vector of documents, from searches"""
+        with self._write_lock():
+            generation = self._current_generation()
+            if generation is None:
+                return
+            self._append_deleted(generation, {'ids': list(embedding_ids), 'documents': list(document_ids)})
+
+    def add(self, embedding_ids, document_ids, vectors):
+        """Append vectors to the delta as a new segment; returns the delta size"""
+        vectors = np.asarray(vectors, dtype=VECTOR_DTYPE)
+        if not len(vectors):
+            return 0
+        with self._write_lock():
+            generation = self._current_generation()
+            if generation is None:
+                generation, _ = self._build_generation([], 0, vectors.shape[1])
+                self._publish(generation)
+            dimensions = self._read_manifest(generation)['dimensions']
+            if dimensions != vectors.shape[1]:
+                raise ValueError(f"Index holds {dimensions}-dimensional vectors, got {vectors.shape[1]}")
+            return self._append_delta(generation, {
+                'vectors': vectors,
+                'ids': np.asarray(embedding_ids, dtype=np.int64),
+                'documents': np.asarray(document_ids, dtype=np.int64),
+            })
+
+    # -- querying ------------------------------------------------------
+
+    def search(self, query, k=10, allowed_document_ids=None):
+        """
+        Return up to ``k`` ``(embedding_id, document_id, score)`` tuples, best
+        first. ``allowed_document_ids`` restricts results to those documents.
+        """
+        with self._lock:
+            self._load()
+            base, delta, deleted = self._base, self._delta, self._deleted
+        if base is None:
+            return []
+
+        query = np.asarray(query, dtype=VECTOR_DTYPE)
+        allowed = None
+        if allowed_document_ids is not None:
+            allowed = np.fromiter(allowed_document_ids, dtype=np.int64)
+
+        scores, ids, documents = [], [], []
+        if len(base['ids']):
+            centroid_scores = base['centroids'] @ query
+            for cluster in _top_k(centroid_scores, min(self.nprobe, len(centroid_scores))):
+                start, stop = base['offsets'][cluster], base['offsets'][cluster + 1]
+                if start == stop:
+                    continue
+                scores.append(base['vectors'][start:stop] @ query)
+                ids.append(base['ids'][start:stop])
+                documents.append(base['documents'][start:stop])
+        for segment in delta.values():
+            scores.append(segment['vectors'] @ query)
+            ids.append(segment['ids'])
+            documents.append(segment['documents'])
+        if not scores:
+            return []
+
+        scores, ids, documents = np.concatenate(scores), np.concatenate(ids), np.concatenate(documents)
+        visible = np.ones(len(ids), dtype=bool)
+        if allowed is not None:
+            visible &= np.isin(documents, allowed)
+        if deleted is not None:
+            visible &= ~np.isin(ids, deleted['ids']) & ~np.isin(documents, deleted['documents'])
+        if not visible.all():
+            scores, ids, documents = scores[visible], ids[visible], documents[visible]
+        best = _top_k(scores, k)
+        return [(int(ids[i]), int(documents[i]), float(scores[i])) for i in best]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index():
+    """Return this process's handle on the configured vector index"""
+    global _index
+    from .conf import get_setting
+    path = str(get_setting('VECTOR_INDEX_DIR'))
+    with _index_lock:
+        if _index is None or _index.path != path:
+            _index = VectorIndex(
+                path,
+                nprobe=get_setting('VECTOR_INDEX_NPROBE'),
+                delta_limit=get_setting('VECTOR_INDEX_DELTA_LIMIT'),
+            )
+        return _index
+
+
+def rebuild_index(wait=True):
+    """
+    Rebuild the vector index from the embeddings table; returns the number
+    of vectors, or ``None`` without ``wait`` if another process is rebuilding
+    """
+    from .embeddings import get_embedding_backend
+    from .models import DocumentEmbedding
+
+    index = get_index()
+    with index.rebuilding(wait) as locked:
+        if not locked:
+            return None
+        queryset = DocumentEmbedding.objects.exclude(embedding=None).order_by()
+        rows = queryset.values_list('id', 'document_id', 'embedding').iterator(chunk_size=2000)
+        return index.build(rows, queryset.count(), get_embedding_backend().dimensions)
+
+
+def index_embeddings(embeddings):
+    """Add freshly created ``DocumentEmbedding`` rows to the index"""
+    if not embeddings:
+        return
+    get_index().add(
+        [embedding.pk for embedding in embeddings],
+        [embedding.document_id for embedding in embeddings],
+        np.stack([embedding.embedding for embedding in embeddings]),
+    )
+
+
+def forget(embedding_ids=(), document_ids=()):
+    """Hide deleted embeddings, or the vectors of deleted documents, once the deletion commits"""
+    embedding_ids, document_ids = list(embedding_ids), list(document_ids)
+    if not embedding_ids and not document_ids:
+        return
+
+    def remove():
+        # Missed tombstones only cost results: searches drop hits on missing rows
+        try:
+            get_index().remove(embedding_ids, document_ids)
+        except Exception:
+            logger.exception("Failed to remove deleted vectors from the index")
+
+    transaction.on_commit(remove)
@@ -1,15 +1,46 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import render
-from rest_framework import viewsets, permissions, status, generics, filters
+from rest_framework import viewsets, permissions, status, generics, filters, mixins
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
 from django.shortcuts import get_object_or_404
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q
-from .models import Document, DocumentEmbedding
-from .serializers import DocumentSerializer, DocumentEmbeddingSerializer, DocumentListSerializer
-import threading
+from django.utils.crypto import constant_time_compare
+from .models import Document, DocumentEmbedding, UploadSession
+from .serializers import (
+    DocumentSerializer, DocumentEmbeddingSerializer, DocumentListSerializer,
+    DocumentChunkResultSerializer, DocumentSearchResultSerializer, UploadSessionSerializer,
+    BulkDocumentIdsSerializer, BulkStatusSerializer, BulkUploadSerializer
+)
+from .async_views import AsyncReadMixin
+from .bulk import set_documents_status, upload_documents
+from .pagination import AsyncPageNumberPagination, KeysetPagination
+from .search import FullTextSearchFilter, search_documents
+from .stats import summary
+from .embeddings import get_embedding_backend
+from .conditional import alisting_etag, document_validators, listing_etag, not_modified, set_validators
+from .conf import get_setting
+from .content import InvalidSlice, parse_span, slice_content
+from .downloads import serve_document
+from .events import issue_ticket, read_ticket, stream_events
+from .metrics import TimedJWTAuthentication, enabled as metrics_enabled, render as render_metrics, stage
+from .response_cache import cached_response, document_versions, listing_versions, recent_versions
+from .queue import enqueue_ingestion, enqueue_ingestion_many
+from .uploads import (
+    UploadClosed, UploadIncomplete, UploadOffsetMismatch, UploadTooLarge, append_part, complete_upload
+)
+from .vector_index import get_index
 from django_filters.rest_framework import DjangoFilterBackend
 
+User = get_user_model()
+
 
 class IsAdminOrEditor(permissions.BasePermission):
     """Permission to only allow admins or editors"""
@@ -18,18 +49,50 @@ class IsAdminOrEditor(permissions.BasePermission):
         return request.user and (request.user.role in ['admin', 'editor'])
 
 
-class DocumentViewSet(viewsets.ModelViewSet):
+class DocumentViewSet(AsyncReadMixin, viewsets.ModelViewSet):
     """ViewSet for managing documents"""
     
     queryset = Document.objects.all()
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = AsyncPageNumberPagination
+    async_actions = {'list': 'alist', 'retrieve': 'aretrieve', 'recent': 'arecent'}
+    filter_backends = [DjangoFilterBackend, FullTextSearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'file_type']
-    search_fields = ['title', 'description']
     ordering_fields = ['created_at', 'updated_at', 'last_accessed', 'title']
     
+    # Actions that return DocumentListSerializer rows
+    list_actions = ('list', 'recent')
+    
+    # Actions that change many documents at once
+    bulk_actions = ('bulk_upload', 'bulk_delete', 'bulk_ingest', 'bulk_status')
+    
+    # Columns read by DocumentListSerializer; everything else (notably the
+    # potentially huge extracted content) is left out of list queries
+    list_fields = (
+        'id', 'title', 'description', 'created_at', 'updated_at', 'last_accessed',
+        'status', 'file_size', 'file_type', 'uploaded_by__email',
+    )
+    
+    @property
+    def paginator(self):
+        """
+        Use keyset pagination for list actions when the client opts in with
+        ``?pagination=cursor`` (or is following a ``cursor`` link)
+        """
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if self.action in self.list_actions and (
+                params.get('pagination') == 'cursor' or 'cursor' in params
+            ):
+                self._paginator = KeysetPagination()
+            else:
+                self._paginator = super().paginator
+        return self._paginator
+    
     def get_serializer_class(self):
-        if self.action == 'list':
+        if self.action in self.list_actions:
             return DocumentListSerializer
+        if self.action == 'search':
+            return DocumentSearchResultSerializer
         return DocumentSerializer
     
     def get_permissions(self):
@@ -38,13 +101,21 @@ class DocumentViewSet(viewsets.ModelViewSet):
         """
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
             permission_classes = [IsAdminOrEditor]
+        elif self.action in self.bulk_actions:
+            permission_classes = [permissions.IsAuthenticated, IsAdminOrEditor]
         else:
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
     
     def get_queryset(self):
         """Filter documents based on query parameters"""
-        queryset = super().get_queryset()
+        # Both serializers read the owner's email, so join it in
+        queryset = super().get_queryset().select_related('uploaded_by')
+        if self.action in self.list_actions or self.action == 'search':
+            queryset = queryset.only(*self.list_fields)
+        else:
+            # Content is only ever read in slices, by the content action
+            queryset = queryset.defer('content')
         
         # Filter by user's access permissions
         user = self.request.user
@@ -59,6 +130,78 @@ class DocumentViewSet(viewsets.ModelViewSet):
         """Save the uploaded_by as the current user"""
         serializer.save(uploaded_by=self.request.user)
     
+    def _record_cached_access(self, request, pk=None, **kwargs):
+        # A cached retrieve skips the database, but still counts as an access
+        Document(pk=int(pk)).record_access()
+    
+    def _validated_rows(self, request, queryset):
+        """The rows a listing's ETag is computed over"""
+        if isinstance(self.paginator, KeysetPagination):
+            # Just the page's window, so cursor pages still issue no table-wide COUNT
+            return self.paginator.page_queryset(queryset, request, self)
+        return queryset
+    
+    def _listing_response(self, rows, paginated=False):
+        """Serialize a listing the client does not already have"""
+        with stage('serialize'):
+            data = self.get_serializer(rows, many=True).data
+        return self.get_paginated_response(data) if paginated else Response(data)
+    
+    def _detail_response(self, request, instance):
+        """
+        Serialize a document, or answer ``304`` if the client already has it
+        """
+        etag, last_modified = document_validators(request, instance)
+        response = not_modified(request, etag, last_modified)
+        if response is None:
+            with stage('serialize'):
+                data = self.get_serializer(instance).data
+            response = Response(data)
+        set_validators(response, etag, last_modified)
+        return response
+    
+    def _recent_queryset(self, request):
+        """The recently accessed documents, and how many to return without a cursor"""
+        limit = request.query_params.get('limit', 10)
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 10
+        
+        if isinstance(self.paginator, KeysetPagination):
+            self.keyset_ordering = '-last_accessed'
+        return self.get_queryset().filter(last_accessed__isnull=False).order_by('-last_accessed'), limit
+    
+    @cached_response(listing_versions)
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # Answer 304 before the page is fetched or counted
+        etag = listing_etag(request, self._validated_rows(request, queryset))
+        response = not_modified(request, etag)
+        if response is None:
+            page = self.paginate_queryset(queryset)
+            if page is not None:
+                response = self._listing_response(page, paginated=True)
+            else:
+                response = self._listing_response(list(queryset))
+        set_validators(response, etag)
+        return response
+    
+    @cached_response(listing_versions)
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = await alisting_etag(request, self._validated_rows(request, queryset))
+        response = not_modified(request, etag)
+        if response is None:
+            page = await self.apaginate_queryset(queryset)
+            if page is not None:
+                response = self._listing_response(page, paginated=True)
+            else:
+                response = self._listing_response([row async for row in queryset])
+        set_validators(response, etag)
+        return response
+    
+    @cached_response(document_versions, on_hit=_record_cached_access)
     def retrieve(self, request, *args, **kwargs):
         """
         Retrieve a document and update last_accessed timestamp
@@ -66,28 +209,181 @@ class DocumentViewSet(viewsets.ModelViewSet):
         instance = self.get_object()
         # Record document access
         instance.record_access()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return self._detail_response(request, instance)
+    
+    @cached_response(document_versions, on_hit=_record_cached_access)
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        # Buffered in memory, so safe to call from the event loop
+        instance.record_access()
+        return self._detail_response(request, instance)
     
     @action(detail=False, methods=['get'])
+    @cached_response(recent_versions)
     def recent(self, request):
         """
         Get recently accessed documents
         """
+        queryset, limit = self._recent_queryset(request)
+        keyset = isinstance(self.paginator, KeysetPagination)
+        if not keyset:
+            queryset = queryset[:limit]
+        etag = listing_etag(request, self._validated_rows(request, queryset))
+        response = not_modified(request, etag)
+        if response is None:
+            if keyset:
+                response = self._listing_response(self.paginate_queryset(queryset), paginated=True)
+            else:
+                response = self._listing_response(list(queryset))
+        set_validators(response, etag)
+        return response
+    
+    @cached_response(recent_versions)
+    async def arecent(self, request):
+        queryset, limit = self._recent_queryset(request)
+        keyset = isinstance(self.paginator, KeysetPagination)
+        if not keyset:
+            queryset = queryset[:limit]
+        etag = await alisting_etag(request, self._validated_rows(request, queryset))
+        response = not_modified(request, etag)
+        if response is None:
+            if keyset:
+                response = self._listing_response(await self.apaginate_queryset(queryset), paginated=True)
+            else:
+                response = self._listing_response([row async for row in queryset])
+        set_validators(response, etag)
+        return response
+    
+    @action(detail=False, methods=['get'])
+    def stats(self, request):
+        """
+        Get document counts and sizes by status and file type, read from the
+        maintained statistics instead of counting documents
+        """
         user = request.user
-        # Get query parameters
-        limit = request.query_params.get('limit', 10)
+        if not (user.is_admin or user.role == 'viewer'):
+            # Editors only see their own documents
+            owner = user.pk
+        else:
+            owner = request.query_params.get('user')
+            if owner is not None:
+                try:
+                    owner = int(owner)
+                except ValueError:
+                    return Response(
+                        {"user": "A user id is required."},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        return Response({'user': owner, **summary(owner)})
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """
+        Download the document's file, honouring Range and conditional headers
+        """
+        document = self.get_object()
+        document.record_access()
+        return serve_document(request, document)
+    
+    @action(detail=True, methods=['get'])
+    def content(self, request, pk=None):
+        """
+        Stream the extracted content, or one slice of it selected with
+        chars=START-END (0-based), lines=START-END or pages=START-END (1-based)
+        """
+        document = self.get_object()
+        if not document.content_index:
+            return Response(
+                {"detail": "Content has not been extracted yet."},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        units = [unit for unit in ('chars', 'lines', 'pages') if unit in request.query_params]
+        if len(units) > 1:
+            return Response(
+                {"detail": "Select content by only one of chars, lines or pages."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        unit = units[0] if units else None
         try:
-            limit = int(limit)
-        except ValueError:
-            limit = 10
-            
-        # Get documents ordered by last_accessed
-        queryset = self.get_queryset().filter(last_accessed__isnull=False).order_by('-last_accessed')[:limit]
+            first, last = parse_span(request.query_params[unit]) if unit else (0, None)
+            chunks = slice_content(document.pk, document.content_index, unit, first, last)
+        except InvalidSlice as e:
+            return Response({"detail": str(e)}, status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        except ValueError as e:
+            return Response({unit: str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return StreamingHttpResponse(chunks, content_type='text/plain; charset=utf-8')
+    
+    @action(detail=False, methods=['get'])
+    def search(self, request):
+        """
+        Full-text search over title, description and content, ranked and
+        with highlighted snippets
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"q": "A search query is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = search_documents(queryset, query)
+        
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['get'], url_path='semantic-search')
+    def semantic_search(self, request):
+        """
+        Return the document chunks closest in meaning to the ``q`` parameter
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response(
+                {"q": "A search query is required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            k = min(max(int(request.query_params.get('k', 10)), 1), 100)
+        except ValueError:
+            k = 10
+        
+        # Admins and viewers can see every document, editors only their own
+        visible = self.get_queryset()
+        allowed_ids = None
+        if not (request.user.is_admin or request.user.role == 'viewer'):
+            allowed_ids = list(visible.values_list('id', flat=True))
+        
+        [vector] = get_embedding_backend().embed([query])
+        # Deletions not yet tombstoned leave hits on missing rows, so fetch
+        # more until k live ones are found or the index has no more
+        fetch = k * 2
+        while True:
+            hits = get_index().search(vector, k=fetch, allowed_document_ids=allowed_ids)
+            chunks = {
+                chunk.id: chunk
+                for chunk in DocumentEmbedding.objects.filter(
+                    id__in=[embedding_id for embedding_id, _, _ in hits], document__in=visible
+                ).select_related('document').defer('embedding', 'document__content')
+            }
+            if len(chunks) >= k or len(hits) < fetch:
+                break
+            fetch *= 4
+        
+        results = []
+        for embedding_id, _, score in hits:
+            chunk = chunks.get(embedding_id)
+            if chunk is not None:
+                chunk.score = score
+                results.append(chunk)
+        serializer = DocumentChunkResultSerializer(results[:k], many=True)
+        return Response(serializer.data)
+    
     @action(detail=True, methods=['post'])
     def trigger_ingestion(self, request, pk=None):
         """Trigger the document ingestion process"""
@@ -100,100 +396,19 @@ class DocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Update document status
-        document.status = 'processing'
-        document.save()
-        
-        # Start ingestion in background thread
-        threading.Thread(target=self._process_document, args=(document.id,)).start()
+        # Queue the document for the ingestion workers
+        enqueue_ingestion(document)
         
         return Response({"status": "ingestion started"})
     
-    def _process_document(self, document_id):
-        """Process the document in the background"""
-        try:
-            document = Document.objects.get(id=document_id)
-            
-            # Simulate document processing
-            import time
-            time.sleep(2)  # Simulate processing time
-            
-            # Extract text content based on file type
-            content = ""
-            file_ext = document.file_type.lower() if document.file_type else ""
-            file_path = document.file.path
-            
-            try:
-                # Simple text extraction based on file type
-                if file_ext in ['txt', 'md', 'csv']:
-                    # For text files, just read the content
-                    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                        content = f.read()
-                elif file_ext in ['pdf']:
-                    # For PDFs, extract text with a simple method
-                    content = self._extract_text_from_pdf(file_path)
-                elif file_ext in ['doc', 'docx']:
-                    # For Word documents
-                    content = self._extract_text_from_word(file_path)
-                else:
-                    # For other file types
-                    content = f"File type {file_ext} is not supported for content extraction."
-                    
-                # Update document with extracted content
-                document.content = content
-            except Exception as e:
-                document.content = f"Error extracting content: {str(e)}"
-                
-            # Create dummy embeddings for demonstration purposes
-            for i in range(5):
-                DocumentEmbedding.objects.create(
-                    document=document,
-                    chunk_text=f"Sample chunk {i} from {document.title}",
-                    embedding={"values": [0.1, 0.2, 0.3]},  # Dummy embedding
-                    chunk_index=i
-                )
-            
-            # Update document status
-            document.status = 'completed'
-            document.save()
-        except Exception as e:
-            # Handle errors
-            try:
-                document = Document.objects.get(id=document_id)
-                document.status = 'failed'
-                document.save()
-            except:
-                pass
-                
-    def _extract_text_from_pdf(self, file_path):
-        """Extract text from PDF file"""
-        try:
-            import PyPDF2
-            text = ""
-            with open(file_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page_num in range(len(reader.pages)):
-                    page = reader.pages[page_num]
-                    text += page.extract_text() + "\n\n"
-            return text
-        except ImportError:
-            return "PDF extraction requires PyPDF2 library."
-        except Exception as e:
-            return f"Failed to extract PDF content: {str(e)}"
-            
-    def _extract_text_from_word(self, file_path):
-        """Extract text from Word document"""
-        try:
-            import docx
-            doc = docx.Document(file_path)
-            text = ""
-            for para in doc.paragraphs:
-                text += para.text + "\n"
-            return text
-        except ImportError:
-            return "Word document extraction requires python-docx library."
-        except Exception as e:
-            return f"Failed to extract Word document content: {str(e)}"
+    @action(detail=True, methods=['post'], url_path='events/ticket')
+    def events_ticket(self, request, pk=None):
+        """
+        Issue a short-lived ticket for opening the document's event stream,
+        which EventSource cannot authenticate with a header
+        """
+        document = self.get_object()
+        return Response({"ticket": issue_ticket(request.user, document.pk)})
     
     @action(detail=False, methods=['post'], url_path='upload')
     def upload_document(self, request):
@@ -228,15 +443,252 @@ class DocumentViewSet(viewsets.ModelViewSet):
             serializer.save(uploaded_by=request.user)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    
+    def _bulk_selection(self, serializer_class, request):
+        """
+        Validate a bulk request and return ``(serializer, response)``. The
+        response is set when the request is rejected: permission is checked
+        for the whole set, so nothing changes unless every document is allowed.
+        """
+        serializer = serializer_class(data=request.data)
+        if not serializer.is_valid():
+            return serializer, Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        ids = serializer.validated_data['ids']
+        found = set(self.get_queryset().filter(pk__in=ids).values_list('id', flat=True))
+        missing = [pk for pk in ids if pk not in found]
+        if missing:
+            return serializer, Response(
+                {"detail": "Some documents were not found.", "ids": missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        return serializer, None
+    
+    @action(detail=False, methods=['post'], url_path='bulk-upload')
+    def bulk_upload(self, request):
+        """
+        Upload many files in one multipart request, each as a document, and
+        optionally queue them all for ingestion
+        """
+        serializer = BulkUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        documents = upload_documents(
+            serializer.validated_data['files'],
+            request.user,
+            description=serializer.validated_data['description'],
+            ingest=serializer.validated_data['ingest'],
+        )
+        data = DocumentSerializer(documents, many=True, context=self.get_serializer_context()).data
+        return Response(data, status=status.HTTP_201_CREATED)
+    
+    @action(detail=False, methods=['post'], url_path='bulk-delete')
+    def bulk_delete(self, request):
+        """Delete many documents"""
+        serializer, rejected = self._bulk_selection(BulkDocumentIdsSerializer, request)
+        if rejected:
+            return rejected
+        
+        ids = serializer.validated_data['ids']
+        with transaction.atomic():
+            Document.objects.filter(pk__in=ids).delete()
+        return Response({"deleted": len(ids)})
+    
+    @action(detail=False, methods=['post'], url_path='bulk-ingest')
+    def bulk_ingest(self, request):
+        """
+        Queue many documents for ingestion; documents that are not pending
+        or failed are skipped
+        """
+        serializer, rejected = self._bulk_selection(BulkDocumentIdsSerializer, request)
+        if rejected:
+            return rejected
+        
+        ids = serializer.validated_data['ids']
+        queued = list(
+            Document.objects.filter(pk__in=ids, status__in=['pending', 'failed']).values_list('id', flat=True)
+        )
+        enqueue_ingestion_many(queued)
+        queued_ids = set(queued)
+        return Response({
+            "queued": [pk for pk in ids if pk in queued_ids],
+            "skipped": [pk for pk in ids if pk not in queued_ids],
+        })
+    
+    @action(detail=False, methods=['post'], url_path='bulk-status')
+    def bulk_status(self, request):
+        """Set the status of many documents"""
+        serializer, rejected = self._bulk_selection(BulkStatusSerializer, request)
+        if rejected:
+            return rejected
+        
+        ids = set_documents_status(
+            Document.objects.filter(pk__in=serializer.validated_data['ids']),
+            serializer.validated_data['status'],
+        )
+        return Response({"updated": len(ids)})
+
+
+class UploadSessionViewSet(mixins.CreateModelMixin,
+                           mixins.RetrieveModelMixin,
+                           mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable, chunked uploads.
+    
+    POST opens a session, PATCH appends the raw request body at the
+    ``Upload-Offset`` header, GET reports the stored offset for resuming and
+    ``complete`` turns the parts into a document.
+    """
+    
+    serializer_class = UploadSessionSerializer
+    permission_classes = [permissions.IsAuthenticated, IsAdminOrEditor]
+    
+    def get_queryset(self):
+        """Users only see their own uploads"""
+        return UploadSession.objects.filter(uploaded_by=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(uploaded_by=self.request.user)
+    
+    def partial_update(self, request, pk=None):
+        """
+        Append a part of the file
+        """
+        session = self.get_object()
+        try:
+            offset = int(request.headers['Upload-Offset'])
+            length = int(request.headers['Content-Length'])
+        except (KeyError, ValueError):
+            return Response(
+                {"detail": "Upload-Offset and Content-Length headers are required."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if length <= 0:
+            return Response({"detail": "Empty part."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            # The body is streamed from the socket, never parsed into request.data
+            append_part(session, request.stream, offset, length)
+        except UploadOffsetMismatch as e:
+            return Response(
+                {"detail": str(e), "offset": session.received},
+                status=status.HTTP_409_CONFLICT
+            )
+        except UploadTooLarge as e:
+            return Response({"detail": str(e)}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        except UploadIncomplete as e:
+            return Response(
+                {"detail": str(e), "offset": session.received},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except UploadClosed as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(session).data)
+    
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        """
+        Assemble the uploaded parts into a new document
+        """
+        session = self.get_object()
+        try:
+            document = complete_upload(session)
+        except UploadIncomplete as e:
+            return Response(
+                {"detail": str(e), "offset": session.received},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except UploadClosed as e:
+            return Response({"detail": str(e)}, status=status.HTTP_409_CONFLICT)
+        serializer = DocumentSerializer(document, context=self.get_serializer_context())
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
-class DocumentEmbeddingViewSet(viewsets.ReadOnlyModelViewSet):
+class DocumentEmbeddingViewSet(AsyncReadMixin, viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing document embeddings"""
     
     serializer_class = DocumentEmbeddingSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = AsyncPageNumberPagination
+    async_actions = {'list': 'alist'}
     
     def get_queryset(self):
         """Return embeddings for a specific document"""
         document_id = self.kwargs.get('document_id')
         return DocumentEmbedding.objects.filter(document_id=document_id)
+    
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = await self.apaginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        serializer = self.get_serializer([row async for row in queryset], many=True)
+        return Response(serializer.data)
+
+
+def _authenticate_stream(request, pk):
+    """
+    Return the user of a ticket for this document's stream or, for clients
+    that can set headers, of a JWT in the Authorization header
+    """
+    ticket = request.GET.get('ticket')
+    if ticket:
+        user_id = read_ticket(ticket, pk)
+        return User.objects.filter(pk=user_id).first() if user_id is not None else None
+    try:
+        result = TimedJWTAuthentication().authenticate(request)
+    except (InvalidToken, AuthenticationFailed):
+        return None
+    return result[0] if result else None
+
+
+async def document_events(request, pk):
+    """
+    Stream a document's ingestion status and progress as server-sent events,
+    ending once it is completed or failed. Needs an ASGI server.
+    """
+    if not isinstance(request, ASGIRequest):
+        # WSGI would hold a worker until the stream ends and send nothing before it does
+        return JsonResponse(
+            {"detail": "Event streams need the ASGI server; poll the document's status instead."},
+            status=status.HTTP_501_NOT_IMPLEMENTED
+        )
+    
+    user = await sync_to_async(_authenticate_stream)(request, pk)
+    if user is None or not user.is_active:
+        return JsonResponse(
+            {"detail": "Authentication credentials were not provided."},
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+    
+    documents = Document.objects.filter(pk=pk)
+    if not (user.is_admin or user.role == 'viewer'):
+        # Editors only see documents they uploaded
+        documents = documents.filter(uploaded_by=user)
+    if not await documents.aexists():
+        return JsonResponse({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
+    
+    async def get_status():
+        return await documents.values_list('status', flat=True).afirst()
+    
+    response = StreamingHttpResponse(stream_events(pk, get_status), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Tells nginx to pass events through instead of buffering them
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def metrics(request):
+    """
+    Serve request, stage and ingestion metrics in the Prometheus text format.
+    When ``METRICS_TOKEN`` is set, scrapers must send it as a bearer token.
+    """
+    if not metrics_enabled():
+        raise Http404
+    token = get_setting('METRICS_TOKEN')
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,7 +2,7 @@ import { Component, OnInit } from '@angular/core';
 import { CommonModule } from '@angular/common';
 import { RouterModule } from '@angular/router';
 import { AuthService, User } from '../../services/auth.service';
-import { DocumentService, Document } from '../../services/document.service';
+import { DocumentService, Document, DocumentStats } from '../../services/document.service';
 
 @Component({
   selector: 'app-dashboard',
@@ -34,6 +34,38 @@ import { DocumentService, Document } from '../../services/document.service';
         </div>
       </div>
       
+      <div class="row mb-4" *ngIf="stats">
+        <div class="col-12">
+          <div class="card dashboard-card">
+            <div class="card-header">
+              <h5 class="mb-0"><i class="bi bi-bar-chart me-2"></i>{{stats.user === null ? 'All Documents' : 'Your Documents'}}</h5>
+            </div>
+            <div class="card-body">
+              <div class="stats-grid">
+                <div class="stat">
+                  <div class="stat-value">{{stats.count}}</div>
+                  <div class="stat-label">Documents</div>
+                </div>
+                <div class="stat">
+                  <div class="stat-value">{{formatFileSize(stats.total_size)}}</div>
+                  <div class="stat-label">Stored</div>
+                </div>
+                <div class="stat" *ngFor="let entry of stats.by_status | keyvalue">
+                  <div class="stat-value" [ngClass]="'stat-' + entry.key">{{entry.value.count}}</div>
+                  <div class="stat-label">{{entry.key}}</div>
+                </div>
+              </div>
+              <div class="type-breakdown mt-3" *ngIf="(stats.by_type | keyvalue).length">
+                <span class="type-chip" *ngFor="let entry of stats.by_type | keyvalue">
+                  <i class="bi" [ngClass]="getFileIcon(entry.key)"></i>
+                  {{entry.key || 'other'}}: {{entry.value.count}} ({{formatFileSize(entry.value.total_size)}})
+                </span>
+              </div>
+            </div>
+          </div>
+        </div>
+      </div>
+      
       <div class="row mb-4">
         <div class="col-md-7 mb-4 mb-md-0">
           <div class="card dashboard-card h-100">
@@ -378,6 +410,36 @@ import { DocumentService, Document } from '../../services/document.service';
       }
     }
     
+    .stats-grid {
+      display: grid;
+      grid-template-columns: repeat(auto-fit, minmax(110px, 1fr));
+      gap: 1rem;
+    }
+    
+    .stat-value {
+      font-size: 1.5rem;
+      font-weight: 600;
+    }
+    
+    .stat-label {
+      color: #64748b;
+      font-size: 0.85rem;
+      text-transform: capitalize;
+    }
+    
+    .stat-processing { color: #2563eb; }
+    .stat-completed { color: #16a34a; }
+    .stat-failed { color: #dc2626; }
+    
+    .type-chip {
+      display: inline-block;
+      background: #f1f5f9;
+      border-radius: 999px;
+      padding: 0.25rem 0.75rem;
+      margin: 0 0.5rem 0.5rem 0;
+      font-size: 0.85rem;
+    }
+    
     .document-status {
       margin-left: 1rem;
       
@@ -527,6 +589,7 @@ import { DocumentService, Document } from '../../services/document.service';
 export class DashboardComponent implements OnInit {
   user: User | null = null;
   documents: Document[] = [];
+  stats: DocumentStats | null = null;
   loading = false;
   error = '';
   
@@ -546,6 +609,15 @@ export class DashboardComponent implements OnInit {
   ngOnInit(): void {
     this.user = this.authService.getCurrentUser();
     this.loadDocuments();
+    this.loadStats();
+  }
+
+  loadStats(): void {
+    this.documentService.getStats()
+      .subscribe({
+        next: (stats) => this.stats = stats,
+        error: (err) => console.error('Error loading document statistics', err)
+      });
   }
 
   loadDocuments(): void {
@@ -93,7 +93,7 @@ import { NgbTooltipModule } from '@ng-bootstrap/ng-bootstrap';
           </div>
           <div class="card-body">
             <div class="document-content">
-              <pre>{{ document.content.substring(0, 500) }}{{ document.content.length > 500 ? '...' : '' }}</pre>
+              <pre>{{ document.content.substring(0, 500) }}{{ (document.content_length || 0) > 500 ? '...' : '' }}</pre>
             </div>
           </div>
         </div>
@@ -156,7 +156,7 @@ export class DocumentDetailComponent implements OnInit {
       return;
     }
     
-    this.documentService.getDocument(+id)
+    this.documentService.getDocument(+id, 500)
       .subscribe({
         next: (data) => {
           this.document = data;
@@ -32,11 +32,16 @@ export class DocumentViewComponent implements OnInit {
   searchTerm = '';
   isPdfFile = false;
   pdfSrc: string | null = null;
+  loadingMore = false;
   
   get isEditor(): boolean {
     return this.authService.isEditor();
   }
   
+  get hasMoreContent(): boolean {
+    return !!this.document?.content && this.document.content.length < (this.document.content_length || 0);
+  }
+
   get hasContent(): boolean {
     return this.document?.status === 'completed' && (!!this.document?.content || this.isPdfFile);
   }
@@ -96,12 +101,43 @@ export class DocumentViewComponent implements OnInit {
       });
   }
   
+  onContentScroll(event: Event): void {
+    const element = event.target as HTMLElement;
+    // Fetch the next slice once the reader is within a screen of the end
+    if (element.scrollHeight - element.scrollTop - element.clientHeight < element.clientHeight) {
+      this.loadMoreContent();
+    }
+  }
+
+  loadMoreContent(): void {
+    if (!this.document || !this.hasMoreContent || this.loadingMore) {
+      return;
+    }
+
+    const current = this.document;
+    this.loadingMore = true;
+    this.documentService.getContentSlice(current.id, current.content!.length)
+      .subscribe({
+        next: (content) => {
+          if (this.document === current) {
+            current.content += content;
+          }
+          this.loadingMore = false;
+        },
+        error: (error) => {
+          this.loadingMore = false;
+          console.error('Error loading document content:', error);
+        }
+      });
+  }
+
   triggerProcessing(documentId: string): void {
     this.documentService.triggerIngestion(documentId)
       .subscribe({
         next: () => {
-          // Set a timer to reload the document after a few seconds
-          setTimeout(() => this.loadDocument(), 5000);
+          // Reload once the server reports that ingestion has finished
+          this.documentService.watchIngestion(documentId)
+            .subscribe({ complete: () => this.loadDocument() });
         },
         error: (error) => {
           console.error('Error triggering document processing:', error);
@@ -1,7 +1,7 @@
 import { Injectable } from '@angular/core';
 import { HttpClient, HttpParams } from '@angular/common/http';
-import { Observable } from 'rxjs';
-import { catchError, tap } from 'rxjs/operators';
+import { Observable, of, timer } from 'rxjs';
+import { catchError, distinctUntilChanged, map, switchMap, takeWhile, tap } from 'rxjs/operators';
 import { environment } from '../../environments/environment';
 
 export interface Document {
@@ -22,6 +22,30 @@ export interface Document {
   file_url?: string;
   status?: 'pending' | 'processing' | 'completed' | 'failed';
   content?: string;
+  content_length?: number;
+  line_count?: number;
+  page_count?: number;
+  download_url?: string;
+}
+
+export interface IngestionEvent {
+  event: 'status' | 'progress';
+  document: number;
+  status?: 'pending' | 'processing' | 'completed' | 'failed';
+  stage?: 'extracting' | 'embedding';
+  done?: number;
+  total?: number;
+}
+
+export interface DocumentCounter {
+  count: number;
+  total_size: number;
+}
+
+export interface DocumentStats extends DocumentCounter {
+  user: number | null;
+  by_status: { [status: string]: DocumentCounter };
+  by_type: { [fileType: string]: DocumentCounter };
 }
 
 export interface DocumentEmbedding {
@@ -33,6 +57,12 @@ export interface DocumentEmbedding {
   created_at: string;
 }
 
+// Characters of extracted text requested at a time
+export const CONTENT_SLICE_CHARS = 20000;
+
+// Milliseconds between status polls when the server cannot stream events
+export const INGESTION_POLL_INTERVAL = 3000;
+
 @Injectable({
   providedIn: 'root'
 })
@@ -49,8 +79,28 @@ export class DocumentService {
     return this.http.get<{results: Document[], count: number}>(`${this.apiUrl}/`, { params });
   }
 
-  getDocument(id: string | number): Observable<Document> {
-    return this.http.get<Document>(`${this.apiUrl}/${id}/`);
+  getDocument(id: string | number, contentChars: number = CONTENT_SLICE_CHARS): Observable<Document> {
+    // The detail payload no longer carries the extracted text, so fetch the first slice
+    // alongside; viewers ask for the rest with getContentSlice as it comes into view
+    return this.http.get<Document>(`${this.apiUrl}/${id}/`).pipe(
+      switchMap(document => document.content_length
+        ? this.getContentSlice(id, 0, contentChars).pipe(map(content => ({ ...document, content })))
+        : of(document))
+    );
+  }
+
+  getContentSlice(id: string | number, start: number, length: number = CONTENT_SLICE_CHARS): Observable<string> {
+    return this.getDocumentContent(id, { chars: `${start}-${start + length - 1}` });
+  }
+
+  getDocumentContent(id: string | number, slice: { chars?: string, lines?: string, pages?: string } = {}): Observable<string> {
+    let params = new HttpParams();
+    Object.entries(slice).forEach(([unit, range]) => {
+      if (range) {
+        params = params.set(unit, range);
+      }
+    });
+    return this.http.get(`${this.apiUrl}/${id}/content/`, { params, responseType: 'text' });
   }
 
   getRecentDocuments(limit: number = 10): Observable<Document[]> {
@@ -62,6 +112,14 @@ export class DocumentService {
     return this.http.get<Document[]>(`${this.apiUrl}/recent/`, { params });
   }
 
+  getStats(userId?: number): Observable<DocumentStats> {
+    let params = new HttpParams();
+    if (userId !== undefined) {
+      params = params.set('user', userId.toString());
+    }
+    return this.http.get<DocumentStats>(`${this.apiUrl}/stats/`, { params });
+  }
+
   uploadDocument(file: File, metadata: any): Observable<Document> {
     const formData = new FormData();
     formData.append('file', file);
@@ -85,6 +143,55 @@ export class DocumentService {
     return this.http.post(`${this.apiUrl}/${id}/trigger_ingestion/`, {});
   }
 
+  watchIngestion(id: string | number): Observable<IngestionEvent> {
+    // EventSource cannot send an Authorization header, so the stream is opened with a
+    // short-lived ticket for this document rather than with the token itself. Servers
+    // running under WSGI refuse the stream, and the status is polled instead
+    return this.http.post<{ ticket: string }>(`${this.apiUrl}/${id}/events/ticket/`, {}).pipe(
+      switchMap(({ ticket }) => this.streamIngestion(id, ticket)),
+      catchError(() => this.pollIngestion(id))
+    );
+  }
+
+  private pollIngestion(id: string | number): Observable<IngestionEvent> {
+    return timer(0, INGESTION_POLL_INTERVAL).pipe(
+      switchMap(() => this.http.get<Document>(`${this.apiUrl}/${id}/`)),
+      map(document => document.status),
+      distinctUntilChanged(),
+      map(status => ({ event: 'status' as const, document: Number(id), status })),
+      takeWhile(event => event.status !== 'completed' && event.status !== 'failed', true)
+    );
+  }
+
+  private streamIngestion(id: string | number, ticket: string): Observable<IngestionEvent> {
+    return new Observable<IngestionEvent>(subscriber => {
+      const source = new EventSource(`${this.apiUrl}/${id}/events/?ticket=${encodeURIComponent(ticket)}`);
+      let received = false;
+      const forward = (event: MessageEvent) => {
+        received = true;
+        const data = JSON.parse(event.data);
+        subscriber.next({ event: event.type as IngestionEvent['event'], ...data });
+        if (event.type === 'status' && (data.status === 'completed' || data.status === 'failed')) {
+          subscriber.complete();
+        }
+      };
+      source.addEventListener('status', forward);
+      source.addEventListener('progress', forward);
+      source.onerror = () => {
+        // The server closes the stream once ingestion has finished; a stream
+        // refused before any event was sent is reported so the caller can poll
+        if (source.readyState === EventSource.CLOSED) {
+          if (received) {
+            subscriber.complete();
+          } else {
+            subscriber.error(new Error('Ingestion events are not available'));
+          }
+        }
+      };
+      return () => source.close();
+    });
+  }
+
   getDocumentEmbeddings(documentId: number): Observable<DocumentEmbedding[]> {
     return this.http.get<DocumentEmbedding[]>(`${this.apiUrl}/${documentId}/embeddings/`);
   }